@@ -0,0 +1,175 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+from config import (
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL_SECONDS,
+    ANSWER_CACHE_SIMILARITY, get_logger
+)
+from case_classifier import normalize_text
+from embedding_manager import create_embeddings
+from metrics import inc, set_gauge
+
+logger = get_logger(__name__)
+
+# Respostas de erro das chamadas sem streaming do llm_interface (ollama_llm) não devem
+# ser reaproveitadas; nos streamings a falha levanta LLMStreamError e nada é guardado
+ERROR_PREFIXES = ("Ocorreu um erro",)
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def normalize_question(question):
+    return _SPACES.sub(" ", _PUNCTUATION.sub(" ", normalize_text(question))).strip()
+
+class AnswerCache:
+    """Cache de respostas por coleção e modelo, por texto normalizado ou similaridade
+    dos embeddings. As entradas caem quando o número de chunks da coleção muda."""
+
+    def __init__(self, max_entries=ANSWER_CACHE_SIZE, ttl=ANSWER_CACHE_TTL_SECONDS, similarity=ANSWER_CACHE_SIMILARITY):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        # (coleção, modelo, pergunta normalizada ou chave do FAQ) -> {"answer", "embedding", "created"}
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "invalidations": 0}
+
+    def _count(self, event):
+        # Chamado com self._lock adquirido
+        self._stats[event] += 1
+        inc("exautos_answer_cache_events_total", help_text="Consultas ao cache de respostas (acertos exatos, semânticos e faltas) e invalidações",
+            event=event)
+
+    def _check_version(self, collection_name, version):
+        # version vem de collection.count(), lido antes de adquirir o lock
+        if self._versions.get(collection_name, version) != version:
+            self._drop(collection_name)
+            self._count("invalidations")
+        self._versions[collection_name] = version
+
+    def _drop(self, collection_name):
+        for key in [key for key in self._entries if key[0] == collection_name]:
+            del self._entries[key]
+        self._versions.pop(collection_name, None)
+
+    def _expired(self, entry):
+        return self.ttl and time.time() - entry["created"] > self.ttl
+
+    def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and self._expired(entry):
+            del self._entries[key]
+            entry = None
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self._count("exact_hits")
+        return entry
+
+    def get(self, collection, model, question):
+        normalized = normalize_question(question)
+        version = collection.count()
+        with self._lock:
+            self._check_version(collection.name, version)
+            entry = self._lookup((collection.name, model, normalized))
+            if entry is not None:
+                return entry["answer"]
+            # Entradas sem embedding (FAQ) só são atendidas por chave exata
+            candidates = [
+                (key, entry) for key, entry in self._entries.items()
+                if key[:2] == (collection.name, model) and entry["embedding"] is not None and not self._expired(entry)
+            ]
+
+        if candidates and self.similarity < 1:
+            # O embedding da pergunta fica no cache do serviço de embeddings e é reaproveitado na recuperação
+            query = np.asarray(create_embeddings()(question), dtype=np.float32)
+            matrix = np.asarray([entry["embedding"] for _, entry in candidates], dtype=np.float32)
+            similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.similarity:
+                key, entry = candidates[best]
+                with self._lock:
+                    if key in self._entries:
+                        self._entries.move_to_end(key)
+                    self._count("semantic_hits")
+                logger.info(f"Resposta reaproveitada do cache (similaridade {similarities[best]:.3f})")
+                return entry["answer"]
+
+        with self._lock:
+            self._count("misses")
+        return None
+
+    def get_exact(self, collection, model, key):
+        """Consulta só pela chave exata, sem busca semântica."""
+        version = collection.count()
+        with self._lock:
+            self._check_version(collection.name, version)
+            entry = self._lookup((collection.name, model, key))
+            if entry is None:
+                self._count("misses")
+                return None
+            return entry["answer"]
+
+    def put(self, collection, model, question, answer):
+        if not answer or answer.startswith(ERROR_PREFIXES):
+            return
+        embedding = create_embeddings()(question) if self.similarity < 1 else None
+        self._store(collection, (collection.name, model, normalize_question(question)), answer, embedding)
+
+    def put_exact(self, collection, model, key, answer):
+        if answer and not answer.startswith(ERROR_PREFIXES):
+            self._store(collection, (collection.name, model, key), answer, None)
+
+    def _store(self, collection, key, answer, embedding):
+        version = collection.count()
+        with self._lock:
+            self._check_version(collection.name, version)
+            self._entries[key] = {"answer": answer, "embedding": embedding, "created": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            set_gauge("exautos_answer_cache_entries", len(self._entries), help_text="Respostas guardadas no cache")
+
+    def invalidate(self, collection_name):
+        with self._lock:
+            self._drop(collection_name)
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats, entries=len(self._entries))
+        lookups = stats["exact_hits"] + stats["semantic_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["exact_hits"] + stats["semantic_hits"]) / lookups if lookups else 0.0
+        return stats
+
+_answer_cache = AnswerCache()
+
+def get_cached_answer(collection, model, question):
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    return _answer_cache.get(collection, model, question)
+
+def put_cached_answer(collection, model, question, answer):
+    if ANSWER_CACHE_ENABLED:
+        _answer_cache.put(collection, model, question, answer)
+
+# Respostas do FAQ dependem do item (e das respostas das quais ele depende); a
+# chave é o item e a pergunta, sem busca semântica
+def _faq_key(item_id, question):
+    return ("faq", item_id, normalize_question(question))
+
+def get_cached_faq_answer(collection, model, item_id, question):
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    return _answer_cache.get_exact(collection, model, _faq_key(item_id, question))
+
+def put_cached_faq_answer(collection, model, item_id, question, answer):
+    if ANSWER_CACHE_ENABLED:
+        _answer_cache.put_exact(collection, model, _faq_key(item_id, question), answer)
+
+def invalidate_answers(collection_name):
+    _answer_cache.invalidate(collection_name)
+
+def get_answer_cache_stats():
+    return _answer_cache.get_stats()
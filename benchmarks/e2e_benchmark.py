@@ -0,0 +1,206 @@
+"""Benchmark de ponta a ponta: ingestão, perguntas e FAQ contra um Ollama falso.
+
+Uso: python benchmarks/e2e_benchmark.py [--pages 10 100 500] [--kinds text scanned]
+        [--method hybrid] [--runs 3] [--questions 5] [--chat-latency 0.2]
+        [--tokens-per-second 30] [--embed-latency 0.01] [--output resultado.json]
+
+Sobe benchmarks/fake_ollama.py em um processo separado, gera PDFs sintéticos
+(benchmarks/generate_pdfs.py) e executa load_context, answer_question e
+process_faq em um diretório de trabalho temporário. Os caches de documentos e
+de respostas e o FAQ em segundo plano ficam desligados para que cada execução
+meça o trabalho completo. O resultado (p50/p95 por etapa, vazão e pico de
+memória) é impresso em JSON para comparar execuções.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import tracemalloc
+import numpy as np
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+
+from generate_pdfs import generate
+
+QUESTIONS = [
+    "Qual foi a decisão do tribunal?",
+    "Quem é o paciente do habeas corpus?",
+    "Quais os fundamentos da prisão preventiva?",
+    "O ministério público deu parecer?",
+    "Qual o número do processo?",
+    "Houve pedido de liminar?",
+    "Qual a câmara responsável pelo julgamento?",
+    "Quais precedentes foram citados?",
+]
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def _start_fake_ollama(args):
+    port = _free_port()
+    process = subprocess.Popen([
+        sys.executable, os.path.join(BENCHMARK_DIR, "fake_ollama.py"), "--port", str(port),
+        "--chat-latency", str(args.chat_latency), "--tokens-per-second", str(args.tokens_per_second),
+        "--answer-tokens", str(args.answer_tokens), "--embed-latency", str(args.embed_latency), "--dim", str(args.dim),
+    ], stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            return process, f"http://127.0.0.1:{port}"
+        except OSError:
+            time.sleep(0.05)
+    process.kill()
+    raise RuntimeError("O Ollama falso não subiu")
+
+def _peak_rss_mb():
+    # ru_maxrss é em KB no Linux e em bytes no macOS; os processos de OCR contam em RUSAGE_CHILDREN
+    scale = 1024 * 1024 if platform.system() == "Darwin" else 1024
+    return {
+        "processo": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+        "filhos": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1),
+    }
+
+class StageRecorder:
+    def __init__(self):
+        self.stages = {}
+
+    def measure(self, stage, function, *args, units=1):
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        record = self.stages.setdefault(stage, {"seconds": [], "units": 0, "python_peak_mb": 0.0})
+        record["seconds"].append(elapsed)
+        record["units"] += units
+        record["python_peak_mb"] = max(record["python_peak_mb"], (tracemalloc.get_traced_memory()[1] - baseline) / 2 ** 20)
+        return result
+
+    def summary(self, unit_names):
+        summary = {}
+        for stage, record in self.stages.items():
+            seconds = np.array(record["seconds"])
+            total = float(seconds.sum())
+            summary[stage] = {
+                "execucoes": len(seconds),
+                "p50_s": round(float(np.percentile(seconds, 50)), 4),
+                "p95_s": round(float(np.percentile(seconds, 95)), 4),
+                "media_s": round(float(seconds.mean()), 4),
+                f"{unit_names.get(stage, 'execucoes')}_por_s": round(record["units"] / total, 3) if total else 0.0,
+                # Pico das alocações Python feitas durante a etapa, acima do que já estava alocado
+                "pico_alocado_python_mb": round(record["python_peak_mb"], 1),
+            }
+        return summary
+
+def run_document(args, kind, pages, pdf_path):
+    from prompt_manager import load_context, answer_question, process_faq
+    from llm_interface import ollama_llm, model_for, get_routing_stats
+    from embedding_manager import get_embedding_stats
+    from case_classifier import get_fast_path_stats
+    from answer_cache import get_answer_cache_stats
+
+    def ingest():
+        collection = None
+        for result in load_context(pdf_path, extraction_method=args.method):
+            collection = result["collection"] or collection
+            status = result["status"]
+        if collection is None:
+            raise RuntimeError(status)
+        return collection
+
+    recorder = StageRecorder()
+    error = None
+    try:
+        for _ in range(args.runs):
+            collection = recorder.measure("ingestao", ingest, units=pages)
+            for question in QUESTIONS[:args.questions]:
+                recorder.measure("pergunta", answer_question, question, collection, model_for("resposta"), ollama_llm)
+            recorder.measure("faq", process_faq, collection, model_for("faq"), ollama_llm)
+    except Exception as e:
+        error = str(e)
+
+    result = {
+        "tipo": kind,
+        "paginas": pages,
+        "metodo": args.method,
+        "etapas": recorder.summary({"ingestao": "paginas", "pergunta": "perguntas"}),
+        "pico_rss_mb": _peak_rss_mb(),
+        "roteamento_modelos": get_routing_stats(),
+        "embeddings": get_embedding_stats(),
+        "caminho_rapido": get_fast_path_stats(),
+        "cache_respostas": get_answer_cache_stats(),
+    }
+    if error:
+        result["erro"] = error
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--kinds", nargs="+", choices=["text", "scanned"], default=["text", "scanned"])
+    parser.add_argument("--method", default="hybrid")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--questions", type=int, default=5)
+    parser.add_argument("--chat-latency", type=float, default=0.2)
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency", type=float, default=0.01)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--pdf-dir", default=os.path.join(tempfile.gettempdir(), "exautos_benchmark_pdfs"))
+    parser.add_argument("--output", help="Grava o JSON também neste arquivo")
+    args = parser.parse_args()
+    output_path = os.path.abspath(args.output) if args.output else None
+
+    pdfs = generate(os.path.abspath(args.pdf_dir), args.pages, args.kinds)
+    fake_ollama, host = _start_fake_ollama(args)
+    work_dir = tempfile.mkdtemp(prefix="exautos_benchmark_")
+    # Precisa ser definido antes de importar os módulos do projeto (config lê no import)
+    os.environ.update({
+        "OLLAMA_HOST": host,
+        "DOCUMENT_CACHE_ENABLED": "0",
+        "ANSWER_CACHE_ENABLED": "0",
+        "FAQ_PRECOMPUTE": "0",
+    })
+    os.chdir(work_dir)
+    tracemalloc.start()
+
+    import logging
+    import config  # noqa: F401 (configura o logging do projeto)
+    # O JSON vai para a saída padrão; os logs do projeto vão para stderr
+    for handler in logging.getLogger().handlers:
+        handler.setStream(sys.stderr)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    try:
+        results = []
+        for kind, pages, pdf_path in pdfs:
+            result = run_document(args, kind, pages, pdf_path)
+            results.append(result)
+            print(json.dumps(result, ensure_ascii=False), file=sys.stderr)
+    finally:
+        fake_ollama.terminate()
+
+    report = {
+        "configuracao": {key: value for key, value in vars(args).items() if key not in ("output", "pdf_dir")},
+        "ambiente": {"python": platform.python_version(), "cpus": os.cpu_count()},
+        "resultados": results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    print(output)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as file:
+            file.write(output)
+
+if __name__ == "__main__":
+    main()
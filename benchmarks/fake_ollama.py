@@ -0,0 +1,121 @@
+"""Servidor HTTP que imita a API do Ollama para os benchmarks.
+
+Uso: python benchmarks/fake_ollama.py [--port 11500] [--chat-latency 0.2]
+        [--tokens-per-second 30] [--answer-tokens 60] [--embed-latency 0.01] [--dim 768]
+
+Atende /api/chat (com e sem streaming, inclusive com `format`), /api/embeddings
+e /api/embed. Os embeddings são determinísticos (derivados do hash do texto)
+e as respostas são geradas no ritmo configurado, para que a latência medida
+reflita o custo do próprio aplicativo mais um modelo de velocidade conhecida.
+"""
+import json
+import time
+import hashlib
+import argparse
+import numpy as np
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+WORDS = (
+    "O recurso foi conhecido e no mérito negado provimento nos termos do voto do relator "
+    "mantida a decisão recorrida por seus próprios fundamentos"
+).split()
+
+def _embedding(text, dim):
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(dim)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+def _structured_answer(schema):
+    # Preenche o schema com o primeiro valor válido de cada campo
+    answer = {}
+    for name, spec in schema.get("properties", {}).items():
+        if "enum" in spec:
+            answer[name] = spec["enum"][0]
+        elif spec.get("type") == "boolean":
+            answer[name] = True
+        elif spec.get("type") in ("number", "integer"):
+            answer[name] = 0
+        else:
+            answer[name] = "Documento jurídico de teste."
+    return json.dumps(answer, ensure_ascii=False)
+
+def make_handler(options):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send_json(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, payload):
+            line = json.dumps(payload).encode() + b"\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def do_POST(self):
+            request = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            if self.path == "/api/embeddings":
+                time.sleep(options.embed_latency)
+                return self._send_json({"embedding": _embedding(request["prompt"], options.dim)})
+            if self.path == "/api/embed":
+                inputs = request["input"] if isinstance(request["input"], list) else [request["input"]]
+                time.sleep(options.embed_latency * len(inputs))
+                return self._send_json({"model": request["model"], "embeddings": [_embedding(text, options.dim) for text in inputs]})
+            if self.path == "/api/chat":
+                return self._chat(request)
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _chat(self, request):
+            prompt_chars = sum(len(message.get("content", "")) for message in request["messages"])
+            prompt_tokens = max(1, prompt_chars // 4)
+            if request.get("format"):
+                tokens = [_structured_answer(request["format"])]
+            else:
+                tokens = ["SIM,"] + [WORDS[i % len(WORDS)] for i in range(options.answer_tokens - 1)]
+            token_delay = 1.0 / options.tokens_per_second
+            final = {"model": request["model"], "done": True, "prompt_eval_count": prompt_tokens, "eval_count": len(tokens)}
+
+            time.sleep(options.chat_latency)
+            if not request.get("stream", True):
+                time.sleep(token_delay * len(tokens))
+                return self._send_json(dict(final, message={"role": "assistant", "content": " ".join(tokens)}))
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for i, token in enumerate(tokens):
+                time.sleep(token_delay)
+                self._write_chunk({"model": request["model"], "message": {"role": "assistant", "content": token if i == 0 else " " + token}, "done": False})
+            self._write_chunk(dict(final, message={"role": "assistant", "content": ""}))
+            self.wfile.write(b"0\r\n\r\n")
+
+    return Handler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11500)
+    parser.add_argument("--chat-latency", type=float, default=0.2, help="Segundos até o primeiro token")
+    parser.add_argument("--tokens-per-second", type=float, default=30.0)
+    parser.add_argument("--answer-tokens", type=int, default=60)
+    parser.add_argument("--embed-latency", type=float, default=0.01, help="Segundos por texto embutido")
+    parser.add_argument("--dim", type=int, default=768)
+    options = parser.parse_args()
+
+    server = ThreadingHTTPServer((options.host, options.port), make_handler(options))
+    server.daemon_threads = True
+    print(f"Ollama falso em http://{options.host}:{options.port}", flush=True)
+    server.serve_forever()
+
+if __name__ == "__main__":
+    main()
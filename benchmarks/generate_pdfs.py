@@ -0,0 +1,122 @@
+"""Gera PDFs sintéticos no estilo de peças jurídicas para os benchmarks.
+
+Uso: python benchmarks/generate_pdfs.py <diretório> [--pages 10 100 500] [--kinds text scanned]
+
+'text' gera PDFs com camada de texto (escritos diretamente, sem dependências);
+'scanned' gera páginas apenas com imagem, renderizadas com o Pillow, que
+precisam passar por OCR.
+"""
+import os
+import random
+import argparse
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842  # A4 em pontos
+LINES_PER_PAGE = 48
+CHARS_PER_LINE = 90
+
+HEADER = [
+    "PODER JUDICIÁRIO",
+    "TRIBUNAL DE JUSTIÇA DO ESTADO",
+    "HABEAS CORPUS Nº {numero}",
+    "ACÓRDÃO",
+]
+VOCABULARY = (
+    "paciente impetrante autoridade coatora constrangimento ilegal prisão preventiva "
+    "decisão fundamentação garantia ordem pública relator voto turma câmara criminal "
+    "recurso provimento denegado mérito liminar acórdão tribunal processo autos "
+    "defesa ministério público parecer jurisprudência precedente artigo código "
+    "penal processual inquérito denúncia réu medida cautelar liberdade provisória"
+).split()
+CONCLUSION = "Ante o exposto, voto no sentido de DENEGAR a ordem de habeas corpus. Ordem negada por unanimidade."
+
+def legal_lines(page_number, pages, rng):
+    lines = []
+    if page_number == 1:
+        lines += [line.format(numero=f"{rng.randint(1000000, 9999999)}-{rng.randint(10, 99)}.2024.8.26.0000") for line in HEADER]
+        lines.append("")
+    body_lines = LINES_PER_PAGE - (4 if page_number == pages else 2)
+    while len(lines) < body_lines:
+        words = []
+        while sum(len(word) + 1 for word in words) < CHARS_PER_LINE - 12:
+            words.append(rng.choice(VOCABULARY))
+        lines.append(" ".join(words).capitalize() + ".")
+    if page_number == pages:
+        lines += ["", CONCLUSION]
+    lines.append(f"Página {page_number}")
+    return lines
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+def write_text_pdf(path, pages, seed=0):
+    """Escreve um PDF mínimo (Helvetica, WinAnsi) página a página, sem manter o documento na memória."""
+    rng = random.Random(seed)
+    offsets = []
+    with open(path, "wb") as file:
+        def write_object(number, body):
+            offsets.append((number, file.tell()))
+            file.write(f"{number} 0 obj\n".encode() + body + b"\nendobj\n")
+
+        file.write(b"%PDF-1.4\n")
+        # 1: catálogo, 2: árvore de páginas, 3: fonte; cada página usa os objetos 4+2i e 5+2i
+        kids = " ".join(f"{4 + 2 * i} 0 R" for i in range(pages))
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(2, f"<< /Type /Pages /Kids [{kids}] /Count {pages} >>".encode())
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        for i in range(pages):
+            text = "\n".join(f"({_escape(line)}) '" for line in legal_lines(i + 1, pages, rng))
+            content = f"BT /F1 9 Tf 14 TL 40 {PAGE_HEIGHT - 40} Td\n{text}\nET".encode("cp1252")
+            write_object(4 + 2 * i, (
+                f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] "
+                f"/Resources << /Font << /F1 3 0 R >> >> /Contents {5 + 2 * i} 0 R >>"
+            ).encode())
+            write_object(5 + 2 * i, f"<< /Length {len(content)} >>\nstream\n".encode() + content + b"\nendstream")
+
+        xref_offset = file.tell()
+        offsets.sort()
+        file.write(f"xref\n0 {len(offsets) + 1}\n0000000000 65535 f \n".encode())
+        for _, offset in offsets:
+            file.write(f"{offset:010d} 00000 n \n".encode())
+        file.write(f"trailer\n<< /Size {len(offsets) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode())
+
+def write_scanned_pdf(path, pages, seed=0, dpi=100):
+    """Escreve um PDF só com imagens (como um documento escaneado), uma página por vez."""
+    from PIL import Image, ImageDraw, ImageFont
+
+    rng = random.Random(seed)
+    width, height = int(PAGE_WIDTH * dpi / 72), int(PAGE_HEIGHT * dpi / 72)
+    font = ImageFont.load_default(size=max(10, dpi // 7))
+    line_height = (height - 2 * dpi // 2) // LINES_PER_PAGE
+    if os.path.exists(path):
+        os.remove(path)
+    for i in range(pages):
+        image = Image.new("L", (width, height), 255)
+        draw = ImageDraw.Draw(image)
+        for j, line in enumerate(legal_lines(i + 1, pages, rng)):
+            draw.text((dpi // 2, dpi // 2 + j * line_height), line, fill=0, font=font)
+        image.save(path, "PDF", resolution=dpi, append=i > 0)
+
+WRITERS = {"text": write_text_pdf, "scanned": write_scanned_pdf}
+
+def generate(directory, pages_list, kinds):
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for kind in kinds:
+        for pages in pages_list:
+            path = os.path.join(directory, f"{kind}_{pages}.pdf")
+            if not os.path.exists(path):
+                WRITERS[kind](path, pages, seed=pages)
+            paths.append((kind, pages, path))
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("directory")
+    parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 500])
+    parser.add_argument("--kinds", nargs="+", choices=list(WRITERS), default=list(WRITERS))
+    args = parser.parse_args()
+    for kind, pages, path in generate(args.directory, args.pages, args.kinds):
+        print(f"{kind}\t{pages}\t{path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Compara o backend NumPy com o Chroma para coleções de 100 a 10.000 chunks.
+
+Uso: python benchmarks/vector_store_benchmark.py [--dim 768] [--queries 200]
+
+Os embeddings são aleatórios (não há chamadas ao Ollama); o objetivo é medir
+apenas o custo de inserção e de consulta top-k de cada backend.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import tempfile
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import chromadb
+from chromadb.config import Settings
+import numpy_store
+from numpy_store import NumpyCollection
+from config import CHROMA_SETTINGS
+
+SIZES = [100, 500, 1000, 5000, 10000]
+
+def _percentile(values, percentile):
+    return float(np.percentile(values, percentile) * 1000)
+
+def _measure(collection, embeddings, queries, n_results):
+    ids = [str(uuid.uuid4()) for _ in range(len(embeddings))]
+    documents = [f"chunk {i}" for i in range(len(embeddings))]
+    metadatas = [{"tipo_processo": "Habeas Corpus", "situacao": "Negado"} for _ in range(len(embeddings))]
+
+    start = time.perf_counter()
+    # O Chroma limita o tamanho de cada inserção; lotes de 1000 servem para os dois backends
+    for i in range(0, len(ids), 1000):
+        collection.add(ids=ids[i:i + 1000], documents=documents[i:i + 1000],
+                       metadatas=metadatas[i:i + 1000], embeddings=embeddings[i:i + 1000].tolist())
+    if isinstance(collection, NumpyCollection):
+        # Grava em disco uma vez, como ao fim da ingestão de um documento
+        collection.flush()
+    add_seconds = time.perf_counter() - start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        collection.query(query_embeddings=[query.tolist()], n_results=n_results)
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        "add_seconds": round(add_seconds, 4),
+        "query_p50_ms": round(_percentile(latencies, 50), 3),
+        "query_p95_ms": round(_percentile(latencies, 95), 3),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-results", type=int, default=10)
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    results = []
+    with tempfile.TemporaryDirectory() as temp_dir:
+        chroma_client = chromadb.PersistentClient(path=os.path.join(temp_dir, "chroma"), settings=Settings(**CHROMA_SETTINGS))
+        numpy_store.NUMPY_STORE_DIR = os.path.join(temp_dir, "numpy")
+
+        for size in args.sizes:
+            embeddings = rng.standard_normal((size, args.dim), dtype=np.float32)
+            queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+
+            chroma_collection = chroma_client.create_collection(name=f"bench_{size}", embedding_function=None)
+            row = {"chunks": size, "chroma": _measure(chroma_collection, embeddings, queries, args.n_results)}
+
+            for dtype in ("float32", "float16"):
+                for persist in (False, True):
+                    collection = NumpyCollection(f"bench_{size}_{dtype}_{int(persist)}", None, dtype=dtype, persist=persist)
+                    row[f"numpy_{dtype}{'_mmap' if persist else ''}"] = _measure(collection, embeddings, queries, args.n_results)
+
+            results.append(row)
+            print(json.dumps(row), file=sys.stderr)
+
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
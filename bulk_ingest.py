@@ -0,0 +1,240 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from config import OCR_WORKERS, METRICS_PORT, DEFAULT_EXTRACTION_METHOD, get_logger
+from ocr_engine import EXTRACTION_METHODS, extract_pages
+from document_processor import load_and_split_document
+from prompt_manager import find_cached_document, index_document
+from metrics import span, trace, start_metrics_server
+
+logger = get_logger(__name__)
+
+FINAL_STATUSES = {"done", "rejected"}
+STAGES = ["ocr", "classificacao", "embeddings"]
+
+def list_pdfs(source):
+    if os.path.isdir(source):
+        pdfs = []
+        for root, _, files in os.walk(source):
+            pdfs.extend(os.path.join(root, name) for name in files if name.lower().endswith(".pdf"))
+        return sorted(pdfs)
+    with open(source, 'r', encoding='utf-8') as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+class Manifest:
+    """Manifesto em JSONL (uma linha por mudança de estado; vale o último registro
+    de cada arquivo). Os textos extraídos ficam ao lado, até o documento terminar."""
+
+    def __init__(self, path):
+        self.path = path
+        self.texts_dir = f"{path}.textos"
+        self.entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # linha truncada por uma interrupção
+                    self.entries[record["path"]] = record
+
+    def status(self, pdf_path):
+        return self.entries.get(pdf_path, {}).get("status")
+
+    def update(self, pdf_path, **fields):
+        with self._lock:
+            record = dict(self.entries.get(pdf_path, {"path": pdf_path}))
+            record.update(fields, updated_at=time.time())
+            self.entries[pdf_path] = record
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def save_text(self, pdf_path, text):
+        os.makedirs(self.texts_dir, exist_ok=True)
+        text_path = os.path.join(self.texts_dir, hashlib.sha1(pdf_path.encode("utf-8")).hexdigest() + ".txt")
+        with open(text_path + ".tmp", 'w', encoding='utf-8') as file:
+            file.write(text)
+        os.replace(text_path + ".tmp", text_path)
+        return text_path
+
+    def load_text(self, pdf_path, method):
+        """Texto extraído em uma execução anterior com o mesmo método, ou None."""
+        entry = self.entries.get(pdf_path, {})
+        if entry.get("method") != method or not entry.get("text_path"):
+            return None
+        try:
+            with open(entry["text_path"], 'r', encoding='utf-8') as file:
+                return file.read()
+        except OSError:
+            return None
+
+    def classification(self, pdf_path, method):
+        entry = self.entries.get(pdf_path, {})
+        if entry.get("method") == method and entry.get("tipo_processo") and entry.get("situacao"):
+            return entry["tipo_processo"], entry["situacao"]
+        return None
+
+    def discard_text(self, pdf_path):
+        text_path = self.entries.get(pdf_path, {}).get("text_path")
+        if text_path:
+            try:
+                os.remove(text_path)
+            except OSError:
+                pass
+
+class BulkIngest:
+    def __init__(self, pdfs, manifest, method=DEFAULT_EXTRACTION_METHOD, ocr_workers=2, llm_workers=2, embed_workers=2):
+        self.pdfs = pdfs
+        self.manifest = manifest
+        self.method = method
+        # Cada documento em OCR usa sua parcela dos processos de OCR disponíveis
+        self.pages_workers = max(1, OCR_WORKERS // ocr_workers)
+        self.executors = {
+            "ocr": ThreadPoolExecutor(max_workers=ocr_workers, thread_name_prefix="bulk-ocr"),
+            "classificacao": ThreadPoolExecutor(max_workers=llm_workers, thread_name_prefix="bulk-llm"),
+            "embeddings": ThreadPoolExecutor(max_workers=embed_workers, thread_name_prefix="bulk-embed"),
+        }
+        # Limita os documentos em andamento para que textos extraídos não se acumulem na memória
+        self.in_flight = threading.BoundedSemaphore(2 * (ocr_workers + llm_workers + embed_workers))
+        self.stage_seconds = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.pages = 0
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._all_done = threading.Event()
+
+    def _record_stage(self, stage, seconds):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+
+    def _finish(self, pdf_path, status, fields):
+        try:
+            if status in FINAL_STATUSES:
+                self.manifest.discard_text(pdf_path)
+                fields = dict(fields, text_path=None)
+            self.manifest.update(pdf_path, status=status, **fields)
+        finally:
+            with self._lock:
+                self.counts[status] += 1
+                self._pending -= 1
+                if self._pending == 0:
+                    self._all_done.set()
+            self.in_flight.release()
+
+    def _run_stage(self, stage, pdf_path, function, *args):
+        """Cada etapa devolve (status, campos) quando o documento termina nela, ou
+        None depois de passá-lo para a próxima etapa (o que é sempre o último passo)."""
+        start = time.perf_counter()
+        outcome = None
+        try:
+            with trace("ingestao_lote", os.path.basename(pdf_path)):
+                outcome = function(pdf_path, *args)
+        except Exception as e:
+            logger.error(f"[{stage}] Falha em {pdf_path}: {e}", exc_info=True)
+            outcome = ("failed", {"stage": stage, "error": str(e)})
+        finally:
+            self._record_stage(stage, time.perf_counter() - start)
+            if outcome is not None:
+                self._finish(pdf_path, *outcome)
+
+    def _ocr(self, pdf_path):
+        cache_key, collection, text, classification = find_cached_document(pdf_path, self.method)
+        if collection is not None:
+            return "done", {"collection": collection.name, "cached": True}
+
+        fields = {}
+        if text is None:
+            text = self.manifest.load_text(pdf_path, self.method)
+        if text is None:
+            with span("ocr", method=self.method):
+                pages = extract_pages(pdf_path, method=self.method, workers=self.pages_workers)
+            text = "".join(page["text"] for page in pages)
+            with self._lock:
+                self.pages += len(pages)
+            # Uma nova execução após falha nas etapas seguintes não refaz o OCR
+            fields = {"pages": len(pages), "text_path": self.manifest.save_text(pdf_path, text)}
+        classification = classification or self.manifest.classification(pdf_path, self.method)
+        self.manifest.update(pdf_path, status="extracted", method=self.method, **fields)
+        self.executors["classificacao"].submit(self._run_stage, "classificacao", pdf_path, self._classify, text, cache_key, classification)
+
+    def _classify(self, pdf_path, text, cache_key, classification=None):
+        splits, error_message = load_and_split_document(pdf_path, extraction_method=self.method, text=text, classification=classification)
+        if error_message or not splits:
+            return "rejected", {"error": error_message}
+        metadata = splits[0].metadata
+        self.manifest.update(pdf_path, status="classified", tipo_processo=metadata.get("tipo_processo"), situacao=metadata.get("situacao"))
+        self.executors["embeddings"].submit(self._run_stage, "embeddings", pdf_path, self._embed, splits, text, cache_key)
+
+    def _embed(self, pdf_path, splits, text, cache_key):
+        collection = index_document(splits, text, cache_key)
+        return "done", {"collection": collection.name, "chunks": len(splits)}
+
+    def run(self, retry_failed=False):
+        to_process = [
+            pdf for pdf in self.pdfs
+            if self.manifest.status(pdf) not in FINAL_STATUSES
+            and (retry_failed or self.manifest.status(pdf) != "failed")
+        ]
+        skipped = len(self.pdfs) - len(to_process)
+        logger.info(f"{len(to_process)} arquivos para processar ({skipped} já concluídos ou com falha)")
+
+        start = time.perf_counter()
+        self._pending = len(to_process)
+        if not to_process:
+            self._all_done.set()
+        for pdf_path in to_process:
+            self.in_flight.acquire()
+            self.manifest.update(pdf_path, status="queued", error=None)
+            self.executors["ocr"].submit(self._run_stage, "ocr", pdf_path, self._ocr)
+        self._all_done.wait()
+        for executor in self.executors.values():
+            executor.shutdown()
+
+        return self.summary(time.perf_counter() - start, skipped)
+
+    def summary(self, elapsed, skipped):
+        processed = sum(self.counts.values())
+        return {
+            "arquivos_processados": processed,
+            "arquivos_pulados": skipped,
+            "por_status": dict(self.counts),
+            "paginas": self.pages,
+            "tempo_total_s": round(elapsed, 2),
+            "paginas_por_s": round(self.pages / elapsed, 3) if elapsed else 0.0,
+            "documentos_por_min": round(self.counts["done"] * 60 / elapsed, 3) if elapsed else 0.0,
+            "tempo_por_etapa_s": {stage: round(self.stage_seconds[stage], 2) for stage in STAGES},
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ingestão em lote de PDFs jurídicos.")
+    parser.add_argument("source", help="Diretório com PDFs ou arquivo texto com um caminho por linha")
+    parser.add_argument("--method", choices=EXTRACTION_METHODS, default=DEFAULT_EXTRACTION_METHOD)
+    parser.add_argument("--ocr-workers", type=int, default=2)
+    parser.add_argument("--llm-workers", type=int, default=2)
+    parser.add_argument("--embed-workers", type=int, default=2)
+    parser.add_argument("--manifest", default="bulk_manifest.jsonl")
+    parser.add_argument("--retry-failed", action="store_true", help="Processa novamente os arquivos que falharam")
+    args = parser.parse_args(argv)
+    start_metrics_server(METRICS_PORT)
+
+    ingest = BulkIngest(
+        list_pdfs(args.source),
+        Manifest(args.manifest),
+        method=args.method,
+        ocr_workers=args.ocr_workers,
+        llm_workers=args.llm_workers,
+        embed_workers=args.embed_workers,
+    )
+    summary = ingest.run(retry_failed=args.retry_failed)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0 if not ingest.counts["failed"] else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,175 @@
+import re
+import threading
+import unicodedata
+from collections import Counter
+from config import CLASSIFIER_CONFIDENCE_THRESHOLD, get_logger
+from metrics import inc
+
+logger = get_logger(__name__)
+
+# Trechos iniciais e finais pesam mais: o cabeçalho/ementa traz a classe do
+# processo e o dispositivo (ao final) traz o resultado do julgamento
+HEADER_CHARS = 1500
+TAIL_FRACTION = 0.3
+# Número de termos jurídicos distintos para aceitar o documento sem o LLM
+LEGAL_TERMS_FOR_FULL_CONFIDENCE = 6
+
+# Padrões sobre o texto normalizado (minúsculo e sem acentos). Em cada classe
+# os padrões mais específicos vêm primeiro, e as classes mais longas antes das
+# mais curtas, para que "recurso de habeas corpus" não seja contado como "habeas corpus".
+TIPO_PROCESSO_PATTERNS = [
+    ("Recurso de Habeas Corpus", [r"recurso (?:ordinario )?(?:de|em) habeas corpus", r"rhc"]),
+    ("Recurso em Mandado de Segurança", [r"recurso (?:ordinario )?em mandado de seguranca", r"rms"]),
+    ("Ação Direta de Inconstitucionalidade", [r"acao direta de inconstitucionalidade", r"adi"]),
+    ("Ação Declaratória de Constitucionalidade", [r"acao declaratoria de constitucionalidade", r"adc"]),
+    ("Suspensão de Segurança", [r"suspensao de seguranca"]),
+    ("Embargos de Declaração", [r"embargos de declaracao", r"embargos declaratorios", r"edcl"]),
+    ("Agravo Regimental", [r"agravo regimental", r"agravo interno", r"agrg"]),
+    ("Agravo de Instrumento", [r"agravo de instrumento"]),
+    ("Apelação Criminal", [r"apelacao criminal", r"apelacao crime"]),
+    ("Apelação Cível", [r"apelacao civel"]),
+    ("Recurso Especial", [r"recurso especial", r"resp"]),
+    ("Recurso Extraordinário", [r"recurso extraordinario"]),
+    ("Recurso Ordinário", [r"recurso ordinario"]),
+    ("Ação Civil Pública", [r"acao civil publica"]),
+    ("Ação Rescisória", [r"acao rescisoria"]),
+    ("Ação Penal", [r"acao penal"]),
+    ("Inquérito Policial", [r"inquerito policial"]),
+    ("Conflito de Competência", [r"conflito (?:negativo |positivo )?de competencia"]),
+    ("Revisão Criminal", [r"revisao criminal"]),
+    ("Mandado de Injunção", [r"mandado de injuncao"]),
+    ("Mandado de Segurança", [r"mandado de seguranca"]),
+    ("Habeas Corpus", [r"habeas corpus", r"hc"]),
+    ("Medida Cautelar", [r"medida cautelar"]),
+    ("Reclamação", [r"reclamacao"]),
+    ("Liminar", [r"liminar"]),
+]
+
+SITUACAO_PATTERNS = [
+    ("Negado", [
+        r"ordem denegada", r"denego a ordem", r"denegar a ordem", r"denegada a ordem",
+        r"seguranca denegada", r"denego a seguranca", r"recurso nao conhecido", r"nao conheco do (?:recurso|pedido|writ)",
+    ]),
+    ("Julgado e indeferido", [
+        r"pedido indeferido", r"indefiro o pedido", r"indeferido o pedido", r"recurso desprovido",
+        r"nego provimento", r"negar provimento", r"negou-se provimento", r"negado provimento",
+        r"julgo improcedente", r"julgado improcedente", r"improvido",
+    ]),
+    ("Condenado", [
+        r"condeno o reu", r"condeno a re", r"condeno os reus", r"condenad[oa]s? (?:a|as) penas?",
+        r"sentenca condenatoria", r"julgo procedente a denuncia", r"julgo procedente a pretensao punitiva",
+    ]),
+    ("Julgado e deferido", [
+        r"ordem concedida", r"concedo a ordem", r"conceder a ordem", r"concedida a ordem",
+        r"pedido deferido", r"defiro o pedido", r"deferido o pedido", r"recurso provido",
+        r"dou provimento", r"dar provimento", r"deu-se provimento", r"dado provimento",
+        r"julgo procedente", r"julgado procedente", r"seguranca concedida", r"concedo a seguranca",
+    ]),
+    ("Acatado", [r"embargos acolhidos", r"acolho os embargos", r"acolhidos os embargos", r"acatad[oa]"]),
+    ("Em trâmite", [r"aguardando julgamento", r"autos conclusos", r"em tramitacao", r"em tramite"]),
+]
+
+# Critérios do prompt de validação em document_validator
+LEGAL_TERMS = [
+    r"habeas corpus", r"mandado", r"sentenca", r"reu", r"juiz[a]?", r"recurso", r"denuncia",
+    r"acordao", r"tribunal", r"vara", r"desembargador[a]?", r"ministro relator", r"relator[a]?",
+    r"ministerio publico", r"art\. ?\d+", r"artigo \d+", r"lei n", r"codigo (?:penal|civil|de processo)",
+    r"crime", r"delito", r"processo n", r"autos", r"jurisprudencia", r"paciente", r"impetrante",
+]
+
+def _compile_alternation(class_patterns):
+    # Um único padrão com um grupo nomeado por classe; as alternativas são
+    # testadas em ordem, então os padrões mais específicos vencem em cada posição
+    groups = []
+    labels = {}
+    for index, (label, patterns) in enumerate(class_patterns):
+        group = f"c{index}"
+        labels[group] = label
+        groups.append(f"(?P<{group}>{'|'.join(patterns)})")
+    return re.compile(r"\b(?:" + "|".join(groups) + r")\b"), labels
+
+_TIPO_REGEX, _TIPO_LABELS = _compile_alternation(TIPO_PROCESSO_PATTERNS)
+_SITUACAO_REGEX, _SITUACAO_LABELS = _compile_alternation(SITUACAO_PATTERNS)
+_LEGAL_REGEX, _ = _compile_alternation([(term, [term]) for term in LEGAL_TERMS])
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+def normalize_text(text):
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+def _score_matches(regex, labels, normalized, min_score):
+    scores = Counter()
+    tail_start = len(normalized) * (1 - TAIL_FRACTION)
+    for match in regex.finditer(normalized):
+        weight = 3.0 if match.start() < HEADER_CHARS else 2.0 if match.start() >= tail_start else 1.0
+        scores[labels[match.lastgroup]] += weight
+
+    if not scores:
+        return None, 0.0
+    ranked = scores.most_common(2)
+    best_label, best = ranked[0]
+    second = ranked[1][1] if len(ranked) > 1 else 0.0
+    # Confiança: quanto a melhor classe domina as demais, limitada pela quantidade de evidência
+    confidence = (best / (best + second)) * min(1.0, best / min_score)
+    return best_label, confidence
+
+def classify_case_type_rules(text, normalized=None):
+    normalized = normalized if normalized is not None else normalize_text(text)
+    return _score_matches(_TIPO_REGEX, _TIPO_LABELS, normalized, min_score=3.0)
+
+def classify_case_status_rules(text, normalized=None):
+    normalized = normalized if normalized is not None else normalize_text(text)
+    return _score_matches(_SITUACAO_REGEX, _SITUACAO_LABELS, normalized, min_score=2.0)
+
+def validate_document_rules(text, normalized=None):
+    normalized = normalized if normalized is not None else normalize_text(text)
+    matched_terms = {}
+    for match in _LEGAL_REGEX.finditer(normalized):
+        matched_terms.setdefault(match.lastgroup, match.group(0))
+    confidence = min(1.0, len(matched_terms) / LEGAL_TERMS_FOR_FULL_CONFIDENCE)
+    return len(matched_terms) > 0, confidence, sorted(matched_terms.values())
+
+def _record(task, hit):
+    with _stats_lock:
+        _stats[f"{task}_total"] += 1
+        if hit:
+            _stats[f"{task}_hits"] += 1
+    inc("exautos_fast_path_total", help_text="Decisões do classificador por regras: resolvidas pelas regras ou deixadas para o LLM",
+        task=task, outcome="regras" if hit else "llm")
+
+def fast_classify(text, threshold=CLASSIFIER_CONFIDENCE_THRESHOLD):
+    """Classificação por regras antes do LLM. Retorna {"is_valid", "tipo_processo",
+    "situacao"}; cada campo é None quando a confiança fica abaixo do limiar."""
+    normalized = normalize_text(text)
+
+    is_legal, legal_confidence, matched_terms = validate_document_rules(text, normalized)
+    tipo_processo, tipo_confidence = classify_case_type_rules(text, normalized)
+    situacao, situacao_confidence = classify_case_status_rules(text, normalized)
+
+    # As regras só aceitam documentos; a rejeição continua a cargo do LLM
+    result = {
+        "is_valid": True if is_legal and legal_confidence >= threshold else None,
+        "tipo_processo": tipo_processo if tipo_confidence >= threshold else None,
+        "situacao": situacao if situacao_confidence >= threshold else None,
+        "matched_terms": matched_terms,
+    }
+    _record("validacao", result["is_valid"] is not None)
+    _record("tipo_processo", result["tipo_processo"] is not None)
+    _record("situacao", result["situacao"] is not None)
+
+    logger.info(
+        f"Classificação por regras: validação={legal_confidence:.2f}, "
+        f"tipo={tipo_processo} ({tipo_confidence:.2f}), situação={situacao} ({situacao_confidence:.2f})"
+    )
+    return result
+
+def get_fast_path_stats():
+    """Contadores e taxa de acerto do caminho rápido por tarefa."""
+    with _stats_lock:
+        stats = dict(_stats)
+    for task in ("validacao", "tipo_processo", "situacao"):
+        total = stats.get(f"{task}_total", 0)
+        stats[f"{task}_hit_rate"] = stats.get(f"{task}_hits", 0) / total if total else 0.0
+    return stats
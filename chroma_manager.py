@@ -1,13 +1,83 @@
-import chromadb
-from config import VECTOR_STORE_DIR, get_logger, CHROMA_SETTINGS
+import threading
+from config import VECTOR_STORE_DIR, VECTOR_BACKEND, get_logger, CHROMA_SETTINGS
+from numpy_store import NumpyCollection
 
 logger = get_logger(__name__)
 
-chroma_client = chromadb.PersistentClient(path=VECTOR_STORE_DIR, settings=CHROMA_SETTINGS)
+_chroma_client = None
+_chroma_lock = threading.Lock()
+
+def get_chroma_client():
+    """Cliente Chroma criado no primeiro uso; importar o chromadb e abrir o
+    banco fica fora da subida da aplicação."""
+    global _chroma_client
+    with _chroma_lock:
+        if _chroma_client is None:
+            import chromadb
+            from chromadb.config import Settings
+            _chroma_client = chromadb.PersistentClient(path=VECTOR_STORE_DIR, settings=Settings(**CHROMA_SETTINGS))
+            logger.info("Cliente Chroma inicializado")
+        return _chroma_client
+
+# Coleções do backend NumPy já abertas neste processo
+_numpy_collections = {}
+_numpy_lock = threading.Lock()
+
+def _open_numpy_collection(collection_name, embedding_function, create):
+    with _numpy_lock:
+        collection = _numpy_collections.get(collection_name)
+        if collection is None:
+            if NumpyCollection.exists(collection_name):
+                collection = NumpyCollection.load(collection_name, embedding_function)
+            elif create:
+                collection = NumpyCollection(collection_name, embedding_function)
+            else:
+                return None
+            _numpy_collections[collection_name] = collection
+        return collection
 
 def create_collection(collection_name, embedding_function):
+    if VECTOR_BACKEND == 'numpy':
+        logger.info(f"Criando ou obtendo coleção NumPy: {collection_name}")
+        return _open_numpy_collection(collection_name, embedding_function, create=True)
+
     logger.info(f"Criando ou obtendo coleção Chroma: {collection_name}")
-    return chroma_client.get_or_create_collection(
+    return get_chroma_client().get_or_create_collection(
         name=collection_name,
         embedding_function=embedding_function
-    )
\ No newline at end of file
+    )
+
+def get_collection(collection_name, embedding_function):
+    if VECTOR_BACKEND == 'numpy':
+        collection = _open_numpy_collection(collection_name, embedding_function, create=False)
+        if collection is None:
+            logger.info(f"Coleção NumPy não encontrada: {collection_name}")
+        return collection
+
+    try:
+        return get_chroma_client().get_collection(
+            name=collection_name,
+            embedding_function=embedding_function
+        )
+    except Exception:
+        logger.info(f"Coleção Chroma não encontrada: {collection_name}")
+        return None
+
+def list_collections():
+    if VECTOR_BACKEND == 'numpy':
+        return NumpyCollection.list_names()
+    return [collection.name for collection in get_chroma_client().list_collections()]
+
+def delete_collection(collection_name):
+    if VECTOR_BACKEND == 'numpy':
+        with _numpy_lock:
+            _numpy_collections.pop(collection_name, None)
+        NumpyCollection.delete(collection_name)
+        logger.info(f"Coleção NumPy removida: {collection_name}")
+        return
+
+    try:
+        get_chroma_client().delete_collection(name=collection_name)
+        logger.info(f"Coleção Chroma removida: {collection_name}")
+    except Exception as e:
+        logger.warning(f"Não foi possível remover a coleção {collection_name}: {e}")
@@ -1,12 +1,159 @@
 import os
 import logging
 import sys
-from chromadb.config import Settings
 
 # Configurações globais
 OLLAMA_HOST = os.environ.get('OLLAMA_HOST', 'http://localhost:11434')
 VECTOR_STORE_DIR = "vector_stores"
 
+# Cliente Ollama compartilhado
+OLLAMA_CONNECT_TIMEOUT = float(os.environ.get('OLLAMA_CONNECT_TIMEOUT', 5))
+OLLAMA_CHAT_TIMEOUT = float(os.environ.get('OLLAMA_CHAT_TIMEOUT', 180))
+OLLAMA_EMBED_TIMEOUT = float(os.environ.get('OLLAMA_EMBED_TIMEOUT', 30))
+OLLAMA_MAX_RETRIES = int(os.environ.get('OLLAMA_MAX_RETRIES', 2))
+OLLAMA_RETRY_BACKOFF = float(os.environ.get('OLLAMA_RETRY_BACKOFF', 1.0))
+# Tempo que o Ollama mantém o modelo carregado após cada requisição
+OLLAMA_KEEP_ALIVE = os.environ.get('OLLAMA_KEEP_ALIVE', '30m')
+# Limite de requisições simultâneas ao host Ollama
+OLLAMA_MAX_CONCURRENCY = int(os.environ.get('OLLAMA_MAX_CONCURRENCY', 4))
+
+# Backend de vetores: 'chroma' (PersistentClient) ou 'numpy' (matriz em memória, ver numpy_store.py)
+VECTOR_BACKEND = os.environ.get('VECTOR_BACKEND', 'chroma')
+NUMPY_STORE_DIR = os.path.join(VECTOR_STORE_DIR, "numpy")
+# 'float16' reduz a memória pela metade, mas cada consulta converte a matriz para float32
+NUMPY_STORE_DTYPE = os.environ.get('NUMPY_STORE_DTYPE', 'float32')
+NUMPY_STORE_PERSIST = os.environ.get('NUMPY_STORE_PERSIST', '1') == '1'
+
+# Organização das coleções: 'per_document' cria uma coleção por upload; 'shared'
+# grava todos os documentos em SHARED_COLLECTION_SHARDS coleções compartilhadas,
+# separados pelo metadado document_id (ver document_store.py)
+VECTOR_STORE_MODE = os.environ.get('VECTOR_STORE_MODE', 'per_document')
+SHARED_COLLECTION_PREFIX = "casos"
+SHARED_COLLECTION_SHARDS = int(os.environ.get('SHARED_COLLECTION_SHARDS', 1))
+# Documentos indexados sem entrada no cache de documentos e mais antigos que isso
+# são removidos pela coleta de lixo (na subida e em `python document_store.py gc`)
+COLLECTION_MAX_AGE_DAYS = float(os.environ.get('COLLECTION_MAX_AGE_DAYS', 30))
+COLLECTION_GC_ON_START = os.environ.get('COLLECTION_GC_ON_START', '1') == '1'
+
+# Serviço de embeddings
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 1024))
+EMBEDDING_BATCH_SIZE = int(os.environ.get('EMBEDDING_BATCH_SIZE', 16))
+EMBEDDING_WORKERS = int(os.environ.get('EMBEDDING_WORKERS', 4))
+
+# Perguntas do FAQ independentes são executadas em paralelo por este número de threads
+FAQ_MAX_WORKERS = int(os.environ.get('FAQ_MAX_WORKERS', 3))
+# Gera o FAQ em segundo plano assim que a coleção fica pronta
+FAQ_PRECOMPUTE = os.environ.get('FAQ_PRECOMPUTE', '1') == '1'
+# Número de FAQs gerados em segundo plano ao mesmo tempo (um por documento)
+FAQ_PRECOMPUTE_WORKERS = int(os.environ.get('FAQ_PRECOMPUTE_WORKERS', 2))
+FAQ_RESULTS_DIR = os.path.join(VECTOR_STORE_DIR, "faq")
+
+# Fila persistente de processamento de documentos (SQLite). As etapas que falham
+# são repetidas até JOB_STAGE_RETRIES vezes; um job cujo worker parou de dar
+# sinal por JOB_LEASE_SECONDS volta para a fila, até JOB_MAX_ATTEMPTS vezes
+JOB_QUEUE_ENABLED = os.environ.get('JOB_QUEUE_ENABLED', '1') == '1'
+JOBS_DB_PATH = os.path.join(VECTOR_STORE_DIR, "jobs.sqlite3")
+JOBS_UPLOAD_DIR = os.path.join(VECTOR_STORE_DIR, "uploads")
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_STAGE_RETRIES = int(os.environ.get('JOB_STAGE_RETRIES', 2))
+JOB_RETRY_BACKOFF = float(os.environ.get('JOB_RETRY_BACKOFF', 5.0))
+JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', 3))
+JOB_LEASE_SECONDS = float(os.environ.get('JOB_LEASE_SECONDS', 300))
+JOB_POLL_SECONDS = float(os.environ.get('JOB_POLL_SECONDS', 0.5))
+# API HTTP da fila (0 desativa); com JOBS_API_TOKEN definido, exige "Authorization: Bearer <token>"
+JOBS_API_HOST = os.environ.get('JOBS_API_HOST', '127.0.0.1')
+JOBS_API_PORT = int(os.environ.get('JOBS_API_PORT', 7864))
+JOBS_API_TOKEN = os.environ.get('JOBS_API_TOKEN', '')
+JOBS_MAX_UPLOAD_BYTES = int(os.environ.get('JOBS_MAX_UPLOAD_BYTES', 200 * 1024 ** 2))
+
+# Sessões e filas do Gradio: cada usuário tem seu próprio documento e histórico,
+# e ingestão, chat e FAQ têm limites de concorrência independentes. Chat e FAQ
+# são assíncronos e esperam uma vaga do OLLAMA_MAX_CONCURRENCY sem ocupar
+# threads, então podem ter centenas de requisições em andamento
+SESSION_IDLE_SECONDS = int(os.environ.get('SESSION_IDLE_SECONDS', 3600))
+INGEST_CONCURRENCY = int(os.environ.get('INGEST_CONCURRENCY', 2))
+CHAT_CONCURRENCY = int(os.environ.get('CHAT_CONCURRENCY', 256))
+FAQ_CONCURRENCY = int(os.environ.get('FAQ_CONCURRENCY', 64))
+QUEUE_MAX_SIZE = int(os.environ.get('QUEUE_MAX_SIZE', 500))
+
+# Configurações de OCR
+OCR_LANGUAGE = os.environ.get('OCR_LANGUAGE', 'por')
+# Número de processos usados para extrair páginas em paralelo
+OCR_WORKERS = int(os.environ.get('OCR_WORKERS', os.cpu_count() or 1))
+# Páginas submetidas ao pool de OCR ao mesmo tempo (0 = o dobro de OCR_WORKERS)
+OCR_PAGES_IN_FLIGHT = int(os.environ.get('OCR_PAGES_IN_FLIGHT', 0))
+# Renderização do pdf2image: cada página vai para um arquivo temporário
+PDF2IMAGE_DPI = int(os.environ.get('PDF2IMAGE_DPI', 200))
+PDF2IMAGE_GRAYSCALE = os.environ.get('PDF2IMAGE_GRAYSCALE', '1') == '1'
+# Método de extração usado quando nenhum é informado (interface, API de jobs e ingestão
+# em lote). O método entra na chave do cache de documentos, então deve ser o mesmo em todos
+DEFAULT_EXTRACTION_METHOD = os.environ.get('DEFAULT_EXTRACTION_METHOD', 'ocrmypdf')
+# Modo híbrido: páginas com camada de texto aproveitável não passam por OCR
+HYBRID_OCR_METHOD = os.environ.get('HYBRID_OCR_METHOD', 'pdf2image')
+TEXT_LAYER_MIN_CHARS = int(os.environ.get('TEXT_LAYER_MIN_CHARS', 50))
+TEXT_LAYER_MIN_VALID_RATIO = float(os.environ.get('TEXT_LAYER_MIN_VALID_RATIO', 0.85))
+
+# Análise do documento na ingestão: 'structured' faz validação e classificação
+# em uma única chamada com saída JSON; 'separate' usa as três chamadas individuais
+INGEST_ANALYSIS_MODE = os.environ.get('INGEST_ANALYSIS_MODE', 'structured')
+# Classificação por regras: abaixo deste limiar de confiança o LLM é consultado
+CLASSIFIER_CONFIDENCE_THRESHOLD = float(os.environ.get('CLASSIFIER_CONFIDENCE_THRESHOLD', 0.75))
+
+# Ingestão incremental: as páginas são indexadas assim que saem do OCR. A análise
+# usa as primeiras INCREMENTAL_ANALYSIS_PAGES páginas e o chat é liberado quando
+# INCREMENTAL_UNLOCK_PAGES páginas estão indexadas
+INGEST_INCREMENTAL = os.environ.get('INGEST_INCREMENTAL', '0') == '1'
+INCREMENTAL_ANALYSIS_PAGES = int(os.environ.get('INCREMENTAL_ANALYSIS_PAGES', 3))
+INCREMENTAL_UNLOCK_PAGES = int(os.environ.get('INCREMENTAL_UNLOCK_PAGES', 5))
+INCREMENTAL_BATCH_PAGES = int(os.environ.get('INCREMENTAL_BATCH_PAGES', 5))
+
+# Cache de documentos processados (chaveado pelo hash do PDF)
+DOCUMENT_CACHE_ENABLED = os.environ.get('DOCUMENT_CACHE_ENABLED', '1') == '1'
+DOCUMENT_CACHE_DIR = os.path.join(VECTOR_STORE_DIR, "document_cache")
+DOCUMENT_CACHE_MAX_AGE_DAYS = float(os.environ.get('DOCUMENT_CACHE_MAX_AGE_DAYS', 30))
+DOCUMENT_CACHE_MAX_BYTES = int(os.environ.get('DOCUMENT_CACHE_MAX_BYTES', 5 * 1024 ** 3))
+# A varredura completa do cache (expiração e limite de tamanho) roda no máximo a cada
+# DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS, ou antes se o total estimado passar do limite.
+# O último acesso de cada entrada só é regravado depois de DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS
+DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS = float(os.environ.get('DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS', 3600))
+DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS = float(os.environ.get('DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS', 3600))
+
+# Índice léxico (BM25) criado na ingestão e guardado junto da coleção
+LEXICAL_INDEX_DIR = os.path.join(VECTOR_STORE_DIR, "lexical_index")
+# Constante da Reciprocal Rank Fusion entre o ranking vetorial e o léxico
+HYBRID_RRF_K = int(os.environ.get('HYBRID_RRF_K', 60))
+
+# Cache de respostas por coleção e modelo: reaproveita a resposta quando a pergunta
+# normalizada é igual ou quando a similaridade dos embeddings passa do limiar
+ANSWER_CACHE_ENABLED = os.environ.get('ANSWER_CACHE_ENABLED', '1') == '1'
+ANSWER_CACHE_SIZE = int(os.environ.get('ANSWER_CACHE_SIZE', 512))
+ANSWER_CACHE_TTL_SECONDS = float(os.environ.get('ANSWER_CACHE_TTL_SECONDS', 24 * 3600))
+ANSWER_CACHE_SIMILARITY = float(os.environ.get('ANSWER_CACHE_SIMILARITY', 0.95))
+
+# Orçamento de tokens do contexto enviado ao modelo nas respostas RAG. Os tokens
+# são estimados por caracteres/token, calibrado por modelo com o prompt_eval_count do Ollama
+CONTEXT_TOKEN_BUDGET = int(os.environ.get('CONTEXT_TOKEN_BUDGET', 1200))
+CHARS_PER_TOKEN = float(os.environ.get('CHARS_PER_TOKEN', 3.5))
+
+# Modelo de cada tarefa do LLM (vazio usa o MODEL_PROMPT do llm_interface).
+# Validação e classificação têm saída restrita (SIM/NÃO ou uma das classes) e podem
+# ir para um modelo pequeno já baixado no Ollama (ex.: qwen2:0.5b); se a saída não
+# for válida, a chamada é repetida no MODEL_ESCALATION (vazio: MODEL_PROMPT)
+MODEL_VALIDATION = os.environ.get('MODEL_VALIDATION', '')
+MODEL_CLASSIFICATION = os.environ.get('MODEL_CLASSIFICATION', '')
+MODEL_ANSWER = os.environ.get('MODEL_ANSWER', '')
+MODEL_FAQ = os.environ.get('MODEL_FAQ', '')
+MODEL_ESCALATION = os.environ.get('MODEL_ESCALATION', '')
+
+# Na subida, carrega os modelos usados pelas tarefas e o de embeddings no Ollama em segundo plano
+# (requisição vazia com OLLAMA_KEEP_ALIVE), para que a primeira pergunta não espere o carregamento
+WARM_UP_MODELS = os.environ.get('WARM_UP_MODELS', '1') == '1'
+
+# Métricas no formato do Prometheus em http://127.0.0.1:METRICS_PORT/metrics (0 desativa).
+# METRICS_SAMPLE_RATE é a fração das requisições cujas etapas são medidas
+METRICS_PORT = int(os.environ.get('METRICS_PORT', 0))
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', 1.0))
+
 # Configuração de logging melhorada
 logging.basicConfig(
     level=logging.INFO,
@@ -17,10 +164,14 @@ logging.basicConfig(
 def get_logger(name):
     return logging.getLogger(name)
 
-# Configurações do Chroma
-CHROMA_SETTINGS = Settings(
-    anonymized_telemetry=False
-)
+# Configurações do Chroma (passadas para chromadb.config.Settings quando o cliente é criado)
+CHROMA_SETTINGS = {
+    "anonymized_telemetry": False,
+}
 
 # Certifique-se de que o diretório de armazenamento de vetores existe
-os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
\ No newline at end of file
+os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+os.makedirs(DOCUMENT_CACHE_DIR, exist_ok=True)
+os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+os.makedirs(FAQ_RESULTS_DIR, exist_ok=True)
+os.makedirs(JOBS_UPLOAD_DIR, exist_ok=True)
\ No newline at end of file
@@ -0,0 +1,112 @@
+import math
+import threading
+from config import CONTEXT_TOKEN_BUDGET, CHARS_PER_TOKEN, get_logger
+
+logger = get_logger(__name__)
+
+# Tamanho mínimo do trecho repetido para dois chunks serem considerados sobrepostos
+MIN_OVERLAP_CHARS = 20
+
+# Caracteres por token de cada modelo, calibrados com o prompt_eval_count
+# devolvido pelo Ollama (começa em CHARS_PER_TOKEN)
+_chars_per_token = {}
+_lock = threading.Lock()
+
+def record_prompt_tokens(model, prompt_chars, prompt_tokens):
+    """Ajusta a estimativa de tokens do modelo a partir de uma chamada real."""
+    if not model or not prompt_chars or not prompt_tokens:
+        return
+    observed = prompt_chars / prompt_tokens
+    # Com o cache de prefixo do Ollama o prompt_eval_count conta só os tokens
+    # novos; proporções fora desta faixa não refletem o tokenizador
+    if not 1.5 <= observed <= 8:
+        return
+    with _lock:
+        current = _chars_per_token.get(model)
+        # Média móvel para suavizar prompts muito curtos ou atípicos
+        _chars_per_token[model] = observed if current is None else 0.8 * current + 0.2 * observed
+
+def count_tokens(text, model=None):
+    with _lock:
+        ratio = _chars_per_token.get(model, CHARS_PER_TOKEN)
+    return math.ceil(len(text) / ratio)
+
+def _overlap(left, right):
+    """Tamanho do maior sufixo de `left` que é prefixo de `right`."""
+    if len(right) < MIN_OVERLAP_CHARS:
+        return 0
+    probe = right[:MIN_OVERLAP_CHARS]
+    position = left.find(probe, max(0, len(left) - len(right)))
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(probe, position + 1)
+    return 0
+
+def _merge(span, chunk):
+    """Tenta juntar o chunk ao trecho; retorna o trecho resultante ou None."""
+    if chunk in span:
+        return span
+    if span in chunk:
+        return chunk
+    overlap = _overlap(span, chunk)
+    if overlap:
+        return span + chunk[overlap:]
+    overlap = _overlap(chunk, span)
+    if overlap:
+        return chunk + span[overlap:]
+    return None
+
+def _absorb(spans, index, model):
+    """Junta ao trecho `index` os outros trechos que passaram a se sobrepor a ele
+    e retorna quantos tokens foram economizados."""
+    saved = 0
+    j = 0
+    while j < len(spans):
+        if j != index:
+            merged = _merge(spans[index], spans[j])
+            if merged is not None:
+                saved += count_tokens(spans[index], model) + count_tokens(spans[j], model) - count_tokens(merged, model)
+                spans[index] = merged
+                del spans[j]
+                if j < index:
+                    index -= 1
+                j = 0
+                continue
+        j += 1
+    return saved
+
+def pack_context(chunks, model=None, budget=CONTEXT_TOKEN_BUDGET):
+    """Monta o contexto a partir dos chunks em ordem de relevância, juntando os
+    adjacentes ou sobrepostos em um único trecho, até preencher o orçamento de
+    tokens do modelo."""
+    spans = []
+    used = 0
+    for chunk in chunks:
+        chunk = chunk.strip()
+        if not chunk:
+            continue
+        for i, span in enumerate(spans):
+            merged = _merge(span, chunk)
+            if merged is not None:
+                cost = count_tokens(merged, model) - count_tokens(span, model)
+                if used + cost <= budget:
+                    spans[i] = merged
+                    used += cost
+                    used -= _absorb(spans, i, model)
+                break
+        else:
+            cost = count_tokens(chunk, model)
+            if used + cost <= budget:
+                spans.append(chunk)
+                used += cost
+            elif not spans:
+                # O chunk mais relevante não cabe inteiro: usa o início dele
+                spans.append(chunk[:int(len(chunk) * budget / cost)])
+                used = budget
+                break
+        if used >= budget:
+            break
+
+    logger.info(f"Contexto montado com {len(spans)} trechos a partir de {len(chunks)} chunks (~{used}/{budget} tokens)")
+    return "\n\n".join(spans)
@@ -0,0 +1,162 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from config import (
+    VECTOR_STORE_DIR, VECTOR_BACKEND, DOCUMENT_CACHE_DIR, DOCUMENT_CACHE_MAX_AGE_DAYS,
+    DOCUMENT_CACHE_MAX_BYTES, DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS, DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS,
+    VECTOR_STORE_MODE, COLLECTION_MAX_AGE_DAYS, get_logger
+)
+from document_store import drop_document, list_documents, directory_size, document_sizes
+from llm_interface import model_for, ESCALATION_MODEL
+from embedding_manager import EMBEDDING_MODEL
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+
+# Total estimado das coleções do cache desde a última varredura completa (None: ainda não medido)
+_eviction = {"bytes": None, "last_run": 0.0}
+
+def hash_file(pdf_path, block_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(pdf_path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def compute_cache_key(pdf_path, extraction_method):
+    """Chave do cache: hash do conteúdo do PDF + método de extração + modelos e backend usados."""
+    models = [model_for("validacao"), model_for("classificacao"), ESCALATION_MODEL]
+    parts = [hash_file(pdf_path), extraction_method, *models, EMBEDDING_MODEL, VECTOR_BACKEND]
+    return hashlib.sha256(":".join(parts).encode("utf-8")).hexdigest()
+
+def _entry_path(key):
+    return os.path.join(DOCUMENT_CACHE_DIR, f"{key}.json")
+
+def _text_path(key):
+    return os.path.join(DOCUMENT_CACHE_DIR, f"{key}.txt")
+
+def _write_entry(entry):
+    temp_path = _entry_path(entry["key"]) + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        json.dump(entry, file, ensure_ascii=False)
+    os.replace(temp_path, _entry_path(entry["key"]))
+
+def get_cached_document(key):
+    """Retorna a entrada do cache (com o texto extraído) ou None."""
+    with _lock:
+        try:
+            with open(_entry_path(key), 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+            with open(_text_path(key), 'r', encoding='utf-8') as file:
+                text = file.read()
+        except (OSError, ValueError):
+            return None
+
+        # O LRU só precisa de uma resolução grosseira; evita regravar a entrada a cada acerto
+        if time.time() - entry.get("last_access", 0) >= DOCUMENT_CACHE_TOUCH_INTERVAL_SECONDS:
+            entry["last_access"] = time.time()
+            _write_entry(entry)
+
+    entry["text"] = text
+    return entry
+
+def put_cached_document(key, collection_name, text, tipo_processo, situacao):
+    now = time.time()
+    entry = {
+        "key": key,
+        "collection_name": collection_name,
+        "tipo_processo": tipo_processo,
+        "situacao": situacao,
+        "created_at": now,
+        "last_access": now,
+    }
+    with _lock:
+        with open(_text_path(key), 'w', encoding='utf-8') as file:
+            file.write(text)
+        _write_entry(entry)
+    logger.info(f"Documento armazenado no cache: {key[:12]} -> {collection_name}")
+    _maybe_evict(collection_name)
+
+def _maybe_evict(collection_name):
+    """Soma o novo documento ao total estimado e só faz a varredura completa quando
+    ele passa do limite ou quando o intervalo de expiração venceu."""
+    size_limited = VECTOR_STORE_MODE != 'shared'
+    added = document_sizes([collection_name])[collection_name] if size_limited else 0
+    with _lock:
+        if _eviction["bytes"] is not None:
+            _eviction["bytes"] += added
+        due = time.time() - _eviction["last_run"] >= DOCUMENT_CACHE_EVICT_INTERVAL_SECONDS
+        over_limit = size_limited and (_eviction["bytes"] is None or _eviction["bytes"] > DOCUMENT_CACHE_MAX_BYTES)
+    if due or over_limit:
+        evict_cached_documents()
+
+def remove_cached_document(key, drop_collection=True):
+    with _lock:
+        try:
+            with open(_entry_path(key), 'r', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            entry = None
+        for path in (_entry_path(key), _text_path(key)):
+            if os.path.exists(path):
+                os.remove(path)
+    if entry and drop_collection:
+        drop_document(entry["collection_name"])
+
+def _list_entries():
+    entries = []
+    for filename in os.listdir(DOCUMENT_CACHE_DIR):
+        if not filename.endswith(".json"):
+            continue
+        try:
+            with open(os.path.join(DOCUMENT_CACHE_DIR, filename), 'r', encoding='utf-8') as file:
+                entries.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return entries
+
+def evict_cached_documents(max_age_days=DOCUMENT_CACHE_MAX_AGE_DAYS, max_bytes=DOCUMENT_CACHE_MAX_BYTES):
+    """Remove entradas expiradas e, acima do limite de tamanho, as menos usadas
+    recentemente. O limite vale só no modo por documento."""
+    entries = sorted(_list_entries(), key=lambda entry: entry.get("last_access", 0))
+    cutoff = time.time() - max_age_days * 86400
+
+    expired = [entry for entry in entries if entry.get("last_access", 0) < cutoff]
+    for entry in expired:
+        logger.info(f"Removendo documento expirado do cache: {entry['key'][:12]}")
+        remove_cached_document(entry["key"])
+    remaining = [entry for entry in entries if entry not in expired]
+
+    if VECTOR_STORE_MODE == 'shared':
+        with _lock:
+            _eviction["last_run"] = time.time()
+        return
+    # Só as coleções dos documentos contam: uploads, FAQ, fila e o próprio cache ficam de fora
+    sizes = document_sizes([entry["collection_name"] for entry in remaining])
+    size = sum(sizes.values())
+    while size > max_bytes and remaining:
+        entry = remaining.pop(0)
+        logger.info(f"Coleções do cache com {size} bytes; removendo: {entry['key'][:12]}")
+        remove_cached_document(entry["key"])
+        size -= sizes[entry["collection_name"]]
+    with _lock:
+        _eviction.update(bytes=size, last_run=time.time())
+
+def collect_garbage(max_age_days=COLLECTION_MAX_AGE_DAYS):
+    """Aplica a expiração do cache e remove os documentos indexados que não
+    pertencem a nenhuma entrada (uploads com o cache desligado, entradas já
+    apagadas) criados há mais de max_age_days."""
+    evict_cached_documents()
+    tracked = {entry["collection_name"] for entry in _list_entries()}
+    cutoff = time.time() - max_age_days * 86400
+    removed = []
+    for name, created in list_documents():
+        if name in tracked or created is None or created >= cutoff:
+            continue
+        logger.info(f"Removendo documento indexado sem uso: {name}")
+        drop_document(name)
+        removed.append(name)
+    return {"removidos": removed, "bytes_vetores": directory_size(VECTOR_STORE_DIR)}
@@ -0,0 +1,441 @@
+import os
+import time
+import uuid
+import shutil
+import sqlite3
+import threading
+from contextlib import contextmanager
+from config import (
+    JOBS_DB_PATH, JOBS_UPLOAD_DIR, JOB_STAGE_RETRIES, JOB_RETRY_BACKOFF, JOB_MAX_ATTEMPTS,
+    JOB_LEASE_SECONDS, JOB_POLL_SECONDS, FAQ_PRECOMPUTE, OCR_WORKERS, JOB_WORKERS, INGEST_INCREMENTAL,
+    DEFAULT_EXTRACTION_METHOD, get_logger
+)
+from ocr_engine import iter_pages, get_page_count
+from document_processor import load_and_split_document
+from document_cache import compute_cache_key
+from document_store import open_document_collection, drop_document
+from prompt_manager import find_cached_document, index_document, index_document_incremental
+from faq_jobs import start_faq_job
+from llm_interface import ollama_llm_stream, model_for
+from metrics import span, trace
+
+logger = get_logger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+FINAL_STATUSES = ("done", "rejected", "failed", "cancelled")
+
+# job_stages guarda o progresso e as tentativas de cada etapa, para que uma nova
+# tentativa recomece da etapa que falhou
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    document_key TEXT NOT NULL,
+    pdf_path TEXT NOT NULL,
+    filename TEXT,
+    extraction_method TEXT NOT NULL,
+    status TEXT NOT NULL,
+    stage TEXT,
+    progress TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    collection_name TEXT,
+    tipo_processo TEXT,
+    situacao TEXT,
+    available_at REAL NOT NULL,
+    heartbeat REAL,
+    holders INTEGER NOT NULL DEFAULT 1,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, available_at);
+CREATE INDEX IF NOT EXISTS jobs_document_key ON jobs (document_key, status);
+CREATE TABLE IF NOT EXISTS job_stages (
+    job_id TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    seconds REAL,
+    error TEXT,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (job_id, stage)
+);
+"""
+
+class JobCancelled(Exception):
+    pass
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+@contextmanager
+def _connect():
+    global _schema_ready
+    connection = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    connection.row_factory = sqlite3.Row
+    try:
+        with _schema_lock:
+            if not _schema_ready:
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(_SCHEMA)
+                columns = {row["name"] for row in connection.execute("PRAGMA table_info(jobs)")}
+                if "holders" not in columns:
+                    # Bancos criados antes da contagem de interessados
+                    connection.execute("ALTER TABLE jobs ADD COLUMN holders INTEGER NOT NULL DEFAULT 1")
+                _schema_ready = True
+        with connection:
+            yield connection
+    finally:
+        connection.close()
+
+def _job_dir(job_id):
+    return os.path.join(JOBS_UPLOAD_DIR, job_id)
+
+def _text_path(job_id):
+    return os.path.join(_job_dir(job_id), "texto.txt")
+
+def submit_job(pdf_path, extraction_method=DEFAULT_EXTRACTION_METHOD, filename=None):
+    """Copia o PDF para a área da fila e cria o job. Se o mesmo documento já
+    estiver na fila com o mesmo método, devolve o job existente."""
+    document_key = compute_cache_key(pdf_path, extraction_method)
+    with _connect() as connection:
+        existing = connection.execute(
+            "SELECT id FROM jobs WHERE document_key = ? AND status IN (?, ?)", (document_key, *ACTIVE_STATUSES)
+        ).fetchone()
+        if existing:
+            connection.execute("UPDATE jobs SET holders = holders + 1 WHERE id = ?", (existing["id"],))
+    if existing:
+        logger.info(f"Documento já está na fila: job {existing['id']}")
+        return existing["id"]
+
+    job_id = uuid.uuid4().hex
+    os.makedirs(_job_dir(job_id), exist_ok=True)
+    stored_path = os.path.join(_job_dir(job_id), "documento.pdf")
+    shutil.copyfile(pdf_path, stored_path)
+    now = time.time()
+    with _connect() as connection:
+        connection.execute(
+            "INSERT INTO jobs (id, document_key, pdf_path, filename, extraction_method, status, progress, available_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, 'queued', 'Aguardando na fila...', ?, ?, ?)",
+            (job_id, document_key, stored_path, filename or os.path.basename(pdf_path), extraction_method, now, now, now)
+        )
+    logger.info(f"Job {job_id} criado para {filename or os.path.basename(pdf_path)} ({extraction_method})")
+    return job_id
+
+def get_job(job_id):
+    """Estado do job com o progresso de cada etapa, ou None se não existir."""
+    with _connect() as connection:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        stages = connection.execute(
+            "SELECT stage, status, attempts, seconds, error FROM job_stages WHERE job_id = ? ORDER BY rowid", (job_id,)
+        ).fetchall()
+    job = dict(row)
+    job["stages"] = [dict(stage) for stage in stages]
+    return job
+
+def list_jobs(status=None, limit=50):
+    query = "SELECT id, filename, status, stage, progress, created_at, updated_at FROM jobs"
+    params = ()
+    if status:
+        query += " WHERE status = ?"
+        params = (status,)
+    with _connect() as connection:
+        rows = connection.execute(query + " ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+    return [dict(row) for row in rows]
+
+def cancel_job(job_id):
+    """Cancela um job na fila ou em andamento; o worker para na próxima página
+    ou etapa. Retorna False se o job não existir ou já tiver terminado."""
+    with _connect() as connection:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = 'cancelled', progress = 'Cancelado.', updated_at = ? WHERE id = ? AND status IN (?, ?)",
+            (time.time(), job_id, *ACTIVE_STATUSES)
+        )
+    if cursor.rowcount:
+        logger.info(f"Job {job_id} cancelado")
+    return cursor.rowcount > 0
+
+def release_job(job_id):
+    """Indica que quem submeteu o job não precisa mais dele (por exemplo, a sessão
+    enviou outro documento). O job é cancelado quando ninguém mais o aguarda."""
+    with _connect() as connection:
+        connection.execute("UPDATE jobs SET holders = MAX(holders - 1, 0) WHERE id = ?", (job_id,))
+        cursor = connection.execute(
+            "UPDATE jobs SET status = 'cancelled', progress = 'Cancelado.', updated_at = ? "
+            "WHERE id = ? AND holders = 0 AND status IN (?, ?)", (time.time(), job_id, *ACTIVE_STATUSES)
+        )
+    if cursor.rowcount:
+        logger.info(f"Job {job_id} cancelado: nenhuma sessão aguarda o resultado")
+    return cursor.rowcount > 0
+
+def _update_job(job_id, **fields):
+    fields["updated_at"] = time.time()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as connection:
+        connection.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+def _update_stage(job_id, stage, **fields):
+    with _connect() as connection:
+        connection.execute(
+            "INSERT INTO job_stages (job_id, stage, status, updated_at) VALUES (?, ?, 'running', ?) "
+            "ON CONFLICT (job_id, stage) DO NOTHING", (job_id, stage, time.time())
+        )
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        connection.execute(
+            f"UPDATE job_stages SET {assignments}, updated_at = ? WHERE job_id = ? AND stage = ?",
+            (*fields.values(), time.time(), job_id, stage)
+        )
+
+def _stage_done(job_id, stage):
+    with _connect() as connection:
+        row = connection.execute("SELECT status FROM job_stages WHERE job_id = ? AND stage = ?", (job_id, stage)).fetchone()
+    return row is not None and row["status"] == "done"
+
+def _report(job_id, progress, stage=None):
+    """Grava o progresso e renova o lease do worker; interrompe o job se ele foi cancelado."""
+    now = time.time()
+    fields = {"progress": progress, "heartbeat": now, "updated_at": now}
+    if stage:
+        fields["stage"] = stage
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with _connect() as connection:
+        cursor = connection.execute(
+            f"UPDATE jobs SET {assignments} WHERE id = ? AND status = 'running'", (*fields.values(), job_id)
+        )
+    if not cursor.rowcount:
+        raise JobCancelled(job_id)
+
+def _recover_stale_jobs(connection):
+    # Jobs de um worker que parou (processo encerrado) voltam para a fila ou falham
+    cutoff = time.time() - JOB_LEASE_SECONDS
+    connection.execute(
+        "UPDATE jobs SET status = 'failed', error = 'Worker interrompido repetidamente', updated_at = ? "
+        "WHERE status = 'running' AND heartbeat < ? AND attempts >= ?", (time.time(), cutoff, JOB_MAX_ATTEMPTS)
+    )
+    connection.execute(
+        "UPDATE jobs SET status = 'queued', progress = 'Retomando após interrupção...', updated_at = ? "
+        "WHERE status = 'running' AND heartbeat < ?", (time.time(), cutoff)
+    )
+
+def requeue_interrupted_jobs():
+    """Na subida do processo, nenhum job pode estar de fato em execução."""
+    with _connect() as connection:
+        connection.execute("UPDATE jobs SET heartbeat = 0 WHERE status = 'running'")
+        _recover_stale_jobs(connection)
+
+def claim_next_job():
+    now = time.time()
+    with _connect() as connection:
+        connection.execute("BEGIN IMMEDIATE")
+        _recover_stale_jobs(connection)
+        row = connection.execute(
+            "SELECT id FROM jobs WHERE status = 'queued' AND available_at <= ? ORDER BY created_at LIMIT 1", (now,)
+        ).fetchone()
+        if row is None:
+            return None
+        connection.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, heartbeat = ?, error = NULL, updated_at = ? WHERE id = ?",
+            (now, now, row["id"])
+        )
+    return get_job(row["id"])
+
+def _run_stage(job_id, stage, function):
+    """Executa uma etapa com até JOB_STAGE_RETRIES novas tentativas, com backoff exponencial."""
+    attempt = 0
+    while True:
+        attempt += 1
+        _update_stage(job_id, stage, status="running", attempts=attempt, error=None)
+        start = time.perf_counter()
+        try:
+            result = function()
+        except JobCancelled:
+            _update_stage(job_id, stage, status="cancelled", seconds=time.perf_counter() - start)
+            raise
+        except Exception as e:
+            _update_stage(job_id, stage, status="failed", seconds=time.perf_counter() - start, error=str(e))
+            if attempt > JOB_STAGE_RETRIES:
+                raise
+            delay = JOB_RETRY_BACKOFF * (2 ** (attempt - 1))
+            logger.warning(f"Job {job_id}: etapa {stage} falhou ({e}); nova tentativa em {delay:.1f}s")
+            _report(job_id, f"Etapa {stage} falhou; nova tentativa em {delay:.0f}s...", stage)
+            time.sleep(delay)
+            continue
+        _update_stage(job_id, stage, status="done", seconds=time.perf_counter() - start)
+        return result
+
+def _extract(job, workers):
+    page_count = get_page_count(job["pdf_path"])
+    texts = []
+    pages = iter_pages(job["pdf_path"], method=job["extraction_method"], workers=workers)
+    try:
+        with span("ocr", method=job["extraction_method"]):
+            for page in pages:
+                texts.append(page["text"])
+                _report(job["id"], f"Extraindo texto: página {len(texts)}/{page_count}", "ocr")
+    finally:
+        # Fechar o gerador encerra os processos de OCR em caso de cancelamento
+        pages.close()
+    return "".join(texts)
+
+def process_job(job, ocr_workers=OCR_WORKERS):
+    job_id = job["id"]
+    pdf_path = job["pdf_path"]
+    method = job["extraction_method"]
+
+    cache_key, collection, text, classification = find_cached_document(pdf_path, method)
+    if collection is None and text is None and INGEST_INCREMENTAL:
+        return _process_job_incremental(job, cache_key)
+    if collection is None:
+        if text is None and _stage_done(job_id, "ocr") and os.path.exists(_text_path(job_id)):
+            with open(_text_path(job_id), 'r', encoding='utf-8') as file:
+                text = file.read()
+        if text is None:
+            _report(job_id, "Extraindo texto do documento...", "ocr")
+            text = _run_stage(job_id, "ocr", lambda: _extract(job, ocr_workers))
+            with open(_text_path(job_id), 'w', encoding='utf-8') as file:
+                file.write(text)
+
+        _report(job_id, "Validando e classificando o documento...", "classificacao")
+        splits, error_message = _run_stage(
+            job_id, "classificacao", lambda: load_and_split_document(pdf_path, extraction_method=method, text=text, classification=classification)
+        )
+        if error_message or not splits:
+            return _finish(job_id, "rejected", error=error_message or "O documento está fora do contexto esperado!")
+
+        metadata = splits[0].metadata
+        _report(job_id, f"Documento validado. Criando embeddings de {len(splits)} trechos...", "embeddings")
+        collection = _run_stage(job_id, "embeddings", lambda: index_document(splits, text, cache_key))
+        tipo_processo, situacao = metadata.get("tipo_processo"), metadata.get("situacao")
+    else:
+        first = collection.get(limit=1)["metadatas"]
+        tipo_processo, situacao = (first[0].get("tipo_processo"), first[0].get("situacao")) if first else (None, None)
+
+    if FAQ_PRECOMPUTE:
+        start_faq_job(collection, model_for("faq"), ollama_llm_stream)
+    _finish(job_id, "done", collection_name=collection.name, tipo_processo=tipo_processo, situacao=situacao)
+
+def _process_job_incremental(job, cache_key):
+    # Mesmo caminho da ingestão incremental da interface: a coleção é gravada no
+    # job assim que as perguntas são liberadas, e follow_job já a entrega
+    job_id = job["id"]
+    collection_name = None
+
+    def run():
+        nonlocal collection_name
+        result = None
+        ingest = index_document_incremental(
+            job["pdf_path"], job["extraction_method"], cache_key,
+            model_for("faq") if FAQ_PRECOMPUTE else None, ollama_llm_stream
+        )
+        try:
+            for result in ingest:
+                if result["collection"] is not None and collection_name is None:
+                    collection_name = result["collection"].name
+                    _update_job(job_id, collection_name=collection_name)
+                _report(job_id, result["status"], "indexacao")
+        except BaseException:
+            ingest.close()
+            # Uma nova tentativa cria outra coleção; a parcial não fica órfã
+            if collection_name is not None:
+                drop_document(collection_name)
+                _update_job(job_id, collection_name=None)
+                collection_name = None
+            raise
+        return result
+
+    _report(job_id, "Extraindo e indexando as páginas...", "indexacao")
+    result = _run_stage(job_id, "indexacao", run)
+    if result is None or not result["success"]:
+        return _finish(job_id, "rejected", error=result["status"] if result else "Não foi possível extrair texto do PDF.")
+
+    first = result["collection"].get(limit=1)["metadatas"]
+    tipo_processo, situacao = (first[0].get("tipo_processo"), first[0].get("situacao")) if first else (None, None)
+    _finish(job_id, "done", collection_name=collection_name, tipo_processo=tipo_processo, situacao=situacao)
+
+def _finish(job_id, status, **fields):
+    progress = {
+        "done": "Contexto criado com sucesso. Pronto para perguntas!",
+        "rejected": fields.get("error"),
+        "failed": f"Ocorreu um erro ao processar o documento: {fields.get('error')}",
+    }.get(status)
+    with _connect() as connection:
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        extra = f", {assignments}" if fields else ""
+        # Não sobrescreve um cancelamento feito enquanto a última etapa rodava
+        connection.execute(
+            f"UPDATE jobs SET status = ?, progress = ?, updated_at = ?{extra} WHERE id = ? AND status = 'running'",
+            (status, progress, time.time(), *fields.values(), job_id)
+        )
+    shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+    logger.info(f"Job {job_id} terminou: {status}")
+
+class JobWorker(threading.Thread):
+    """Thread que consome a fila até stop_event ser sinalizado."""
+
+    def __init__(self, stop_event, ocr_workers, index):
+        super().__init__(name=f"job-worker-{index}", daemon=True)
+        self.stop_event = stop_event
+        self.ocr_workers = ocr_workers
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                job = claim_next_job()
+            except sqlite3.Error as e:
+                logger.error(f"Erro ao consultar a fila de jobs: {e}")
+                job = None
+            if job is None:
+                self.stop_event.wait(JOB_POLL_SECONDS)
+                continue
+
+            logger.info(f"Processando job {job['id']} ({job['filename']}), tentativa {job['attempts']}")
+            try:
+                with trace("job", job["id"]):
+                    process_job(job, self.ocr_workers)
+            except JobCancelled:
+                shutil.rmtree(_job_dir(job["id"]), ignore_errors=True)
+                logger.info(f"Job {job['id']} interrompido por cancelamento")
+            except Exception as e:
+                logger.error(f"Job {job['id']} falhou: {e}", exc_info=True)
+                _finish(job["id"], "failed", error=str(e))
+
+def start_job_workers(count=JOB_WORKERS):
+    """Inicia os workers da fila neste processo. São threads porque o
+    PersistentClient do Chroma não pode ser compartilhado entre processos."""
+    stop_event = threading.Event()
+    if count <= 0:
+        return stop_event
+    requeue_interrupted_jobs()
+    ocr_workers = max(1, OCR_WORKERS // count)
+    for index in range(count):
+        JobWorker(stop_event, ocr_workers, index).start()
+    logger.info(f"{count} workers da fila de documentos iniciados")
+    return stop_event
+
+def follow_job(job_id):
+    """Acompanha um job no formato de load_context ({"status", "success", "collection"})."""
+    last_progress = None
+    unlocked = None
+    while True:
+        job = get_job(job_id)
+        if job is None:
+            yield {"status": "Job não encontrado.", "success": False, "collection": None}
+            return
+        if job["status"] == "done":
+            collection = open_document_collection(job["collection_name"])
+            if collection is None:
+                yield {"status": "A coleção do documento não existe mais; envie o documento novamente.", "success": False, "collection": None}
+            else:
+                yield {"status": job["progress"], "success": True, "collection": collection}
+            return
+        if job["status"] in FINAL_STATUSES:
+            yield {"status": job["progress"] or job["error"], "success": False, "collection": None}
+            return
+        if job["collection_name"] and unlocked is None:
+            # Ingestão incremental: as perguntas são liberadas antes do fim do job
+            unlocked = open_document_collection(job["collection_name"])
+        if job["progress"] != last_progress:
+            last_progress = job["progress"]
+            yield {"status": last_progress, "success": unlocked is not None, "collection": unlocked}
+        time.sleep(JOB_POLL_SECONDS)
@@ -1,14 +1,9 @@
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
-import tempfile
-import os
-from config import get_logger
-from document_validator import validate_document_context, get_rejection_reason
-import ocrmypdf
-from pdf2image import convert_from_path
-import pytesseract
-import PyPDF2
-from llm_interface import ollama_llm, MODEL_PROMPT
+from config import get_logger, INGEST_ANALYSIS_MODE, DEFAULT_EXTRACTION_METHOD
+from document_validator import validate_document_context, get_rejection_reason, VALIDATION_SAMPLE_SIZE
+from ocr_engine import extract_pages
+from case_classifier import fast_classify
+from metrics import span
+from llm_interface import ollama_llm_label, ollama_structured, run_routed
 
 logger = get_logger(__name__)
 
@@ -43,27 +38,11 @@ tipo_processo_classes = [
 ]
 situacao_classes = ["Julgado e deferido", "Julgado e indeferido", "Condenado", "Negado", "Acatado", "Em trâmite", "Outro"]
 
-def extract_text_from_pdf(pdf_path, method='ocrmypdf'):
+def extract_text_from_pdf(pdf_path, method=DEFAULT_EXTRACTION_METHOD, workers=None):
     try:
-        if method == 'ocrmypdf':
-            with tempfile.NamedTemporaryFile(suffix=".pdf", delete=False) as temp_output:
-                temp_output_path = temp_output.name
-
-            ocrmypdf.ocr(pdf_path, temp_output_path, language='por')
-
-            with open(temp_output_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                text = "".join(page.extract_text() for page in reader.pages)
-
-            os.remove(temp_output_path)
-
-        elif method == 'pdf2image':
-            images = convert_from_path(pdf_path)
-            text = ""
-            for image in images:
-                text += pytesseract.image_to_string(image, lang='por')
-        else:
-            raise ValueError("Método de extração inválido")
+        with span("ocr", method=method):
+            pages = extract_pages(pdf_path, method=method, workers=workers)
+        text = "".join(page["text"] for page in pages)
 
         if not text.strip():
             logger.warning("Nenhum texto extraído do PDF.")
@@ -87,8 +66,11 @@ Texto para classificação:
 
 Responda apenas com o nome da categoria escolhida, sem explicações adicionais."""
 
-    response = ollama_llm(prompt, "", MODEL_PROMPT)
-    return response.strip()
+    tipo_processo, _ = ollama_llm_label("classificacao", prompt, tipo_processo_classes)
+    if tipo_processo is None:
+        logger.warning("Nenhum modelo respondeu com um tipo de processo conhecido; usando 'Outro Processo'")
+        return "Outro Processo"
+    return tipo_processo
 
 def classify_case_status(text):
     prompt = f"""Classifique a situação atual do processo jurídico com base no seguinte texto. Escolha a opção mais apropriada entre as seguintes categorias:
@@ -102,35 +84,127 @@ Texto para classificação:
 
 Responda apenas com o nome da categoria escolhida, sem explicações adicionais."""
 
-    response = ollama_llm(prompt, "", MODEL_PROMPT)
-    return response.strip()
+    situacao, _ = ollama_llm_label("classificacao", prompt, situacao_classes)
+    if situacao is None:
+        logger.warning("Nenhum modelo respondeu com uma situação conhecida; usando 'Outro'")
+        return "Outro"
+    return situacao
+
+def rejection_message(validation_response):
+    return f"O documento não está relacionado ao contexto jurídico. Razão: {validation_response}"
+
+def analyze_document_structured(text):
+    sample = text[:VALIDATION_SAMPLE_SIZE]
+    schema = {
+        "type": "object",
+        "properties": {
+            "juridico": {"type": "boolean"},
+            "justificativa": {"type": "string"},
+            "tipo_processo": {"type": "string", "enum": tipo_processo_classes},
+            "situacao": {"type": "string", "enum": situacao_classes}
+        },
+        "required": ["juridico", "justificativa", "tipo_processo", "situacao"]
+    }
+    prompt = f"""Analise o texto abaixo e responda em JSON com os campos:
+
+- "juridico": true se o texto pertence ao contexto de processos legais, judiciais ou jurídicos (terminologia jurídica, referências a leis, códigos, tribunais, decisões judiciais, crimes); false se apenas menciona esses termos em contexto de ficção, entretenimento ou regras de jogos.
+- "justificativa": breve justificativa para o campo "juridico".
+- "tipo_processo": uma das categorias: {', '.join(tipo_processo_classes)}. Se nenhuma se aplicar exatamente, use 'Outro Processo'.
+- "situacao": uma das categorias: {', '.join(situacao_classes)}. Se nenhuma se aplicar exatamente, use 'Outro'.
+
+Texto para análise:
+{sample}"""
+
+    def attempt(model):
+        result = ollama_structured(prompt, schema, model)
+        if not isinstance(result.get("juridico"), bool):
+            raise ValueError(f"Campo 'juridico' inválido: {result.get('juridico')!r}")
+        if result.get("tipo_processo") not in tipo_processo_classes:
+            raise ValueError(f"Tipo de processo fora das classes conhecidas: {result.get('tipo_processo')!r}")
+        if result.get("situacao") not in situacao_classes:
+            raise ValueError(f"Situação fora das classes conhecidas: {result.get('situacao')!r}")
+        return result
+
+    # O modelo pequeno da classificação responde primeiro; saída inválida escala para o maior
+    result = run_routed("classificacao", attempt)
+    if result is None:
+        raise ValueError("Nenhum modelo produziu uma análise estruturada válida")
+
+    justification = str(result.get("justificativa", "")).strip()
+    validation_response = f"{'SIM' if result['juridico'] else 'NÃO'}. {justification}".strip()
+    return result["juridico"], validation_response, result["tipo_processo"], result["situacao"]
+
+def analyze_document(text):
+    """Retorna (is_valid, validation_response, tipo_processo, situacao). O LLM só
+    é consultado nos campos em que as regras não atingem o limiar de confiança."""
+    with span("classificacao_regras"):
+        rules = fast_classify(text)
+    is_valid = rules["is_valid"]
+    tipo_processo = rules["tipo_processo"]
+    situacao = rules["situacao"]
+    validation_response = f"SIM. Termos jurídicos identificados: {', '.join(rules['matched_terms'])}" if is_valid else None
+
+    if is_valid and tipo_processo and situacao:
+        logger.info("Documento validado e classificado apenas por regras")
+        return True, validation_response, tipo_processo, situacao
+
+    if INGEST_ANALYSIS_MODE == 'structured':
+        try:
+            with span("validacao_classificacao"):
+                llm_valid, llm_response, llm_tipo, llm_situacao = analyze_document_structured(text)
+            if not (is_valid or llm_valid):
+                return False, llm_response, None, None
+            return True, validation_response or llm_response, tipo_processo or llm_tipo, situacao or llm_situacao
+        except Exception as e:
+            logger.warning(f"Falha na análise estruturada, usando chamadas separadas: {e}")
+
+    if not is_valid:
+        with span("validacao"):
+            is_valid, validation_response = validate_document_context(text)
+        if not is_valid:
+            return False, validation_response, None, None
+    with span("classificacao"):
+        tipo_processo = tipo_processo or classify_case_type(text)
+        situacao = situacao or classify_case_status(text)
+    return True, validation_response, tipo_processo, situacao
+
+def split_documents(docs):
+    # O langchain é importado no primeiro uso para não pesar na subida da aplicação
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    with span("divisao"):
+        return text_splitter.split_documents(docs)
 
-def load_and_split_document(source, extraction_method='ocrmypdf'):
-    logger.info(f"Carregando dados do PDF usando o método {extraction_method}")
+def load_and_split_document(source, extraction_method=DEFAULT_EXTRACTION_METHOD, text=None, classification=None):
     if isinstance(source, str):
         pdf_path = source
     else:
         pdf_path = source.name
-    text = extract_text_from_pdf(pdf_path, method=extraction_method)
+    if text is None:
+        logger.info(f"Carregando dados do PDF usando o método {extraction_method}")
+        text = extract_text_from_pdf(pdf_path, method=extraction_method)
     if not text.strip():
         logger.warning("Não foi possível extrair texto do PDF.")
         return None, "Não foi possível extrair texto do PDF."
 
-    # Validar o contexto do documento
-    logger.info("Validando o contexto do documento...")
-    is_valid, validation_response = validate_document_context(text)
-    if not is_valid:
-        logger.warning(f"Documento rejeitado: {validation_response}")
-        return None, f"O documento não está relacionado ao contexto jurídico. Razão: {validation_response}"
-
-    logger.info("Documento validado com sucesso.")
-
-    # Classificar o tipo de processo e situação
-    tipo_processo = classify_case_type(text)
-    situacao = classify_case_status(text)
+    if classification is not None:
+        # Documento já validado e classificado em uma ingestão anterior (cache de documentos)
+        tipo_processo, situacao = classification
+        logger.info("Usando a validação e a classificação do cache de documentos.")
+    else:
+        # Validar o contexto do documento e classificar o tipo de processo e situação
+        logger.info("Validando o contexto do documento...")
+        is_valid, validation_response, tipo_processo, situacao = analyze_document(text)
+        if not is_valid:
+            logger.warning(f"Documento rejeitado: {validation_response}")
+            return None, rejection_message(validation_response)
+
+        logger.info("Documento validado com sucesso.")
     logger.info(f"Tipo de processo classificado: {tipo_processo}")
     logger.info(f"Situação classificada: {situacao}")
 
+    from langchain.schema import Document
     docs = [Document(page_content=text, metadata={"source": pdf_path, "tipo_processo": tipo_processo, "situacao": situacao})]
 
     logger.info(f"Carregados {len(docs)} documentos")
@@ -140,8 +214,7 @@ def load_and_split_document(source, extraction_method='ocrmypdf'):
         return None, "Nenhum documento foi carregado."
 
     logger.info("Dividindo documentos em chunks")
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = text_splitter.split_documents(docs)
+    splits = split_documents(docs)
     logger.info(f"Criados {len(splits)} splits")
 
     return splits, None  # None para o erro indica sucesso
\ No newline at end of file
@@ -0,0 +1,280 @@
+import os
+import sys
+import json
+import time
+import uuid
+import hashlib
+import shutil
+import sqlite3
+import argparse
+from datetime import datetime
+from config import (
+    VECTOR_STORE_DIR, VECTOR_BACKEND, VECTOR_STORE_MODE, SHARED_COLLECTION_PREFIX,
+    SHARED_COLLECTION_SHARDS, NUMPY_STORE_DIR, get_logger
+)
+from embedding_manager import create_embeddings
+from chroma_manager import create_collection, get_collection, delete_collection, list_collections
+from numpy_store import NumpyCollection
+from lexical_index import delete_lexical_index, lexical_index_size
+from faq_jobs import cancel_faq_job, delete_stored_faq
+from answer_cache import invalidate_answers
+
+logger = get_logger(__name__)
+
+PER_DOCUMENT_PREFIX = "collection_"
+SHARED_DOCUMENT_PREFIX = "doc_"
+# Tamanho dos lotes ao copiar registros entre coleções na compactação
+COPY_BATCH_SIZE = 1000
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+def _chroma_segments_by_collection():
+    sqlite_path = os.path.join(VECTOR_STORE_DIR, "chroma.sqlite3")
+    if not os.path.exists(sqlite_path):
+        return {}
+    connection = sqlite3.connect(sqlite_path)
+    try:
+        rows = connection.execute(
+            "SELECT c.name, s.id FROM segments s JOIN collections c ON s.collection = c.id"
+        ).fetchall()
+    finally:
+        connection.close()
+    segments = {}
+    for name, segment_id in rows:
+        segments.setdefault(name, []).append(segment_id)
+    return segments
+
+def document_sizes(names):
+    """Bytes em disco de cada coleção (vetores e índice léxico). O chroma.sqlite3
+    fica de fora, porque só diminui com a compactação."""
+    segments = _chroma_segments_by_collection() if VECTOR_BACKEND == 'chroma' else {}
+    sizes = {}
+    for name in names:
+        if VECTOR_BACKEND == 'numpy':
+            size = directory_size(os.path.join(NUMPY_STORE_DIR, name))
+        else:
+            size = sum(directory_size(os.path.join(VECTOR_STORE_DIR, segment_id)) for segment_id in segments.get(name, []))
+        sizes[name] = size + lexical_index_size(name)
+    return sizes
+
+def _shard_name(document_id):
+    shard = int(hashlib.sha1(document_id.encode("utf-8")).hexdigest(), 16) % SHARED_COLLECTION_SHARDS
+    return f"{SHARED_COLLECTION_PREFIX}_{shard}"
+
+def _shard_names():
+    prefix = f"{SHARED_COLLECTION_PREFIX}_"
+    return [name for name in list_collections() if name.startswith(prefix) and name[len(prefix):].isdigit()]
+
+def _delete_records(collection, where):
+    if isinstance(collection, NumpyCollection):
+        collection.remove(where=where)
+    else:
+        collection.delete(where=where)
+
+def created_at(name):
+    """Momento de criação codificado no nome da coleção ou do documento."""
+    parts = name.split("_")
+    try:
+        return datetime.strptime(f"{parts[1]}_{parts[2]}", "%Y%m%d_%H%M%S").timestamp()
+    except (IndexError, ValueError):
+        return None
+
+class DocumentCollection:
+    """Um documento dentro de uma coleção compartilhada."""
+
+    def __init__(self, document_id, shard):
+        self.name = document_id
+        self.shard = shard
+
+    def _where(self, where=None):
+        scope = {"document_id": self.name}
+        return {"$and": [scope, where]} if where else scope
+
+    def count(self):
+        return len(self.shard.get(where=self._where(), include=[])["ids"])
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None):
+        indexed_at = time.time()
+        metadatas = [
+            dict(metadata or {}, document_id=self.name, indexed_at=indexed_at)
+            for metadata in (metadatas or [None] * len(ids))
+        ]
+        self.shard.add(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")):
+        return self.shard.query(query_embeddings=query_embeddings, query_texts=query_texts, n_results=n_results,
+                                where=self._where(where), include=list(include))
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        return self.shard.get(ids=ids, where=self._where(where), limit=limit, offset=offset, include=list(include))
+
+def new_document_collection():
+    """Cria o destino de um novo documento conforme VECTOR_STORE_MODE."""
+    suffix = f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+    if VECTOR_STORE_MODE == 'shared':
+        document_id = f"{SHARED_DOCUMENT_PREFIX}{suffix}"
+        return DocumentCollection(document_id, create_collection(_shard_name(document_id), create_embeddings()))
+    return create_collection(f"{PER_DOCUMENT_PREFIX}{suffix}", create_embeddings())
+
+def open_document_collection(name):
+    """Abre um documento já indexado pelo nome, em qualquer um dos modos. Retorna None se não existir."""
+    if name.startswith(SHARED_DOCUMENT_PREFIX):
+        shard = get_collection(_shard_name(name), create_embeddings())
+        return DocumentCollection(name, shard) if shard is not None else None
+    return get_collection(name, create_embeddings())
+
+def persist_document(collection):
+    """Grava em disco os vetores adicionados ao documento (só o backend NumPy
+    adia a gravação; no Chroma cada add já é persistido)."""
+    target = collection.shard if isinstance(collection, DocumentCollection) else collection
+    if isinstance(target, NumpyCollection):
+        target.flush()
+
+def drop_document(name):
+    """Remove os vetores de um documento e tudo o que foi derivado dele."""
+    if name.startswith(SHARED_DOCUMENT_PREFIX):
+        shard = get_collection(_shard_name(name), create_embeddings())
+        if shard is not None:
+            _delete_records(shard, {"document_id": name})
+            logger.info(f"Documento removido da coleção compartilhada: {name}")
+    else:
+        delete_collection(name)
+    delete_lexical_index(name)
+    cancel_faq_job(name)
+    delete_stored_faq(name)
+    invalidate_answers(name)
+
+def list_documents():
+    """Documentos indexados com a data de criação: [(nome, timestamp)]."""
+    documents = [(name, created_at(name)) for name in list_collections() if name.startswith(PER_DOCUMENT_PREFIX)]
+    for shard_name in _shard_names():
+        shard = get_collection(shard_name, create_embeddings())
+        seen = set()
+        offset = 0
+        while True:
+            batch = shard.get(include=["metadatas"], limit=COPY_BATCH_SIZE, offset=offset)
+            if not batch["ids"]:
+                break
+            seen.update(metadata["document_id"] for metadata in batch["metadatas"] if metadata and "document_id" in metadata)
+            offset += len(batch["ids"])
+        documents += [(name, created_at(name)) for name in seen]
+    return documents
+
+def search_cases(question, where=None, n_results=10):
+    """Busca entre todos os documentos das coleções compartilhadas, opcionalmente
+    filtrando por metadados (ex.: {"tipo_processo": "Habeas Corpus", "situacao": "Negado"})."""
+    shard_names = _shard_names()
+    if not shard_names:
+        raise ValueError("A busca entre processos exige VECTOR_STORE_MODE='shared' com documentos indexados")
+
+    query_embedding = create_embeddings()(question)
+    matches = []
+    for shard_name in shard_names:
+        results = get_collection(shard_name, create_embeddings()).query(
+            query_embeddings=[query_embedding], n_results=n_results, where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        for document, metadata, distance in zip(results["documents"][0], results["metadatas"][0], results["distances"][0]):
+            matches.append({
+                "document_id": metadata.get("document_id"),
+                "source": metadata.get("source"),
+                "tipo_processo": metadata.get("tipo_processo"),
+                "situacao": metadata.get("situacao"),
+                "distance": distance,
+                "text": document,
+            })
+    return sorted(matches, key=lambda match: match["distance"])[:n_results]
+
+def _rebuild_chroma_collection(name):
+    # Remover registros deixa lacunas no índice HNSW; a cópia gera um índice novo
+    source = get_collection(name, None)
+    temp_name = f"{name}_compactando"
+    if temp_name in list_collections():
+        delete_collection(temp_name)
+    target = create_collection(temp_name, None)
+    offset = 0
+    while True:
+        batch = source.get(include=["documents", "metadatas", "embeddings"], limit=COPY_BATCH_SIZE, offset=offset)
+        if not batch["ids"]:
+            break
+        target.add(ids=batch["ids"], documents=batch["documents"], metadatas=batch["metadatas"], embeddings=batch["embeddings"])
+        offset += len(batch["ids"])
+    delete_collection(name)
+    target.modify(name=name)
+    return offset
+
+def _remove_orphan_segments(segments):
+    # O Chroma não apaga do disco o índice HNSW das coleções removidas
+    for entry in os.listdir(VECTOR_STORE_DIR):
+        path = os.path.join(VECTOR_STORE_DIR, entry)
+        try:
+            uuid.UUID(entry)
+        except ValueError:
+            continue
+        if os.path.isdir(path) and entry not in segments:
+            shutil.rmtree(path, ignore_errors=True)
+            logger.info(f"Índice de coleção removida apagado: {entry}")
+
+def compact_store():
+    """Reconstrói as coleções compartilhadas e recupera o espaço liberado no disco.
+    Deve ser executado com a aplicação parada."""
+    size_before = directory_size(VECTOR_STORE_DIR)
+    rebuilt = {}
+    for name in _shard_names():
+        if VECTOR_BACKEND == 'numpy':
+            # O backend NumPy já regrava a matriz sem os registros a cada remoção
+            rebuilt[name] = get_collection(name, None).count()
+        else:
+            rebuilt[name] = _rebuild_chroma_collection(name)
+
+    sqlite_path = os.path.join(VECTOR_STORE_DIR, "chroma.sqlite3")
+    if VECTOR_BACKEND == 'chroma' and os.path.exists(sqlite_path):
+        connection = sqlite3.connect(sqlite_path)
+        try:
+            segments = {row[0] for row in connection.execute("SELECT id FROM segments")}
+            connection.execute("VACUUM")
+        finally:
+            connection.close()
+        _remove_orphan_segments(segments)
+
+    size_after = directory_size(VECTOR_STORE_DIR)
+    logger.info(f"Compactação concluída: {size_before} -> {size_after} bytes")
+    return {"colecoes_reconstruidas": rebuilt, "bytes_antes": size_before, "bytes_depois": size_after}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manutenção do armazenamento de vetores.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    subparsers.add_parser("gc", help="Remove coleções e documentos expirados ou além do limite de tamanho")
+    subparsers.add_parser("compact", help="Coleta de lixo seguida da reconstrução das coleções compartilhadas")
+    search = subparsers.add_parser("search", help="Busca entre processos nas coleções compartilhadas")
+    search.add_argument("question")
+    search.add_argument("--tipo", help="Filtra por tipo_processo")
+    search.add_argument("--situacao", help="Filtra por situacao")
+    search.add_argument("-n", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    if args.command in ("gc", "compact"):
+        # Importado aqui: document_cache depende deste módulo
+        from document_cache import collect_garbage
+        result = {"coleta_de_lixo": collect_garbage()}
+        if args.command == "compact":
+            result["compactacao"] = compact_store()
+    else:
+        filters = [{"tipo_processo": args.tipo}] if args.tipo else []
+        filters += [{"situacao": args.situacao}] if args.situacao else []
+        where = {"$and": filters} if len(filters) > 1 else (filters[0] if filters else None)
+        result = search_cases(args.question, where=where, n_results=args.n)
+    print(json.dumps(result, indent=2, ensure_ascii=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,12 +1,14 @@
 from config import get_logger
-from llm_interface import ollama_llm
+from llm_interface import ollama_prompt, ollama_llm_label
 
 logger = get_logger(__name__)
 
+VALIDATION_SAMPLE_SIZE = 2000
+
 def validate_document_context(text_sample):
     logger.info("Iniciando validação do contexto do documento...")
     # Reduzindo para os primeiros 2000 caracteres para análise mais abrangente
-    sample = text_sample[:2000]
+    sample = text_sample[:VALIDATION_SAMPLE_SIZE]
     prompt = f"""Analise cuidadosamente o seguinte texto e determine se ele pertence ao contexto de processos legais, judiciais ou jurídicos.
     Responda apenas 'SIM' ou 'NÃO', seguido de uma breve justificativa.
 
@@ -28,10 +30,11 @@ def validate_document_context(text_sample):
 
     O texto está relacionado a processos legais, judiciais ou jurídicos? Responda 'SIM' ou 'NÃO' e justifique brevemente."""
 
-    response = ollama_llm(prompt, "")
-    
-    # Extrair a resposta SIM/NÃO
-    is_valid = response.strip().upper().startswith('SIM')
+    # A resposta precisa começar com SIM ou NÃO; caso contrário a validação escala para o modelo maior
+    label, response = ollama_llm_label("validacao", prompt, ["SIM", "NÃO"])
+    if label is None:
+        response = "Não foi possível obter uma resposta SIM/NÃO do modelo."
+    is_valid = label == "SIM"
     
     logger.info(f"Validação do documento: {'Aprovado' if is_valid else 'Rejeitado'}")
     logger.info(f"Resposta do modelo: {response}")
@@ -48,6 +51,6 @@ def get_rejection_reason(text_sample):
     
     Por que este texto não está relacionado ao contexto jurídico? Seja conciso em sua explicação."""
 
-    response = ollama_llm(prompt, "")
+    response = ollama_prompt(prompt)
     logger.info(f"Razão para rejeição: {response[:200]}...")  # Log dos primeiros 200 caracteres da razão
     return response
\ No newline at end of file
@@ -1,22 +1,120 @@
-from langchain_community.embeddings import OllamaEmbeddings
-from config import OLLAMA_HOST, get_logger
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import EMBEDDING_CACHE_SIZE, EMBEDDING_BATCH_SIZE, EMBEDDING_WORKERS, get_logger
+import ollama_client
+from metrics import inc
 
 logger = get_logger(__name__)
 
 EMBEDDING_MODEL = "paraphrase-multilingual"
+# Mesmos prefixos usados pelo OllamaEmbeddings do langchain, para manter os
+# vetores compatíveis com as coleções já persistidas
+QUERY_INSTRUCTION = "query: "
+DOCUMENT_INSTRUCTION = "passage: "
 
 class ChromaCompatibleEmbedding:
-    def __init__(self):
-        self.model = OllamaEmbeddings(model=EMBEDDING_MODEL, base_url=OLLAMA_HOST)
+    """Serviço de embeddings de longa duração: cache LRU para consultas e
+    embeddings de documentos em lotes processados por um pool de threads."""
+
+    def __init__(self, model=EMBEDDING_MODEL, cache_size=EMBEDDING_CACHE_SIZE,
+                 batch_size=EMBEDDING_BATCH_SIZE, workers=EMBEDDING_WORKERS):
+        self.model = model
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embedding")
+        self._stats = {"cache_hits": 0, "cache_misses": 0, "documents_embedded": 0, "embedding_seconds": 0.0}
+
+    def _cache_key(self, text):
+        return (self.model, hashlib.sha256(text.encode("utf-8")).hexdigest())
+
+    def _cached_query(self, key):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self._stats["cache_hits"] += 1
+                embedding = self._cache[key]
+            else:
+                self._stats["cache_misses"] += 1
+                embedding = None
+        inc("exautos_embedding_query_cache_total", help_text="Consultas ao cache de embeddings de perguntas (acerto ou falta)",
+            outcome="hit" if embedding is not None else "miss")
+        return embedding
+
+    def _remember_query(self, key, embedding):
+        with self._lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def embed_query(self, text):
+        key = self._cache_key(text)
+        embedding = self._cached_query(key)
+        if embedding is None:
+            embedding = ollama_client.embed(self.model, f"{QUERY_INSTRUCTION}{text}")
+            self._remember_query(key, embedding)
+        return embedding
+
+    async def embed_query_async(self, text):
+        key = self._cache_key(text)
+        embedding = self._cached_query(key)
+        if embedding is None:
+            embedding = await ollama_client.embed_async(self.model, f"{QUERY_INSTRUCTION}{text}")
+            self._remember_query(key, embedding)
+        return embedding
+
+    def _embed_batch(self, texts):
+        return [ollama_client.embed(self.model, f"{DOCUMENT_INSTRUCTION}{text}") for text in texts]
+
+    def embed_documents(self, texts):
+        start = time.perf_counter()
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        # map preserva a ordem dos lotes
+        embeddings = [embedding for batch in self._executor.map(self._embed_batch, batches) for embedding in batch]
+        elapsed = time.perf_counter() - start
+
+        with self._lock:
+            self._stats["documents_embedded"] += len(texts)
+            self._stats["embedding_seconds"] += elapsed
+        # Embeddings por segundo = taxa de exautos_document_embeddings_total / taxa de exautos_document_embedding_seconds_total
+        inc("exautos_document_embeddings_total", len(texts), help_text="Embeddings de documentos calculados", model=self.model)
+        inc("exautos_document_embedding_seconds_total", elapsed, help_text="Tempo gasto nos embeddings de documentos", model=self.model)
+        logger.info(f"{len(texts)} embeddings de documentos em {elapsed:.2f}s ({len(texts) / max(elapsed, 1e-9):.1f}/s)")
+        return embeddings
 
     def __call__(self, input):
         if isinstance(input, str):
-            return self.model.embed_query(input)
+            return self.embed_query(input)
         elif isinstance(input, list):
-            return self.model.embed_documents(input)
+            return self.embed_documents(input)
         else:
             raise ValueError("Input deve ser uma string ou uma lista de strings")
 
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats["cache_hits"] + stats["cache_misses"]
+        stats["cache_hit_rate"] = stats["cache_hits"] / lookups if lookups else 0.0
+        stats["embeddings_per_second"] = (
+            stats["documents_embedded"] / stats["embedding_seconds"] if stats["embedding_seconds"] else 0.0
+        )
+        return stats
+
+_embedding_service = None
+_embedding_service_lock = threading.Lock()
+
 def create_embeddings():
-    logger.info(f"Criando embeddings Ollama compatíveis com Chroma usando o modelo {EMBEDDING_MODEL}")
-    return ChromaCompatibleEmbedding()
\ No newline at end of file
+    global _embedding_service
+    with _embedding_service_lock:
+        if _embedding_service is None:
+            logger.info(f"Criando embeddings Ollama compatíveis com Chroma usando o modelo {EMBEDDING_MODEL}")
+            _embedding_service = ChromaCompatibleEmbedding()
+        return _embedding_service
+
+def get_embedding_stats():
+    return create_embeddings().get_stats()
@@ -1,74 +1,307 @@
-from typing import Dict, List
-from config import get_logger
-from rag_engine import rag_chain
+import queue
+import asyncio
+import threading
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import AsyncIterator, Callable, Dict, Iterator, List
+from config import FAQ_MAX_WORKERS, get_logger
+from rag_engine import (
+    rag_chain, rag_chain_stream, rag_chain_stream_async,
+    search_chunks, search_chunks_async, context_from_results
+)
+from answer_cache import get_cached_faq_answer, put_cached_faq_answer
+from metrics import span
 
 logger = get_logger(__name__)
 
 class FAQ:
     def __init__(self):
-        self.questions = [
-            "Qual é o tipo específico de recurso ou processo judicial mencionado nos autos?",
-            "Qual é a situação atual do processo ou recurso?",
-            "Levando em consideração o resultado do processo ou recurso, quais os ações possiveis?"
+        # Cada pergunta declara de quais respostas anteriores depende; perguntas
+        # sem dependências pendentes são executadas em paralelo. "metadata" indica
+        # que a resposta pode vir direto dos metadados da coleção, sem o LLM.
+        self.items = [
+            {
+                "id": "tipo_processo",
+                "question": "Qual é o tipo específico de recurso ou processo judicial mencionado nos autos?",
+                "depends_on": [],
+                "metadata": ("tipo_processo", "O tipo de processo/recurso identificado é: {}"),
+            },
+            {
+                "id": "situacao",
+                "question": "Qual é a situação atual do processo ou recurso?",
+                "depends_on": [],
+                "metadata": ("situacao", "A situação atual do processo é: {}"),
+            },
+            {
+                "id": "acoes_possiveis",
+                "question": "Levando em consideração o resultado do processo ou recurso, quais os ações possiveis?",
+                "depends_on": ["tipo_processo", "situacao"],
+            },
         ]
+        self.questions = [item["question"] for item in self.items]
 
-    def get_faq_answers(self, collection, model, llm_interface) -> Dict[str, str]:
-        logger.info("Iniciando processo de FAQ sequencial")
-        
-        answers = []
-        context = ""
+    def get_faq_answers(self, collection, model, llm_interface, cancel_event=None) -> Dict[str, str]:
+        def ask(item, get_context):
+            answer = get_cached_faq_answer(collection, model, item["id"], item["question"])
+            if answer is None:
+                answer = rag_chain(item["question"], model, collection, llm_interface, context=get_context())
+                put_cached_faq_answer(collection, model, item["id"], item["question"], answer)
+            yield answer
+
+        formatted_result = {"questions_and_answers": ""}
+        with span("faq"):
+            for formatted_result in self._run(collection, model, ask, cancel_event):
+                pass
+        return formatted_result
+
+    def stream_faq_answers(self, collection, model, llm_stream, cancel_event=None) -> Iterator[Dict[str, str]]:
+        """Gera o resultado formatado a cada novo fragmento de resposta; cancel_event
+        interrompe as gerações no próximo fragmento."""
+        def ask(item, get_context):
+            cached_answer = get_cached_faq_answer(collection, model, item["id"], item["question"])
+            if cached_answer is not None:
+                yield cached_answer
+                return
+            answer = ""
+            for fragment in rag_chain_stream(item["question"], model, collection, llm_stream, context=get_context()):
+                answer += fragment
+                yield answer
+            put_cached_faq_answer(collection, model, item["id"], item["question"], answer)
+
+        with span("faq"):
+            yield from self._run(collection, model, ask, cancel_event)
+
+    async def stream_faq_answers_async(self, collection, model, llm_stream) -> AsyncIterator[Dict[str, str]]:
+        """Versão assíncrona de stream_faq_answers, com llm_stream assíncrono.
+        As perguntas prontas rodam como tarefas no event loop; cancelar o
+        consumidor cancela todas elas."""
+        async def ask(item, get_context):
+            cached_answer = await asyncio.to_thread(get_cached_faq_answer, collection, model, item["id"], item["question"])
+            if cached_answer is not None:
+                yield cached_answer
+                return
+            answer = ""
+            async for fragment in rag_chain_stream_async(item["question"], model, collection, llm_stream, context=await get_context()):
+                answer += fragment
+                yield answer
+            await asyncio.to_thread(put_cached_faq_answer, collection, model, item["id"], item["question"], answer)
+
+        with span("faq"):
+            async for formatted_result in self._run_async(collection, model, ask):
+                yield formatted_result
+
+    def _initial_answers(self, collection):
+        """Respostas tiradas direto dos metadados da coleção, mais tipo_processo e situacao."""
         tipo_processo = None
         situacao = None
-
         # Obter metadados do primeiro documento (assumindo que todos os documentos têm os mesmos metadados)
         first_doc = collection.get(limit=1)
         if first_doc and first_doc['metadatas']:
-            tipo_processo = first_doc['metadatas'][0].get('tipo_processo')
-            situacao = first_doc['metadatas'][0].get('situacao')
-
-        for i, question in enumerate(self.questions):
-            logger.info(f"Processando pergunta {i+1}")
-
-            if i == 0 and tipo_processo:
-                answers.append(f"O tipo de processo/recurso identificado é: {tipo_processo}")
-                context += f"\nPergunta: {question}\nResposta: {answers[-1]}\n"
-                continue
-
-            if i == 1 and situacao:
-                answers.append(f"A situação atual do processo é: {situacao}")
-                context += f"\nPergunta: {question}\nResposta: {answers[-1]}\n"
-                continue
-
-            prompt = f"""
-            Analise cuidadosamente o documento jurídico fornecido e responda à seguinte pergunta:
-
-            {question}
-
-            Contexto adicional:
-            Tipo de processo: {tipo_processo}
-            Situação: {situacao}
-            {context}
-
-            Instruções:
-            - Forneça uma resposta clara e concisa, baseada nas informações do documento.
-            - Se a informação exata não estiver disponível, forneça a informação mais próxima ou relevante que puder encontrar.
-            - Se não houver absolutamente nenhuma informação relevante, responda "Informação não disponível no documento."
-
-            Resposta:
-            """
-            
-            logger.info(f"Enviando prompt para o modelo: {prompt[:200]}...")
-            answer = rag_chain(prompt, model, collection, llm_interface)
-            logger.info(f"Resposta obtida: {answer[:200]}...")
-            
-            answer = self.clean_and_validate_answer(answer)
-            answers.append(answer)
-            
-            context += f"\nPergunta: {question}\nResposta: {answer}\n"
-
-        formatted_result = self.format_results(self.questions, answers)
-        logger.info("Processo de FAQ sequencial concluído")
-        return formatted_result
+            metadata = first_doc['metadatas'][0]
+            tipo_processo = metadata.get('tipo_processo')
+            situacao = metadata.get('situacao')
+        else:
+            metadata = {}
+
+        answers = {}
+        for item in self.items:
+            if "metadata" in item and metadata.get(item["metadata"][0]):
+                answers[item["id"]] = item["metadata"][1].format(metadata[item["metadata"][0]])
+        return answers, tipo_processo, situacao
+
+    def _known_information(self, item, answers, tipo_processo, situacao):
+        # Vai no contexto, junto dos trechos recuperados; as instruções ficam só no template do llm_interface
+        dependencies = "".join(
+            f"\nPergunta: {self._items_by_id[dependency]['question']}\nResposta: {answers[dependency]}"
+            for dependency in item["depends_on"]
+        )
+        return f"Informações já identificadas no processo:\nTipo de processo: {tipo_processo}\nSituação: {situacao}{dependencies}"
+
+    @staticmethod
+    def _with_known_information(context, known_information):
+        return f"{context}\n\n{known_information}" if context else known_information
+
+    def _run(self, collection, model, ask: Callable[[Dict, Callable[[], str]], Iterator[str]], cancel_event=None) -> Iterator[Dict[str, str]]:
+        logger.info("Iniciando processo de FAQ")
+        cancel_event = cancel_event or threading.Event()
+        self._items_by_id = {item["id"]: item for item in self.items}
+
+        answers, tipo_processo, situacao = self._initial_answers(collection)
+        partial_answers = {}
+        if answers:
+            yield self._format(answers, partial_answers)
+
+        # A recuperação usa apenas o texto da pergunta e não espera as dependências.
+        # Perguntas cuja busca vetorial traz os mesmos chunks compartilham a seleção
+        # e a montagem do contexto
+        retrievals = {}
+        retrievals_lock = threading.Lock()
+
+        def retrieve(question):
+            results = search_chunks(question, collection)
+            chunk_ids = frozenset(results["ids"][0])
+            with retrievals_lock:
+                future = retrievals.get(chunk_ids)
+                owner = future is None
+                if owner:
+                    future = retrievals[chunk_ids] = Future()
+            if owner:
+                try:
+                    future.set_result(context_from_results(question, collection, model, results))
+                except Exception as e:
+                    future.set_exception(e)
+            return future.result()
+
+        updates = queue.Queue()
+        # Sinaliza às threads que o consumidor parou (gerador fechado, cancelamento
+        # ou falha de outra pergunta); cancel_event pertence a quem chamou e não é alterado
+        stop_event = threading.Event()
+
+        def stopped():
+            return cancel_event.is_set() or stop_event.is_set()
+
+        def execute(item, known_information):
+            try:
+                logger.info(f"Processando pergunta do FAQ: {item['id']}")
+                answer = ""
+                # A recuperação só é feita se a resposta não estiver no cache
+                fragments = ask(item, lambda: self._with_known_information(retrieve(item["question"]), known_information))
+                with span("faq_pergunta", pergunta=item["id"]):
+                    try:
+                        for answer in fragments:
+                            if stopped():
+                                break
+                            updates.put((item["id"], answer, False, None))
+                    finally:
+                        # Fechar o gerador encerra também o streaming do Ollama
+                        fragments.close()
+                logger.info(f"Resposta obtida para {item['id']}: {answer[:200]}...")
+                updates.put((item["id"], self.clean_and_validate_answer(answer), True, None))
+            except Exception as e:
+                updates.put((item["id"], None, True, e))
+
+        pending = [item for item in self.items if item["id"] not in answers]
+        running = set()
+        executor = ThreadPoolExecutor(max_workers=FAQ_MAX_WORKERS, thread_name_prefix="faq")
+
+        def submit_ready():
+            if stopped():
+                return
+            for item in list(pending):
+                if all(dependency in answers for dependency in item["depends_on"]):
+                    pending.remove(item)
+                    running.add(item["id"])
+                    # Cada pergunta leva uma cópia do contexto para manter o ID do trace nas threads
+                    executor.submit(contextvars.copy_context().run, execute, item, self._known_information(item, answers, tipo_processo, situacao))
+
+        try:
+            submit_ready()
+            while running:
+                item_id, answer, done, error = updates.get()
+                if error is not None:
+                    raise error
+                if cancel_event.is_set():
+                    logger.info("Processo de FAQ cancelado")
+                    return
+                if done:
+                    running.discard(item_id)
+                    partial_answers.pop(item_id, None)
+                    answers[item_id] = answer
+                    submit_ready()
+                else:
+                    partial_answers[item_id] = answer
+                yield self._format(answers, partial_answers)
+        finally:
+            # Não espera as gerações em andamento: elas param no próximo fragmento
+            stop_event.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        if pending:
+            raise ValueError(f"Dependências do FAQ não podem ser resolvidas: {[item['id'] for item in pending]}")
+        logger.info("Processo de FAQ concluído")
+
+    async def _run_async(self, collection, model, ask) -> AsyncIterator[Dict[str, str]]:
+        logger.info("Iniciando processo de FAQ assíncrono")
+        self._items_by_id = {item["id"]: item for item in self.items}
+        answers, tipo_processo, situacao = await asyncio.to_thread(self._initial_answers, collection)
+        partial_answers = {}
+        if answers:
+            yield self._format(answers, partial_answers)
+
+        # Recuperações compartilhadas entre perguntas com os mesmos chunks, como em _run
+        retrievals = {}
+
+        async def retrieve(question):
+            results = await search_chunks_async(question, collection)
+            chunk_ids = frozenset(results["ids"][0])
+            if chunk_ids not in retrievals:
+                retrievals[chunk_ids] = asyncio.ensure_future(
+                    asyncio.to_thread(context_from_results, question, collection, model, results)
+                )
+            return await retrievals[chunk_ids]
+
+        updates = asyncio.Queue()
+
+        async def execute(item, known_information):
+            async def get_context():
+                return self._with_known_information(await retrieve(item["question"]), known_information)
+
+            try:
+                logger.info(f"Processando pergunta do FAQ: {item['id']}")
+                answer = ""
+                fragments = ask(item, get_context)
+                with span("faq_pergunta", pergunta=item["id"]):
+                    try:
+                        async for answer in fragments:
+                            updates.put_nowait((item["id"], answer, False, None))
+                    finally:
+                        await fragments.aclose()
+                logger.info(f"Resposta obtida para {item['id']}: {answer[:200]}...")
+                updates.put_nowait((item["id"], self.clean_and_validate_answer(answer), True, None))
+            except Exception as e:
+                updates.put_nowait((item["id"], None, True, e))
+
+        pending = [item for item in self.items if item["id"] not in answers]
+        tasks = {}
+
+        def submit_ready():
+            for item in list(pending):
+                if all(dependency in answers for dependency in item["depends_on"]):
+                    pending.remove(item)
+                    tasks[item["id"]] = asyncio.ensure_future(execute(item, self._known_information(item, answers, tipo_processo, situacao)))
+
+        try:
+            submit_ready()
+            while tasks:
+                item_id, answer, done, error = await updates.get()
+                if error is not None:
+                    raise error
+                if done:
+                    tasks.pop(item_id)
+                    partial_answers.pop(item_id, None)
+                    answers[item_id] = answer
+                    submit_ready()
+                else:
+                    partial_answers[item_id] = answer
+                yield self._format(answers, partial_answers)
+        finally:
+            # Consumidor cancelado ou erro: interrompe as gerações em andamento
+            for task in list(tasks.values()) + list(retrievals.values()):
+                task.cancel()
+
+        if pending:
+            raise ValueError(f"Dependências do FAQ não podem ser resolvidas: {[item['id'] for item in pending]}")
+        logger.info("Processo de FAQ assíncrono concluído")
+
+    def _format(self, answers, partial_answers):
+        questions = []
+        current_answers = []
+        for item in self.items:
+            answer = answers.get(item["id"], partial_answers.get(item["id"]))
+            if answer is not None:
+                questions.append(item["question"])
+                current_answers.append(answer)
+        return self.format_results(questions, current_answers)
 
     def clean_and_validate_answer(self, answer: str) -> str:
         answer = answer.strip()
@@ -80,4 +313,4 @@ class FAQ:
 
     def format_results(self, questions: List[str], answers: List[str]) -> Dict[str, str]:
         formatted_qa = "\n\n".join([f"P: {q}\nR: {a}" for q, a in zip(questions, answers)])
-        return {"questions_and_answers": formatted_qa}
\ No newline at end of file
+        return {"questions_and_answers": formatted_qa}
@@ -0,0 +1,177 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import FAQ_RESULTS_DIR, FAQ_PRECOMPUTE_WORKERS, get_logger
+from faq import FAQ
+from metrics import iter_traced
+
+logger = get_logger(__name__)
+
+class FAQJob:
+    """FAQ sendo gerado em segundo plano para uma coleção. Consumidores podem
+    acompanhar os resultados parciais com iter_updates() ou aiter_updates()."""
+
+    def __init__(self, collection_name):
+        self.collection_name = collection_name
+        self.cancel_event = threading.Event()
+        self._condition = threading.Condition()
+        self._version = 0
+        # (loop, asyncio.Event) de cada consumidor assíncrono
+        self._async_waiters = set()
+        self.result = None
+        self.error = None
+        self.done = False
+
+    @property
+    def cancelled(self):
+        return self.cancel_event.is_set()
+
+    def _update(self, result=None, done=False, error=None):
+        with self._condition:
+            if result is not None:
+                self.result = result
+            self.error = error
+            self.done = done
+            self._version += 1
+            self._notify()
+
+    def cancel(self):
+        self.cancel_event.set()
+        with self._condition:
+            self._version += 1
+            self._notify()
+
+    def _notify(self):
+        # Chamado com self._condition adquirido
+        self._condition.notify_all()
+        for loop, event in list(self._async_waiters):
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # Event loop já encerrado
+                self._async_waiters.discard((loop, event))
+
+    def _snapshot(self, seen_version):
+        if self._version == seen_version:
+            return None
+        return self._version, self.result, self.done, self.error
+
+    def iter_updates(self):
+        """Gera o resultado parcial a cada mudança até o job terminar. Termina sem
+        erro se o job for cancelado; verifique `cancelled` depois de consumir."""
+        seen_version = -1
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._version != seen_version)
+                seen_version, result, done, error = self._snapshot(seen_version)
+            if error is not None:
+                raise error
+            if self.cancelled:
+                return
+            if result is not None:
+                yield result
+            if done:
+                return
+
+    async def aiter_updates(self):
+        """Versão assíncrona de iter_updates: espera as mudanças em um asyncio.Event,
+        sem ocupar uma thread por consumidor."""
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._condition:
+            self._async_waiters.add(waiter)
+        seen_version = -1
+        try:
+            while True:
+                with self._condition:
+                    snapshot = self._snapshot(seen_version)
+                    if snapshot is None:
+                        waiter[1].clear()
+                if snapshot is None:
+                    await waiter[1].wait()
+                    continue
+                seen_version, result, done, error = snapshot
+                if error is not None:
+                    raise error
+                if self.cancelled:
+                    return
+                if result is not None:
+                    yield result
+                if done:
+                    return
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=max(1, FAQ_PRECOMPUTE_WORKERS), thread_name_prefix="faq-precompute")
+
+def _result_path(collection_name):
+    return os.path.join(FAQ_RESULTS_DIR, f"{collection_name}.txt")
+
+def get_stored_faq(collection_name):
+    try:
+        with open(_result_path(collection_name), 'r', encoding='utf-8') as file:
+            return file.read()
+    except OSError:
+        return None
+
+def delete_stored_faq(collection_name):
+    if os.path.exists(_result_path(collection_name)):
+        os.remove(_result_path(collection_name))
+
+def _store_faq(collection_name, result):
+    temp_path = _result_path(collection_name) + ".tmp"
+    with open(temp_path, 'w', encoding='utf-8') as file:
+        file.write(result)
+    os.replace(temp_path, _result_path(collection_name))
+
+def _run_job(job, collection, model, llm_stream):
+    try:
+        if job.cancelled:
+            return
+        logger.info(f"Gerando FAQ em segundo plano para {job.collection_name}")
+        result = None
+        faq_stream = FAQ().stream_faq_answers(collection, model, llm_stream, cancel_event=job.cancel_event)
+        for faq_results in iter_traced("faq_segundo_plano", faq_stream):
+            result = faq_results['questions_and_answers']
+            job._update(result)
+
+        if job.cancelled:
+            logger.info(f"FAQ em segundo plano cancelado para {job.collection_name}")
+            return
+        _store_faq(job.collection_name, result or "")
+        job._update(result or "", done=True)
+        logger.info(f"FAQ em segundo plano concluído para {job.collection_name}")
+    except Exception as e:
+        # Inclui LLMStreamError: um FAQ com geração falha não é gravado e será gerado de novo
+        logger.error(f"Erro ao gerar FAQ em segundo plano: {str(e)}", exc_info=True)
+        job._update(done=True, error=e)
+    finally:
+        with _jobs_lock:
+            if _jobs.get(job.collection_name) is job:
+                del _jobs[job.collection_name]
+
+def start_faq_job(collection, model, llm_stream):
+    """Agenda a geração do FAQ da coleção, a menos que ele já esteja pronto ou em andamento."""
+    if get_stored_faq(collection.name) is not None:
+        return None
+    with _jobs_lock:
+        if collection.name in _jobs:
+            return _jobs[collection.name]
+        job = FAQJob(collection.name)
+        _jobs[collection.name] = job
+    _executor.submit(_run_job, job, collection, model, llm_stream)
+    return job
+
+def get_faq_job(collection_name):
+    with _jobs_lock:
+        return _jobs.get(collection_name)
+
+def cancel_faq_job(collection_name):
+    with _jobs_lock:
+        job = _jobs.pop(collection_name, None)
+    if job is not None:
+        logger.info(f"Cancelando FAQ em segundo plano de {collection_name}")
+        job.cancel()
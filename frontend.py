@@ -1,29 +1,41 @@
 import gradio as gr
-from config import get_logger
+from config import (
+    get_logger, SESSION_IDLE_SECONDS, INGEST_CONCURRENCY, CHAT_CONCURRENCY,
+    FAQ_CONCURRENCY, QUEUE_MAX_SIZE, DEFAULT_EXTRACTION_METHOD
+)
 from datetime import datetime
 
 logger = get_logger(__name__)
 
 def create_interface(
+    new_session,
     load_context_wrapper,
     answer_question_wrapper,
     process_faq_wrapper,
-    set_extraction_method
+    set_extraction_method,
+    close_session=None
 ):
+    """Cria a interface. Cada usuário tem sua sessão (new_session), que os
+    wrappers recebem como primeiro argumento."""
     logger.info("Criando interface Gradio")
 
-    chat_history = []
-
     with gr.Blocks(title="Processo Jurídico - Extrator Autos") as iface:
         gr.Markdown("# Processo Jurídico - Extrator Autos")
 
+        # Sessões ociosas por mais de SESSION_IDLE_SECONDS são descartadas
+        session_state = gr.State(
+            value=new_session,
+            time_to_live=SESSION_IDLE_SECONDS,
+            delete_callback=close_session
+        )
+
         with gr.Row():
             with gr.Column(scale=1):
                 pdf_input = gr.File(label="Upload de PDF")
                 extraction_method = gr.Radio(
-                    ["ocrmypdf", "pdf2image"],
+                    ["ocrmypdf", "pdf2image", "hybrid"],
                     label="Método de Extração",
-                    value="ocrmypdf"
+                    value=DEFAULT_EXTRACTION_METHOD
                 )
                 load_context_button = gr.Button("Processar Documento")
 
@@ -40,19 +52,18 @@ def create_interface(
             answer_output = gr.Textbox(label="Resposta", lines=10)
 
             chat_history_component = gr.Dataframe(
-                headers=["Pergunta", "Resposta", "Tempo de Resposta (s)"],
-                datatype=["str", "str", "number"],
+                headers=["Pergunta", "Resposta", "Tempo até 1º Token (s)", "Tempo de Resposta (s)"],
+                datatype=["str", "str", "number", "number"],
                 label="Histórico de Perguntas e Respostas",
-                value=chat_history
+                value=[]
             )
 
-        def process_load_context(pdf, method):
-            nonlocal chat_history
-            chat_history = []
-            set_extraction_method(method)
+        def process_load_context(pdf, method, session):
+            session["chat_history"] = []
+            set_extraction_method(session, method)
 
             try:
-                for result in load_context_wrapper(pdf):
+                for result in load_context_wrapper(session, pdf):
                     if not result["success"]:
                         yield (
                             result["status"],
@@ -61,7 +72,8 @@ def create_interface(
                             gr.update(visible=False),
                             gr.update(interactive=False),
                             gr.update(interactive=False),
-                            chat_history
+                            session["chat_history"],
+                            session
                         )
                     else:
                         yield (
@@ -71,7 +83,8 @@ def create_interface(
                             gr.update(visible=True),
                             gr.update(interactive=True),
                             gr.update(interactive=True),
-                            chat_history
+                            session["chat_history"],
+                            session
                         )
             except Exception as e:
                 logger.error(f"Erro durante o processamento: {str(e)}")
@@ -82,60 +95,81 @@ def create_interface(
                     gr.update(visible=False),
                     gr.update(interactive=False),
                     gr.update(interactive=False),
-                    chat_history
+                    session["chat_history"],
+                    session
                 )
 
-        def process_question(question):
-            nonlocal chat_history
+        async def process_question(question, session):
+            chat_history = session["chat_history"]
             start_time = datetime.now()
+            first_token_time = None
+            answer = ""
 
             try:
-                answer = answer_question_wrapper(question)
+                # answer_question_wrapper gera a resposta acumulada conforme os tokens chegam
+                async for answer in answer_question_wrapper(session, question):
+                    if first_token_time is None:
+                        first_token_time = datetime.now()
+                    yield answer, chat_history, session
+
                 end_time = datetime.now()
+                time_to_first_token = ((first_token_time or end_time) - start_time).total_seconds()
                 time_taken = (end_time - start_time).total_seconds()
 
-                chat_history.append([question, answer, round(time_taken, 2)])
+                chat_history.append([question, answer, round(time_to_first_token, 2), round(time_taken, 2)])
 
-                return answer, chat_history
+                yield answer, chat_history, session
             except Exception as e:
                 logger.error(f"Erro ao processar pergunta: {str(e)}")
-                return f"Erro ao processar pergunta: {str(e)}", chat_history
+                yield f"Erro ao processar pergunta: {str(e)}", chat_history, session
 
-        def process_faq():
+        async def process_faq(session):
             try:
-                faq_result = process_faq_wrapper()
-                return gr.update(value=faq_result, visible=True), gr.update(interactive=False), gr.update(interactive=False)
+                async for faq_result in process_faq_wrapper(session):
+                    yield gr.update(value=faq_result, visible=True), gr.update(interactive=False), gr.update(interactive=False)
             except Exception as e:
                 logger.error(f"Erro ao processar FAQ: {str(e)}")
-                return gr.update(value=f"Erro ao processar FAQ: {str(e)}", visible=True), gr.update(interactive=True), gr.update(interactive=True)
+                yield gr.update(value=f"Erro ao processar FAQ: {str(e)}", visible=True), gr.update(interactive=True), gr.update(interactive=True)
 
         def on_faq_completion(faq_result):
             return gr.update(interactive=True), gr.update(interactive=True)
 
         load_context_button.click(
             fn=process_load_context,
-            inputs=[pdf_input, extraction_method],
-            outputs=[context_status, load_context_button, faq_elements, chat_elements, faq_button, submit_question, chat_history_component]
+            inputs=[pdf_input, extraction_method, session_state],
+            outputs=[context_status, load_context_button, faq_elements, chat_elements, faq_button, submit_question, chat_history_component, session_state],
+            concurrency_limit=INGEST_CONCURRENCY,
+            concurrency_id="ingest"
         )
 
         submit_question.click(
             fn=process_question,
-            inputs=[question_input],
-            outputs=[answer_output, chat_history_component]
+            inputs=[question_input, session_state],
+            outputs=[answer_output, chat_history_component, session_state],
+            concurrency_limit=CHAT_CONCURRENCY,
+            concurrency_id="chat"
         )
 
         faq_button.click(
             fn=process_faq,
-            inputs=[],
-            outputs=[faq_result, submit_question, faq_button]
+            inputs=[session_state],
+            outputs=[faq_result, submit_question, faq_button],
+            concurrency_limit=FAQ_CONCURRENCY,
+            concurrency_id="faq"
         ).then(
             fn=on_faq_completion,
             inputs=[],
             outputs=[submit_question, faq_button]
         )
 
+    iface.queue(max_size=QUEUE_MAX_SIZE)
     return iface
 
-def launch_interface(iface):
+def launch_interface(iface, on_ready=None):
+    """Sobe o servidor e bloqueia a thread principal; on_ready é chamado assim
+    que o servidor passa a aceitar conexões."""
     logger.info("Lançando app Gradio")
-    iface.launch(server_name="0.0.0.0", debug=True, server_port=7863)
\ No newline at end of file
+    iface.launch(server_name="0.0.0.0", server_port=7863, prevent_thread_lock=True)
+    if on_ready:
+        on_ready()
+    iface.block_thread()
@@ -0,0 +1,158 @@
+import os
+import json
+import tempfile
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import (
+    JOBS_API_HOST, JOBS_API_PORT, JOBS_API_TOKEN, JOBS_MAX_UPLOAD_BYTES, JOB_WORKERS,
+    METRICS_PORT, DEFAULT_EXTRACTION_METHOD, get_logger
+)
+from ocr_engine import EXTRACTION_METHODS
+from document_jobs import submit_job, get_job, list_jobs, cancel_job, start_job_workers, ACTIVE_STATUSES
+from metrics import start_metrics_server
+
+logger = get_logger(__name__)
+
+MAX_LIST_LIMIT = 500
+
+def _public(job):
+    return {
+        "id": job["id"],
+        "filename": job["filename"],
+        "method": job["extraction_method"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": job["progress"],
+        "attempts": job["attempts"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "updated_at": job["updated_at"],
+        "stages": job["stages"],
+    }
+
+class _JobsHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        logger.debug(f"API de jobs: {format % args}")
+
+    def _send(self, status, payload):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authorized(self):
+        if JOBS_API_TOKEN and self.headers.get("Authorization") != f"Bearer {JOBS_API_TOKEN}":
+            self._send(401, {"error": "Token inválido ou ausente"})
+            return False
+        return True
+
+    def _route(self):
+        url = urlparse(self.path)
+        parts = [part for part in url.path.split("/") if part]
+        return parts, {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+    def _job_or_404(self, job_id):
+        job = get_job(job_id)
+        if job is None:
+            self._send(404, {"error": "Job não encontrado"})
+        return job
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts, query = self._route()
+        if parts == ["jobs"]:
+            limit = query.get("limit", "50")
+            if not limit.isdigit() or int(limit) < 1:
+                return self._send(400, {"error": f"Parâmetro limit inválido: {limit}"})
+            return self._send(200, {"jobs": list_jobs(query.get("status"), min(int(limit), MAX_LIST_LIMIT))})
+        if len(parts) in (2, 3) and parts[0] == "jobs":
+            job = self._job_or_404(parts[1])
+            if job is None:
+                return
+            if len(parts) == 2:
+                return self._send(200, _public(job))
+            if parts[2] == "result":
+                if job["status"] == "done":
+                    return self._send(200, {
+                        "id": job["id"], "collection": job["collection_name"],
+                        "tipo_processo": job["tipo_processo"], "situacao": job["situacao"],
+                    })
+                # 202 enquanto o job não terminou; 409 se terminou sem resultado
+                return self._send(202 if job["status"] in ACTIVE_STATUSES else 409, _public(job))
+        self._send(404, {"error": "Rota não encontrada"})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        parts, query = self._route()
+        if len(parts) == 3 and parts[0] == "jobs" and parts[2] == "cancel":
+            return self._cancel(parts[1])
+        if parts != ["jobs"]:
+            return self._send(404, {"error": "Rota não encontrada"})
+
+        method = query.get("method", DEFAULT_EXTRACTION_METHOD)
+        if method not in EXTRACTION_METHODS:
+            return self._send(400, {"error": f"Método de extração inválido: {method}"})
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length or length > JOBS_MAX_UPLOAD_BYTES:
+            return self._send(413 if length else 400, {"error": f"Envie o PDF no corpo da requisição (até {JOBS_MAX_UPLOAD_BYTES} bytes)"})
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, "upload.pdf")
+            remaining = length
+            with open(pdf_path, 'wb') as file:
+                while remaining:
+                    block = self.rfile.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        break
+                    file.write(block)
+                    remaining -= len(block)
+            with open(pdf_path, 'rb') as file:
+                if remaining or file.read(5) != b"%PDF-":
+                    return self._send(400, {"error": "O corpo da requisição não é um PDF completo"})
+            job_id = submit_job(pdf_path, method, filename=os.path.basename(query.get("filename", "documento.pdf")))
+        self._send(202, _public(get_job(job_id)))
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts, _ = self._route()
+        if len(parts) == 2 and parts[0] == "jobs":
+            return self._cancel(parts[1])
+        self._send(404, {"error": "Rota não encontrada"})
+
+    def _cancel(self, job_id):
+        job = self._job_or_404(job_id)
+        if job is None:
+            return
+        if not cancel_job(job_id):
+            return self._send(409, _public(job))
+        self._send(200, _public(get_job(job_id)))
+
+def start_jobs_api(port=JOBS_API_PORT, host=JOBS_API_HOST):
+    """Expõe a API em uma thread de fundo. Porta 0 desativa a API."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _JobsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="jobs-api", daemon=True).start()
+    logger.info(f"API de jobs disponível em http://{host}:{port}/jobs")
+    return server
+
+def main():
+    start_metrics_server(METRICS_PORT)
+    start_job_workers(JOB_WORKERS)
+    server = ThreadingHTTPServer((JOBS_API_HOST, JOBS_API_PORT), _JobsHandler)
+    server.daemon_threads = True
+    logger.info(f"API de jobs disponível em http://{JOBS_API_HOST}:{JOBS_API_PORT}/jobs")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import os
+import re
+import pickle
+import threading
+from collections import Counter
+import numpy as np
+from scipy import sparse
+from config import LEXICAL_INDEX_DIR, HYBRID_RRF_K, get_logger
+from case_classifier import normalize_text
+
+logger = get_logger(__name__)
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+# Palavras funcionais do português (já sem acentos) que não ajudam na busca
+STOPWORDS = frozenset("""
+a ao aos as ate com como da das de dela dele deles do dos e ela elas ele eles em entre era essa esse esta
+este eu foi for ha isso isto ja la lhe mais mas me mesmo meu minha muito na nas nao nem no nos nossa nosso
+o os ou para pela pelas pelo pelos por qual quando que quem se sem ser seu sua suas seus so sao sobre tambem
+te tem ter um uma umas uns voce foram sera seria sido sendo estao esta estava pois porque apos
+""".split())
+
+def tokenize(text):
+    return [token for token in _TOKEN_PATTERN.findall(normalize_text(text))
+            if len(token) > 1 and token not in STOPWORDS]
+
+class LexicalIndex:
+    """Índice BM25 de uma coleção, montado na ingestão. Os pesos dos documentos
+    ficam em uma matriz esparsa; pontuar uma consulta é um produto matriz-vetor."""
+
+    def __init__(self, ids, documents, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.documents = list(documents)
+        self.positions = {doc_id: i for i, doc_id in enumerate(self.ids)}
+        self.vocabulary = {}
+
+        rows, cols, term_frequencies = [], [], []
+        lengths = np.zeros(len(self.documents), dtype=np.float32)
+        for row, document in enumerate(self.documents):
+            counts = Counter(tokenize(document))
+            lengths[row] = sum(counts.values())
+            for term, count in counts.items():
+                rows.append(row)
+                cols.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                term_frequencies.append(count)
+
+        shape = (len(self.documents), len(self.vocabulary))
+        tf = sparse.csr_matrix((np.array(term_frequencies, dtype=np.float32), (rows, cols)), shape=shape)
+
+        document_frequency = np.bincount(tf.indices, minlength=shape[1]).astype(np.float32)
+        idf = np.log(1 + (shape[0] - document_frequency + 0.5) / (document_frequency + 0.5))
+        average_length = lengths.mean() if len(lengths) else 0.0
+
+        # tf * (k1 + 1) / (tf + k1 * (1 - b + b * |d| / avgdl)), multiplicado pelo idf do termo
+        norms = k1 * (1 - b + b * lengths / max(average_length, 1e-9))
+        weights = tf.copy()
+        row_norms = np.repeat(norms, np.diff(tf.indptr))
+        weights.data = tf.data * (k1 + 1) / (tf.data + row_norms) * idf[tf.indices]
+        self.weights = weights.tocsr()
+
+    def scores(self, query):
+        query_vector = np.zeros(len(self.vocabulary), dtype=np.float32)
+        for term, count in Counter(tokenize(query)).items():
+            column = self.vocabulary.get(term)
+            if column is not None:
+                query_vector[column] = count
+        return self.weights.dot(query_vector)
+
+    def search(self, query, top_k=10):
+        """Retorna as posições dos top_k documentos com pontuação positiva."""
+        scores = self.scores(query)
+        top_k = min(top_k, len(scores))
+        if top_k == 0:
+            return []
+        candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        ranked = candidates[np.argsort(-scores[candidates])]
+        return [int(i) for i in ranked if scores[i] > 0]
+
+    def hybrid_search(self, query, vector_ids, top_k=10, rrf_k=HYBRID_RRF_K):
+        """Combina o ranking vetorial do Chroma com o ranking BM25 por
+        Reciprocal Rank Fusion e retorna os textos dos chunks em ordem."""
+        fused = Counter()
+        for rank, doc_id in enumerate(vector_ids):
+            position = self.positions.get(doc_id)
+            if position is not None:
+                fused[position] += 1.0 / (rrf_k + rank + 1)
+        for rank, position in enumerate(self.search(query, top_k)):
+            fused[position] += 1.0 / (rrf_k + rank + 1)
+        return [self.documents[position] for position, _ in fused.most_common(top_k)]
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+def _index_path(collection_name):
+    return os.path.join(LEXICAL_INDEX_DIR, f"{collection_name}.pkl")
+
+def lexical_index_size(collection_name):
+    try:
+        return os.path.getsize(_index_path(collection_name))
+    except OSError:
+        return 0
+
+def build_lexical_index(collection_name, ids, documents):
+    index = LexicalIndex(ids, documents)
+    temp_path = _index_path(collection_name) + ".tmp"
+    with open(temp_path, 'wb') as file:
+        pickle.dump(index, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, _index_path(collection_name))
+    with _cache_lock:
+        _cache[collection_name] = index
+    logger.info(f"Índice léxico criado para {collection_name}: {len(ids)} chunks, {len(index.vocabulary)} termos")
+    return index
+
+def get_lexical_index(collection_name):
+    """Índice léxico da coleção (em memória ou carregado do disco), ou None se não existir."""
+    with _cache_lock:
+        if collection_name in _cache:
+            return _cache[collection_name]
+    try:
+        with open(_index_path(collection_name), 'rb') as file:
+            index = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError):
+        return None
+    with _cache_lock:
+        _cache[collection_name] = index
+    return index
+
+def delete_lexical_index(collection_name):
+    with _cache_lock:
+        _cache.pop(collection_name, None)
+    if os.path.exists(_index_path(collection_name)):
+        os.remove(_index_path(collection_name))
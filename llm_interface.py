@@ -1,44 +1,231 @@
-from config import OLLAMA_HOST, get_logger
-from ollama import Client
+import re
+import json
+import time
+import threading
+from collections import Counter
+from config import (
+    MODEL_VALIDATION, MODEL_CLASSIFICATION, MODEL_ANSWER, MODEL_FAQ, MODEL_ESCALATION, get_logger
+)
+import ollama_client
+from context_packer import record_prompt_tokens
+from case_classifier import normalize_text
+from metrics import span, record_llm_tokens, inc, observe
 
 logger = get_logger(__name__)
 
+class LLMStreamError(Exception):
+    """Falha do Ollama no meio de um streaming. A mensagem já vem pronta para o usuário."""
+
 MODEL_PROMPT = "gemma2:2b" # Respondeu o FAQ perfeitamente, 3 de 3.
 #MODEL_PROMPT = "gemma2:2b"
 #MODEL_PROMPT = "qwen2:1.5b"
 #MODEL_PROMPT = "qwen2:0.5b"
 
-def ollama_llm(question, context, model=MODEL_PROMPT):
-    logger.info(f"Chamando Ollama LLM com a pergunta: {question} usando o modelo: {model}")
-    
-    try:
-        ollama = Client(host=OLLAMA_HOST)
-        
-        prompt = f"""Instruções: Responda à pergunta com base no contexto fornecido. Responda sempre em português do Brasil.
+# Modelo de cada tarefa; validação e classificação podem usar um modelo pequeno e
+# escalam para ESCALATION_MODEL quando a saída não é um dos rótulos esperados
+MODEL_ROUTES = {
+    "validacao": MODEL_VALIDATION or MODEL_PROMPT,
+    "classificacao": MODEL_CLASSIFICATION or MODEL_PROMPT,
+    "resposta": MODEL_ANSWER or MODEL_PROMPT,
+    "faq": MODEL_FAQ or MODEL_PROMPT,
+}
+ESCALATION_MODEL = MODEL_ESCALATION or MODEL_PROMPT
+
+_routing_stats = Counter()
+_routing_lock = threading.Lock()
+
+SYSTEM_MESSAGE = 'Você é um assistente que responde exclusivamente em português do Brasil.'
+ANSWER_PREFIX = "Resposta em português do Brasil:"
+
+# Único template enviado ao modelo; o rag_engine fornece apenas o contexto já montado
+PROMPT_TEMPLATE = """Instruções: Responda à pergunta com base APENAS nas informações do contexto abaixo, sempre em português do Brasil.
+Se a informação necessária não estiver no contexto, diga claramente que não pode responder com base nas informações disponíveis.
+Não use conhecimentos externos. Seja claro e conciso e, quando apropriado, cite partes específicas do contexto.
 
-Contexto: {context}
+Contexto:
+{context}
 
 Pergunta: {question}
 
-Resposta em português do Brasil:"""
-        
-        response = ollama.chat(model=model, messages=[
-            {'role': 'system', 'content': 'Você é um assistente que responde exclusivamente em português do Brasil.'},
-            {'role': 'user', 'content': prompt}
-        ])
-        logger.info("Resposta recebida do Ollama LLM")
-        
-        full_response = response['message']['content']
-        answer_prefix = "Resposta em português do Brasil:"
-        if answer_prefix in full_response:
-            clean_response = full_response.split(answer_prefix)[-1].strip()
-        else:
-            clean_response = full_response.strip()
-        
-        return clean_response
+{answer_prefix}"""
+# Contexto vazio (nenhum trecho recuperado) continua passando pelo template
+EMPTY_CONTEXT = "(Nenhum trecho do documento foi encontrado para esta pergunta.)"
+
+def _prompt_messages(prompt):
+    return [
+        {'role': 'system', 'content': SYSTEM_MESSAGE},
+        {'role': 'user', 'content': prompt}
+    ]
+
+def _build_messages(question, context):
+    context = context if context and context.strip() else EMPTY_CONTEXT
+    return _prompt_messages(PROMPT_TEMPLATE.format(context=context, question=question, answer_prefix=ANSWER_PREFIX))
+
+def _record_usage(model, messages, response):
+    prompt_chars = sum(len(message['content']) for message in messages)
+    record_prompt_tokens(model, prompt_chars, response.get('prompt_eval_count'))
+    record_llm_tokens(model, response.get('prompt_eval_count'), response.get('eval_count'))
+
+def _preview(text, limit=80):
+    # Os prompts de validação e classificação trazem trechos do documento; só o início vai para o log
+    text = " ".join(text.split())
+    return text if len(text) <= limit else f"{text[:limit]}... ({len(text)} caracteres)"
+
+def _chat_text(messages, model):
+    with span("llm", model=model, mode="chat"):
+        response = ollama_client.chat(model=model, messages=messages)
+    logger.info("Resposta recebida do Ollama LLM")
+    _record_usage(model, messages, response)
+
+    full_response = response['message']['content']
+    if ANSWER_PREFIX in full_response:
+        return full_response.split(ANSWER_PREFIX)[-1].strip()
+    return full_response.strip()
+
+def ollama_llm(question, context, model=MODEL_PROMPT):
+    logger.info(f"Chamando Ollama LLM com a pergunta: {_preview(question)} usando o modelo: {model}")
+    try:
+        return _chat_text(_build_messages(question, context), model)
+    except Exception as e:
+        logger.error(f"Erro ao chamar Ollama LLM: {str(e)}", exc_info=True)
+        return f"Ocorreu um erro ao usar o Ollama: {str(e)}"
+
+def ollama_prompt(prompt, model=MODEL_PROMPT):
+    """Envia um prompt já completo (com as próprias instruções), sem o template do RAG."""
+    logger.info(f"Chamando Ollama LLM com o prompt: {_preview(prompt)} usando o modelo: {model}")
+    try:
+        return _chat_text(_prompt_messages(prompt), model)
     except Exception as e:
         logger.error(f"Erro ao chamar Ollama LLM: {str(e)}", exc_info=True)
         return f"Ocorreu um erro ao usar o Ollama: {str(e)}"
 
+def ollama_llm_stream(question, context, model=MODEL_PROMPT):
+    """Versão em streaming de ollama_llm: gera os fragmentos de texto conforme chegam."""
+    logger.info(f"Chamando Ollama LLM em streaming com a pergunta: {_preview(question)} usando o modelo: {model}")
+
+    try:
+        messages = _build_messages(question, context)
+        with span("llm", model=model, mode="stream"):
+            for chunk in ollama_client.chat_stream(model=model, messages=messages):
+                content = chunk['message']['content']
+                if content:
+                    yield content
+                if chunk.get('done'):
+                    _record_usage(model, messages, chunk)
+        logger.info("Streaming do Ollama LLM concluído")
+    except Exception as e:
+        logger.error(f"Erro ao chamar Ollama LLM: {str(e)}", exc_info=True)
+        # Levantada em vez de gerada como fragmento, para que a resposta não seja guardada
+        raise LLMStreamError(f"Ocorreu um erro ao usar o Ollama: {str(e)}") from e
+
+async def ollama_llm_stream_async(question, context, model=MODEL_PROMPT):
+    """Versão assíncrona de ollama_llm_stream. O cancelamento da tarefa não é
+    tratado como erro: ele se propaga e encerra o streaming no Ollama."""
+    logger.info(f"Chamando Ollama LLM em streaming assíncrono com a pergunta: {_preview(question)} usando o modelo: {model}")
+
+    try:
+        messages = _build_messages(question, context)
+        with span("llm", model=model, mode="stream_async"):
+            async for chunk in ollama_client.chat_stream_async(model=model, messages=messages):
+                content = chunk['message']['content']
+                if content:
+                    yield content
+                if chunk.get('done'):
+                    _record_usage(model, messages, chunk)
+        logger.info("Streaming assíncrono do Ollama LLM concluído")
+    except Exception as e:
+        logger.error(f"Erro ao chamar Ollama LLM: {str(e)}", exc_info=True)
+        raise LLMStreamError(f"Ocorreu um erro ao usar o Ollama: {str(e)}") from e
+
+def ollama_structured(prompt, schema, model=MODEL_PROMPT):
+    """Chamada ao Ollama com saída restrita a um JSON schema. Erros de
+    comunicação ou de parsing são propagados para que o chamador decida o fallback."""
+    logger.info(f"Chamando Ollama LLM com saída estruturada usando o modelo: {model}")
+    messages = _prompt_messages(prompt)
+    with span("llm", model=model, mode="structured"):
+        response = ollama_client.chat(model=model, format=schema, options={'temperature': 0}, messages=messages)
+    logger.info("Resposta estruturada recebida do Ollama LLM")
+    _record_usage(model, messages, response)
+    return json.loads(response['message']['content'])
+
+def model_for(task):
+    return MODEL_ROUTES[task]
+
+def _normalize_label(text):
+    return " ".join(re.sub(r"[^\w\s]", " ", normalize_text(text)).split())
+
+def match_label(response, labels):
+    """Rótulo de labels com que a resposta começa, ignorando maiúsculas, acentos
+    e pontuação (os rótulos mais longos são testados primeiro). None se nenhum."""
+    normalized = _normalize_label(response)
+    for label in sorted(labels, key=len, reverse=True):
+        expected = _normalize_label(label)
+        if normalized == expected or normalized.startswith(expected + " "):
+            return label
+    return None
+
+def _record_route(task, outcome):
+    with _routing_lock:
+        _routing_stats[f"{task}_{outcome}"] += 1
+    inc("exautos_llm_task_calls_total", help_text="Chamadas ao LLM por tarefa e desfecho (direto, escalado ou falha)", task=task, outcome=outcome)
+
+def run_routed(task, attempt):
+    """Executa attempt(model) no modelo da tarefa. Se a saída não for aceita
+    (attempt devolve None ou levanta exceção), repete uma vez no ESCALATION_MODEL.
+    Retorna None quando nenhum modelo produz uma saída válida."""
+    models = [MODEL_ROUTES[task]]
+    if ESCALATION_MODEL not in models:
+        models.append(ESCALATION_MODEL)
+
+    for attempt_number, model in enumerate(models):
+        start = time.perf_counter()
+        try:
+            result = attempt(model)
+            reason = "saida_invalida"
+        except Exception as e:
+            # ValueError inclui JSON inválido e valores fora das classes na saída estruturada
+            logger.warning(f"Falha na tarefa '{task}' com o modelo {model}: {e}")
+            result, reason = None, "saida_invalida" if isinstance(e, ValueError) else "erro"
+        observe("exautos_llm_task_duration_seconds", time.perf_counter() - start,
+                help_text="Duração de cada chamada ao LLM por tarefa e modelo", task=task, model=model)
+
+        if result is not None:
+            _record_route(task, "escalado" if attempt_number else "direto")
+            return result
+        if attempt_number + 1 < len(models):
+            with _routing_lock:
+                _routing_stats[f"{task}_escalacoes"] += 1
+            inc("exautos_llm_escalations_total", help_text="Chamadas repetidas no modelo maior por saída inválida ou erro",
+                task=task, model=model, reason=reason)
+            logger.info(f"Saída não aceita na tarefa '{task}' com o modelo {model} ({reason}); repetindo com {models[attempt_number + 1]}")
+
+    _record_route(task, "falha")
+    return None
+
+def ollama_llm_label(task, prompt, labels):
+    """Chamada com resposta restrita a um dos rótulos, roteada pelo modelo da tarefa.
+    Retorna (rótulo, resposta completa) ou (None, None) se nenhum modelo responder um rótulo válido."""
+    def attempt(model):
+        logger.info(f"Chamando Ollama LLM com o prompt: {_preview(prompt)} usando o modelo: {model}")
+        response = _chat_text(_prompt_messages(prompt), model)
+        label = match_label(response, labels)
+        return (label, response) if label else None
+
+    return run_routed(task, attempt) or (None, None)
+
+def get_routing_stats():
+    """Contadores por tarefa e taxa de escalonamento para o modelo maior."""
+    with _routing_lock:
+        stats = dict(_routing_stats)
+    for task in MODEL_ROUTES:
+        total = sum(stats.get(f"{task}_{outcome}", 0) for outcome in ("direto", "escalado", "falha"))
+        stats[f"{task}_escalation_rate"] = stats.get(f"{task}_escalacoes", 0) / total if total else 0.0
+    return stats
+
 def get_available_models():
-    return [MODEL_PROMPT]
\ No newline at end of file
+    """Modelos usados pelas rotas; o de escalonamento só entra se alguma tarefa
+    com rótulo estiver em outro modelo."""
+    models = set(MODEL_ROUTES.values())
+    if any(MODEL_ROUTES[task] != ESCALATION_MODEL for task in ("validacao", "classificacao")):
+        models.add(ESCALATION_MODEL)
+    return sorted(models)
\ No newline at end of file
@@ -1,43 +1,115 @@
-from config import get_logger
-from prompt_manager import load_context, answer_question, process_faq
-from llm_interface import ollama_llm, MODEL_PROMPT
-from frontend import create_interface, launch_interface
+import startup  # primeiro import: marca o início da contagem do relatório de inicialização
+import time
+import threading
+from config import (
+    get_logger, METRICS_PORT, COLLECTION_GC_ON_START, JOB_QUEUE_ENABLED, JOB_WORKERS, WARM_UP_MODELS,
+    DEFAULT_EXTRACTION_METHOD
+)
+from prompt_manager import load_context, answer_question_stream_async, process_faq_stream_async
+from llm_interface import ollama_llm_stream, ollama_llm_stream_async, model_for, get_available_models
+from faq_jobs import cancel_faq_job
+from embedding_manager import EMBEDDING_MODEL
+from metrics import start_metrics_server
+from document_cache import collect_garbage
+from document_jobs import submit_job, release_job, follow_job, start_job_workers
+from jobs_api import start_jobs_api
 
 logger = get_logger(__name__)
 
+def _load_context_job(session, source, extraction_method):
+    if not source:
+        yield {"status": "Por favor, faça upload de um PDF.", "success": False, "collection": None}
+        return
+    pdf_path = source if isinstance(source, str) else source.name
+    session["job_id"] = submit_job(pdf_path, extraction_method)
+    yield from follow_job(session["job_id"])
+
 def main():
+    startup.mark("imports")
     logger.info("Iniciando a aplicação")
+    start_metrics_server(METRICS_PORT)
+    if WARM_UP_MODELS:
+        startup.warm_up_in_background(get_available_models(), [EMBEDDING_MODEL])
+    if COLLECTION_GC_ON_START:
+        # Em segundo plano para não atrasar a subida da interface
+        threading.Thread(target=collect_garbage, name="coleta-de-lixo", daemon=True).start()
+    if JOB_QUEUE_ENABLED:
+        start_job_workers(JOB_WORKERS)
+        start_jobs_api()
+    startup.mark("api_de_jobs")
+
+    # O Gradio é o import mais pesado; fica aqui para que o aquecimento dos modelos
+    # e a API de jobs já estejam em andamento enquanto ele carrega
+    from frontend import create_interface, launch_interface
+
+    answer_model = model_for("resposta")
+    faq_model = model_for("faq")
 
-    collection = None
-    model = MODEL_PROMPT
-    extraction_method = "ocrmypdf"  # Padrão, pode ser alterado para "pdf2image"
+    # Estado de cada sessão de usuário (guardado pelo Gradio em um gr.State)
+    def new_session():
+        return {
+            "collection": None,
+            "extraction_method": DEFAULT_EXTRACTION_METHOD,  # Pode ser alterado para "ocrmypdf", "pdf2image" ou "hybrid"
+            "chat_history": [],
+            "job_id": None
+        }
 
-    def load_context_wrapper(*args):
-        nonlocal collection
-        for result in load_context(*args, extraction_method=extraction_method):
+    def load_context_wrapper(session, *args):
+        # Um novo documento torna obsoleto o FAQ em segundo plano do anterior
+        if session["collection"] is not None:
+            cancel_faq_job(session["collection"].name)
+            session["collection"] = None
+        # O job do upload anterior, se ainda estiver na fila, não ocupa mais um worker
+        if session.get("job_id"):
+            release_job(session.pop("job_id"))
+        if JOB_QUEUE_ENABLED:
+            # O upload vira um job da fila: se a conexão cair, o processamento continua
+            results = _load_context_job(session, *args, extraction_method=session["extraction_method"])
+        else:
+            results = load_context(*args, extraction_method=session["extraction_method"], faq_model=faq_model, faq_llm_stream=ollama_llm_stream)
+        start = time.perf_counter()
+        for result in results:
             if result["success"]:
-                collection = result["collection"]
+                session["collection"] = result["collection"]
+                startup.record_first("ingestao", time.perf_counter() - start)
             yield result
 
-    def answer_question_wrapper(question):
-        return answer_question(question, collection, model, ollama_llm)
+    # Perguntas e FAQ são assíncronos: enquanto esperam o Ollama não ocupam threads do Gradio
+    async def answer_question_wrapper(session, question):
+        start = time.perf_counter()
+        async for answer in answer_question_stream_async(question, session["collection"], answer_model, ollama_llm_stream_async):
+            startup.record_first("pergunta_primeiro_token", time.perf_counter() - start)
+            yield answer
+        startup.record_first("pergunta", time.perf_counter() - start)
 
-    def process_faq_wrapper():
-        return process_faq(collection, model, ollama_llm)
+    async def process_faq_wrapper(session):
+        async for faq_result in process_faq_stream_async(session["collection"], faq_model, ollama_llm_stream_async):
+            yield faq_result
 
-    def set_extraction_method(method):
-        nonlocal extraction_method
-        extraction_method = method
-        logger.info(f"Método de extração definido para: {extraction_method}")
+    def set_extraction_method(session, method):
+        session["extraction_method"] = method
+        logger.info(f"Método de extração definido para: {method}")
+
+    def close_session(session):
+        if session and session["collection"] is not None:
+            logger.info("Sessão expirada; liberando recursos")
+            cancel_faq_job(session["collection"].name)
 
     iface = create_interface(
+        new_session,
         load_context_wrapper,
         answer_question_wrapper,
         process_faq_wrapper,
-        set_extraction_method
+        set_extraction_method,
+        close_session
     )
+    startup.mark("interface")
+
+    def on_ready():
+        startup.mark("aceitando_conexoes")
+        startup.log_report()
 
-    launch_interface(iface)
+    launch_interface(iface, on_ready=on_ready)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,180 @@
+import time
+import uuid
+import asyncio
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import METRICS_SAMPLE_RATE, get_logger
+
+logger = get_logger(__name__)
+
+# Limites (em segundos) dos buckets do histograma de duração das etapas
+STAGE_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+_current_trace = contextvars.ContextVar("trace", default=None)
+_lock = threading.Lock()
+_counters = {}
+_gauges = {}
+_histograms = {}
+_help = {}
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+def inc(name, value=1, help_text="", **labels):
+    with _lock:
+        _help.setdefault(name, help_text)
+        series = _counters.setdefault(name, {})
+        series[_key(labels)] = series.get(_key(labels), 0) + value
+
+def set_gauge(name, value, help_text="", **labels):
+    with _lock:
+        _help.setdefault(name, help_text)
+        _gauges.setdefault(name, {})[_key(labels)] = value
+
+def observe(name, value, buckets=STAGE_BUCKETS, help_text="", **labels):
+    with _lock:
+        _help.setdefault(name, help_text)
+        series = _histograms.setdefault(name, (buckets, {}))[1]
+        state = series.get(_key(labels))
+        if state is None:
+            state = series[_key(labels)] = {"buckets": [0] * len(buckets), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(buckets):
+            if value <= bound:
+                state["buckets"][i] += 1
+        state["sum"] += value
+        state["count"] += 1
+
+def current_trace_id():
+    current = _current_trace.get()
+    return current["id"] if current else None
+
+@contextmanager
+def trace(kind, trace_id=None):
+    """Agrupa os spans de uma requisição ou documento sob um mesmo ID."""
+    current = {"id": trace_id or uuid.uuid4().hex[:12], "kind": kind, "sampled": random.random() < METRICS_SAMPLE_RATE}
+    token = _current_trace.set(current)
+    try:
+        yield current["id"]
+    finally:
+        _current_trace.reset(token)
+
+def iter_traced(kind, iterator, trace_id=None):
+    """Consome um gerador dentro de um trace próprio (o Gradio retoma cada passo em outra thread)."""
+    context = contextvars.copy_context()
+    context.run(_current_trace.set, {
+        "id": trace_id or uuid.uuid4().hex[:12], "kind": kind, "sampled": random.random() < METRICS_SAMPLE_RATE
+    })
+    try:
+        while True:
+            try:
+                item = context.run(next, iterator)
+            except StopIteration:
+                return
+            yield item
+    finally:
+        context.run(iterator.close)
+
+async def aiter_traced(kind, iterator, trace_id=None):
+    """Equivalente de iter_traced para geradores assíncronos: cada passo roda
+    em uma tarefa com o contexto do trace."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    context.run(_current_trace.set, {
+        "id": trace_id or uuid.uuid4().hex[:12], "kind": kind, "sampled": random.random() < METRICS_SAMPLE_RATE
+    })
+    try:
+        while True:
+            try:
+                item = await loop.create_task(iterator.__anext__(), context=context)
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        await loop.create_task(iterator.aclose(), context=context)
+
+@contextmanager
+def span(stage, **labels):
+    current = _current_trace.get()
+    sampled = current["sampled"] if current else random.random() < METRICS_SAMPLE_RATE
+    # Spans de traces não amostrados não medem nada
+    if not sampled:
+        yield
+        return
+
+    status = "ok"
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException as e:
+        # GeneratorExit e CancelledError indicam só que o consumidor parou de ler
+        # (streaming interrompido ou cliente desconectado)
+        status = "cancelled" if isinstance(e, (GeneratorExit, asyncio.CancelledError)) else "error"
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        observe("exautos_stage_duration_seconds", elapsed, help_text="Duração de cada etapa do pipeline", stage=stage, **labels)
+        if status != "ok":
+            inc("exautos_stage_failures_total", help_text="Etapas interrompidas por erro ou cancelamento", stage=stage, status=status)
+        logger.debug(f"[{current['id'] if current else '-'}] {stage}: {elapsed:.3f}s ({status})")
+
+def record_llm_tokens(model, prompt_tokens, completion_tokens):
+    if prompt_tokens:
+        inc("exautos_llm_prompt_tokens_total", prompt_tokens, help_text="Tokens de prompt avaliados pelo LLM", model=model)
+    if completion_tokens:
+        inc("exautos_llm_completion_tokens_total", completion_tokens, help_text="Tokens gerados pelo LLM", model=model)
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+def render():
+    """Métricas no formato de texto de exposição do Prometheus."""
+    lines = []
+    with _lock:
+        for name, series in sorted(_counters.items()):
+            lines += [f"# HELP {name} {_help.get(name, '')}", f"# TYPE {name} counter"]
+            lines += [f"{name}{_format_labels(key)} {value}" for key, value in series.items()]
+        for name, series in sorted(_gauges.items()):
+            lines += [f"# HELP {name} {_help.get(name, '')}", f"# TYPE {name} gauge"]
+            lines += [f"{name}{_format_labels(key)} {value}" for key, value in series.items()]
+        for name, (buckets, series) in sorted(_histograms.items()):
+            lines += [f"# HELP {name} {_help.get(name, '')}", f"# TYPE {name} histogram"]
+            for key, state in series.items():
+                for bound, count in zip(buckets, state["buckets"]):
+                    lines.append(f"{name}_bucket{_format_labels(key, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', '+Inf')])} {state['count']}")
+                lines.append(f"{name}_sum{_format_labels(key)} {state['sum']}")
+                lines.append(f"{name}_count{_format_labels(key)} {state['count']}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """Expõe /metrics em uma thread de fundo. Porta 0 desativa o endpoint."""
+    if not port:
+        return None
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    logger.info(f"Métricas disponíveis em http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,224 @@
+import os
+import json
+import shutil
+import threading
+import numpy as np
+from config import NUMPY_STORE_DIR, NUMPY_STORE_DTYPE, NUMPY_STORE_PERSIST, get_logger
+
+logger = get_logger(__name__)
+
+_COMPARISONS = {
+    "$gt": lambda value, operand: value > operand,
+    "$gte": lambda value, operand: value >= operand,
+    "$lt": lambda value, operand: value < operand,
+    "$lte": lambda value, operand: value <= operand,
+}
+
+def _matches(metadata, where):
+    """Subconjunto dos filtros 'where' do Chroma: igualdade, $eq, $ne, $gt, $gte,
+    $lt, $lte, $in, $nin e $and/$or."""
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "$and":
+            if not all(_matches(metadata, clause) for clause in condition):
+                return False
+        elif key == "$or":
+            if not any(_matches(metadata, clause) for clause in condition):
+                return False
+        elif isinstance(condition, dict):
+            value = metadata.get(key)
+            for operator, operand in condition.items():
+                if operator == "$eq" and value != operand:
+                    return False
+                if operator == "$ne" and value == operand:
+                    return False
+                if operator == "$in" and value not in operand:
+                    return False
+                if operator == "$nin" and value in operand:
+                    return False
+                if operator in _COMPARISONS and (value is None or not _COMPARISONS[operator](value, operand)):
+                    return False
+        elif metadata.get(key) != condition:
+            return False
+    return True
+
+class NumpyCollection:
+    """Coleção em memória com a interface add/query/get/count do Chroma; o top-k
+    é uma multiplicação matriz-vetor, sem HNSW."""
+
+    def __init__(self, name, embedding_function, dtype=NUMPY_STORE_DTYPE, persist=NUMPY_STORE_PERSIST):
+        self.name = name
+        self.embedding_function = embedding_function
+        self.dtype = np.dtype(dtype)
+        self.persist = persist
+        self.directory = os.path.join(NUMPY_STORE_DIR, name)
+        self._lock = threading.Lock()
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._positions = {}
+        self._matrix = None
+        self._squared_norms = None
+        # Registros adicionados desde a última gravação em disco (ver flush)
+        self._dirty = False
+
+    @classmethod
+    def load(cls, name, embedding_function):
+        collection = cls(name, embedding_function)
+        with open(os.path.join(collection.directory, "records.json"), 'r', encoding='utf-8') as file:
+            records = json.load(file)
+        collection._ids = records["ids"]
+        collection._documents = records["documents"]
+        collection._metadatas = records["metadatas"]
+        collection._positions = {doc_id: i for i, doc_id in enumerate(collection._ids)}
+        # Mapeado em memória: as páginas são carregadas sob demanda pelo sistema operacional
+        collection._matrix = np.load(os.path.join(collection.directory, "embeddings.npy"), mmap_mode='r')
+        collection.dtype = collection._matrix.dtype
+        collection._squared_norms = np.einsum('ij,ij->i', collection._matrix, collection._matrix, dtype=np.float32)
+        return collection
+
+    @staticmethod
+    def exists(name):
+        return os.path.exists(os.path.join(NUMPY_STORE_DIR, name, "records.json"))
+
+    @staticmethod
+    def list_names():
+        if not os.path.isdir(NUMPY_STORE_DIR):
+            return []
+        return sorted(name for name in os.listdir(NUMPY_STORE_DIR) if NumpyCollection.exists(name))
+
+    @staticmethod
+    def delete(name):
+        shutil.rmtree(os.path.join(NUMPY_STORE_DIR, name), ignore_errors=True)
+
+    def _save(self):
+        os.makedirs(self.directory, exist_ok=True)
+        matrix_path = os.path.join(self.directory, "embeddings.npy")
+        np.save(matrix_path + ".tmp.npy", np.asarray(self._matrix))
+        os.replace(matrix_path + ".tmp.npy", matrix_path)
+        records_path = os.path.join(self.directory, "records.json")
+        with open(records_path + ".tmp", 'w', encoding='utf-8') as file:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas}, file, ensure_ascii=False)
+        os.replace(records_path + ".tmp", records_path)
+        self._matrix = np.load(matrix_path, mmap_mode='r')
+
+    def count(self):
+        return len(self._ids)
+
+    def add(self, ids, documents=None, metadatas=None, embeddings=None):
+        if embeddings is None:
+            embeddings = self.embedding_function(documents)
+        new_rows = np.asarray(embeddings, dtype=self.dtype)
+        documents = documents if documents is not None else [None] * len(ids)
+        metadatas = metadatas if metadatas is not None else [None] * len(ids)
+
+        with self._lock:
+            duplicated = [doc_id for doc_id in ids if doc_id in self._positions]
+            if duplicated:
+                raise ValueError(f"IDs já existentes na coleção {self.name}: {duplicated[:5]}")
+
+            self._matrix = new_rows if self._matrix is None else np.concatenate([np.asarray(self._matrix), new_rows])
+            self._squared_norms = np.einsum('ij,ij->i', self._matrix, self._matrix, dtype=np.float32)
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._positions[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._documents.append(document)
+                self._metadatas.append(metadata)
+            # Gravar a matriz inteira a cada lote tornaria a ingestão quadrática; quem
+            # indexa chama flush() ao terminar o documento
+            self._dirty = self.persist
+
+    def flush(self):
+        with self._lock:
+            if self._dirty and self._matrix is not None:
+                self._save()
+            self._dirty = False
+
+    def remove(self, ids=None, where=None):
+        """Remove registros por ID e/ou filtro (equivale ao collection.delete do
+        Chroma; `delete` aqui remove a coleção inteira)."""
+        with self._lock:
+            if ids is None and not where:
+                return
+            keep = [
+                i for i, (doc_id, metadata) in enumerate(zip(self._ids, self._metadatas))
+                if not ((ids is None or doc_id in ids) and _matches(metadata or {}, where))
+            ]
+            if len(keep) == len(self._ids):
+                return
+            self._ids = [self._ids[i] for i in keep]
+            self._documents = [self._documents[i] for i in keep]
+            self._metadatas = [self._metadatas[i] for i in keep]
+            self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+            self._matrix = np.asarray(self._matrix)[keep] if keep else None
+            self._squared_norms = self._squared_norms[keep] if keep else None
+            if self.persist:
+                if keep:
+                    self._save()
+                else:
+                    NumpyCollection.delete(self.name)
+                self._dirty = False
+
+    def _select(self, where):
+        if not where:
+            return None
+        return np.array([i for i, metadata in enumerate(self._metadatas) if _matches(metadata or {}, where)], dtype=np.int64)
+
+    def query(self, query_embeddings=None, query_texts=None, n_results=10, where=None,
+              include=("documents", "metadatas", "distances")):
+        if query_embeddings is None:
+            query_embeddings = [self.embedding_function(text) for text in query_texts]
+        queries = np.asarray(query_embeddings, dtype=np.float32)
+
+        result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+        with self._lock:
+            if self._matrix is None:
+                for key in result:
+                    result[key] = [[] for _ in queries]
+                return result
+
+            candidates = self._select(where)
+            matrix = self._matrix if candidates is None else self._matrix[candidates]
+            squared_norms = self._squared_norms if candidates is None else self._squared_norms[candidates]
+
+            # Distância L2 ao quadrado (a métrica padrão do Chroma): |d|² - 2 q·d + |q|²
+            similarities = queries @ np.asarray(matrix, dtype=np.float32).T
+            distances = squared_norms[None, :] - 2 * similarities + np.einsum('ij,ij->i', queries, queries)[:, None]
+
+            k = min(n_results, distances.shape[1])
+            for row in distances:
+                if k == 0:
+                    top = np.array([], dtype=np.int64)
+                else:
+                    top = np.argpartition(row, k - 1)[:k]
+                    top = top[np.argsort(row[top])]
+                positions = top if candidates is None else candidates[top]
+                result["ids"].append([self._ids[i] for i in positions])
+                result["documents"].append([self._documents[i] for i in positions])
+                result["metadatas"].append([self._metadatas[i] for i in positions])
+                result["distances"].append([float(row[i]) for i in top])
+
+        return {key: value for key, value in result.items() if key == "ids" or key in include}
+
+    def get(self, ids=None, where=None, limit=None, offset=None, include=("documents", "metadatas")):
+        with self._lock:
+            if ids is not None:
+                positions = [self._positions[doc_id] for doc_id in ids if doc_id in self._positions]
+            else:
+                selected = self._select(where)
+                positions = list(range(len(self._ids))) if selected is None else selected.tolist()
+            if ids is not None and where:
+                positions = [i for i in positions if _matches(self._metadatas[i] or {}, where)]
+            positions = positions[offset or 0:]
+            if limit is not None:
+                positions = positions[:limit]
+
+            result = {"ids": [self._ids[i] for i in positions]}
+            if "documents" in include:
+                result["documents"] = [self._documents[i] for i in positions]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[i] for i in positions]
+            if "embeddings" in include:
+                result["embeddings"] = [np.asarray(self._matrix[i], dtype=np.float32).tolist() for i in positions]
+        return result
@@ -0,0 +1,184 @@
+import os
+import re
+import time
+import tempfile
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import PyPDF2
+from config import (
+    OCR_LANGUAGE, OCR_WORKERS, OCR_PAGES_IN_FLIGHT, PDF2IMAGE_DPI, PDF2IMAGE_GRAYSCALE,
+    HYBRID_OCR_METHOD, DEFAULT_EXTRACTION_METHOD,
+    TEXT_LAYER_MIN_CHARS, TEXT_LAYER_MIN_VALID_RATIO, get_logger
+)
+
+logger = get_logger(__name__)
+
+EXTRACTION_METHODS = ['ocrmypdf', 'pdf2image', 'hybrid']
+
+# Caracteres comuns em peças jurídicas além de letras, dígitos e espaços
+_VALID_PUNCTUATION = set(".,;:!?()[]-–—/\\\"'%$§ºª°*@&+=<>|_")
+_WORD_PATTERN = re.compile(r"\S+")
+_CID_PATTERN = re.compile(r"\(cid:\d+\)")
+
+def get_page_count(pdf_path):
+    with open(pdf_path, 'rb') as file:
+        return len(PyPDF2.PdfReader(file).pages)
+
+# ocrmypdf, pdf2image e pytesseract são importados no primeiro uso (nos processos
+# de OCR), para não pesar na subida da aplicação
+def _ocr_page_ocrmypdf(pdf_path, page_number, force_ocr=False):
+    import ocrmypdf
+
+    start = time.perf_counter()
+    with open(pdf_path, 'rb') as file:
+        writer = PyPDF2.PdfWriter()
+        writer.add_page(PyPDF2.PdfReader(file).pages[page_number - 1])
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            page_path = os.path.join(temp_dir, "page.pdf")
+            output_path = os.path.join(temp_dir, "page_ocr.pdf")
+            with open(page_path, 'wb') as page_file:
+                writer.write(page_file)
+
+            # jobs=1: o paralelismo é feito entre páginas, não dentro do ocrmypdf
+            ocrmypdf.ocr(page_path, output_path, language=OCR_LANGUAGE, jobs=1,
+                         progress_bar=False, force_ocr=force_ocr)
+
+            with open(output_path, 'rb') as output_file:
+                text = PyPDF2.PdfReader(output_file).pages[0].extract_text() or ""
+
+    return {"page": page_number, "text": text, "seconds": time.perf_counter() - start, "source": "ocr"}
+
+def _ocr_page_pdf2image(pdf_path, page_number):
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    start = time.perf_counter()
+    # A página é renderizada em um arquivo temporário e o tesseract lê do disco,
+    # então nenhum bitmap fica na memória do processo
+    with tempfile.TemporaryDirectory() as temp_dir:
+        image_paths = convert_from_path(
+            pdf_path, dpi=PDF2IMAGE_DPI, first_page=page_number, last_page=page_number,
+            grayscale=PDF2IMAGE_GRAYSCALE, fmt='png', output_folder=temp_dir, paths_only=True
+        )
+        text = "".join(pytesseract.image_to_string(image_path, lang=OCR_LANGUAGE) for image_path in image_paths)
+    return {"page": page_number, "text": text, "seconds": time.perf_counter() - start, "source": "ocr"}
+
+PAGE_EXTRACTORS = {
+    'ocrmypdf': _ocr_page_ocrmypdf,
+    'pdf2image': _ocr_page_pdf2image,
+}
+
+def has_usable_text(text):
+    """Indica se o texto nativo de uma página é bom o suficiente para dispensar OCR."""
+    stripped = _CID_PATTERN.sub("�", text or "").strip()
+    if len(stripped) < TEXT_LAYER_MIN_CHARS:
+        return False
+
+    valid_chars = sum(1 for c in stripped if c.isalnum() or c.isspace() or c in _VALID_PUNCTUATION)
+    if valid_chars / len(stripped) < TEXT_LAYER_MIN_VALID_RATIO:
+        return False
+
+    # Camadas de texto corrompidas costumam gerar "palavras" sem nenhuma letra
+    words = _WORD_PATTERN.findall(stripped)
+    words_with_letters = sum(1 for word in words if any(c.isalpha() for c in word))
+    return words_with_letters / len(words) >= TEXT_LAYER_MIN_VALID_RATIO
+
+def extract_text_layer(pdf_path):
+    pages = []
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        for page_number, page in enumerate(reader.pages, start=1):
+            start = time.perf_counter()
+            try:
+                text = page.extract_text() or ""
+            except Exception as e:
+                logger.warning(f"Falha ao ler a camada de texto da página {page_number}: {e}")
+                text = ""
+            pages.append({"page": page_number, "text": text, "seconds": time.perf_counter() - start, "source": "text_layer"})
+    return pages
+
+def _iter_extractor(extractor, pdf_path, page_numbers, workers):
+    """Gera os resultados das páginas conforme ficam prontos (fora de ordem)."""
+    if not page_numbers:
+        return
+    workers = max(1, min(workers, len(page_numbers)))
+    if workers == 1:
+        for page_number in page_numbers:
+            yield extractor(pdf_path, page_number)
+        return
+
+    # Janela de páginas em andamento: documentos longos não enfileiram todas as
+    # páginas de uma vez e o consumo de memória não cresce com o tamanho do PDF
+    window = max(workers, OCR_PAGES_IN_FLIGHT or 2 * workers)
+    remaining = iter(page_numbers)
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        in_flight = set()
+        for page_number in remaining:
+            in_flight.add(executor.submit(extractor, pdf_path, page_number))
+            if len(in_flight) >= window:
+                break
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+                next_page = next(remaining, None)
+                if next_page is not None:
+                    in_flight.add(executor.submit(extractor, pdf_path, next_page))
+    finally:
+        # Se o consumidor parar antes do fim, as páginas ainda não iniciadas são descartadas
+        executor.shutdown(cancel_futures=True)
+
+def iter_pages(pdf_path, method=DEFAULT_EXTRACTION_METHOD, workers=None):
+    """Gera as páginas ({"page", "text", "seconds", "source"}) em ordem, assim que
+    cada uma fica pronta. No 'hybrid' só as páginas sem texto aproveitável passam por OCR."""
+    if method not in EXTRACTION_METHODS:
+        raise ValueError("Método de extração inválido")
+    workers = workers or OCR_WORKERS
+
+    if method == 'hybrid':
+        text_pages = extract_text_layer(pdf_path)
+        page_count = len(text_pages)
+        ready = {page["page"]: page for page in text_pages if has_usable_text(page["text"])}
+        ocr_page_numbers = [page["page"] for page in text_pages if page["page"] not in ready]
+        logger.info(f"Modo híbrido: {len(ready)} de {page_count} páginas com camada de texto aproveitável")
+
+        extractor = PAGE_EXTRACTORS[HYBRID_OCR_METHOD]
+        if HYBRID_OCR_METHOD == 'ocrmypdf':
+            # Páginas com texto corrompido precisam ser rasterizadas novamente
+            extractor = partial(_ocr_page_ocrmypdf, force_ocr=True)
+    else:
+        page_count = get_page_count(pdf_path)
+        logger.info(f"Extraindo {page_count} páginas com o método {method}")
+        ready = {}
+        ocr_page_numbers = list(range(1, page_count + 1))
+        extractor = PAGE_EXTRACTORS[method]
+
+    next_page = 1
+    while next_page in ready:
+        yield ready.pop(next_page)
+        next_page += 1
+    for result in _iter_extractor(extractor, pdf_path, ocr_page_numbers, workers):
+        ready[result["page"]] = result
+        while next_page in ready:
+            yield ready.pop(next_page)
+            next_page += 1
+
+def extract_pages(pdf_path, method=DEFAULT_EXTRACTION_METHOD, workers=None):
+    """Extrai o texto de cada página em paralelo, preservando a ordem das páginas.
+
+    Retorna uma lista de dicts {"page", "text", "seconds", "source"}, um por página.
+    """
+    start = time.perf_counter()
+    pages = list(iter_pages(pdf_path, method=method, workers=workers))
+    if not pages:
+        return []
+
+    for page in pages:
+        logger.debug(f"Página {page['page']} ({page['source']}): {page['seconds']:.2f}s, {len(page['text'])} caracteres")
+    total = time.perf_counter() - start
+    slowest = max(pages, key=lambda page: page["seconds"])
+    logger.info(f"Extração concluída em {total:.2f}s ({len(pages) / max(total, 1e-9):.2f} páginas/s, página mais lenta: {slowest['page']} com {slowest['seconds']:.2f}s)")
+
+    return pages
@@ -0,0 +1,233 @@
+import time
+import asyncio
+import threading
+import weakref
+from collections import deque
+import httpx
+from config import (
+    OLLAMA_HOST, OLLAMA_CONNECT_TIMEOUT, OLLAMA_CHAT_TIMEOUT, OLLAMA_EMBED_TIMEOUT,
+    OLLAMA_MAX_RETRIES, OLLAMA_RETRY_BACKOFF, OLLAMA_KEEP_ALIVE, OLLAMA_MAX_CONCURRENCY,
+    get_logger
+)
+
+logger = get_logger(__name__)
+
+OPERATION_TIMEOUTS = {
+    'chat': OLLAMA_CHAT_TIMEOUT,
+    'embed': OLLAMA_EMBED_TIMEOUT,
+}
+
+class ConcurrencyLimiter:
+    """Semáforo compartilhado entre threads e corrotinas, em ordem de chegada.
+    Uma corrotina esperando uma vaga não ocupa nenhuma thread."""
+
+    def __init__(self, limit):
+        self._available = limit
+        self._lock = threading.Lock()
+        # (threading.Event, None) para threads; (asyncio.Future, loop) para corrotinas
+        self._waiters = deque()
+
+    def acquire(self):
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            event = threading.Event()
+            self._waiters.append((event, None))
+        event.wait()
+
+    async def acquire_async(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if self._available > 0 and not self._waiters:
+                self._available -= 1
+                return
+            waiter = (loop.create_future(), loop)
+            self._waiters.append(waiter)
+        try:
+            await waiter[0]
+        except asyncio.CancelledError:
+            with self._lock:
+                granted = waiter not in self._waiters
+                if not granted:
+                    self._waiters.remove(waiter)
+            # Se a vaga já tinha sido entregue, devolve (quando o future foi
+            # cancelado antes da entrega, _grant faz isso)
+            if granted and waiter[0].done() and not waiter[0].cancelled():
+                self.release()
+            raise
+
+    def _grant(self, future):
+        if future.cancelled():
+            self.release()
+        else:
+            future.set_result(None)
+
+    def release(self):
+        with self._lock:
+            if not self._waiters:
+                self._available += 1
+                return
+            waiter, loop = self._waiters.popleft()
+        if loop is None:
+            waiter.set()
+        else:
+            loop.call_soon_threadsafe(self._grant, waiter)
+
+    def __enter__(self):
+        self.acquire()
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self):
+        await self.acquire_async()
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+_clients = {}
+_clients_lock = threading.Lock()
+# Clientes assíncronos por event loop (o pool de conexões do httpx pertence ao loop)
+_async_clients = weakref.WeakKeyDictionary()
+# Limita as requisições em andamento ao host Ollama, somando todas as operações
+# dos caminhos síncrono e assíncrono
+_in_flight = ConcurrencyLimiter(OLLAMA_MAX_CONCURRENCY)
+
+def _client_options(operation):
+    return {
+        "host": OLLAMA_HOST,
+        "timeout": httpx.Timeout(OPERATION_TIMEOUTS[operation], connect=OLLAMA_CONNECT_TIMEOUT),
+        "limits": httpx.Limits(max_connections=OLLAMA_MAX_CONCURRENCY, max_keepalive_connections=OLLAMA_MAX_CONCURRENCY),
+    }
+
+def get_client(operation):
+    """Cliente Ollama compartilhado por operação. Cada cliente mantém seu
+    próprio pool de conexões HTTP com keep-alive e o timeout da operação."""
+    with _clients_lock:
+        if operation not in _clients:
+            # O pacote ollama (pydantic) é importado no primeiro uso
+            from ollama import Client
+            _clients[operation] = Client(**_client_options(operation))
+        return _clients[operation]
+
+def get_async_client(operation):
+    """Equivalente de get_client para o event loop em execução."""
+    loop_clients = _async_clients.setdefault(asyncio.get_running_loop(), {})
+    if operation not in loop_clients:
+        from ollama import AsyncClient
+        loop_clients[operation] = AsyncClient(**_client_options(operation))
+    return loop_clients[operation]
+
+def _is_retryable(error):
+    from ollama import ResponseError
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500
+    return isinstance(error, (httpx.TransportError, httpx.TimeoutException))
+
+def _retry_delay(operation, attempt, error):
+    if attempt >= OLLAMA_MAX_RETRIES or not _is_retryable(error):
+        return None
+    delay = OLLAMA_RETRY_BACKOFF * (2 ** attempt)
+    logger.warning(f"Falha na operação '{operation}' do Ollama ({error}); tentativa {attempt + 1} de {OLLAMA_MAX_RETRIES} em {delay:.1f}s")
+    return delay
+
+def _retry(operation, call):
+    attempt = 0
+    while True:
+        try:
+            return call(get_client(operation))
+        except Exception as e:
+            delay = _retry_delay(operation, attempt, e)
+            if delay is None:
+                raise
+            attempt += 1
+            time.sleep(delay)
+
+def _call_with_retry(operation, call):
+    def guarded_call(client):
+        with _in_flight:
+            return call(client)
+    return _retry(operation, guarded_call)
+
+def chat(model, messages, **kwargs):
+    return _call_with_retry('chat', lambda client: client.chat(
+        model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs
+    ))
+
+def embed(model, text):
+    response = _call_with_retry('embed', lambda client: client.embeddings(
+        model=model, prompt=text, keep_alive=OLLAMA_KEEP_ALIVE
+    ))
+    return response['embedding']
+
+def warm_up(model, operation):
+    """Carrega o modelo na memória do Ollama sem gerar nada: uma requisição
+    vazia com keep_alive, como indicado na documentação da API."""
+    if operation == 'embed':
+        _call_with_retry('embed', lambda client: client.embeddings(model=model, prompt="", keep_alive=OLLAMA_KEEP_ALIVE))
+    else:
+        _call_with_retry('chat', lambda client: client.chat(model=model, messages=[], keep_alive=OLLAMA_KEEP_ALIVE))
+
+def chat_stream(model, messages, **kwargs):
+    """Gera os fragmentos da resposta conforme chegam. As novas tentativas só
+    acontecem antes do primeiro fragmento; a vaga de concorrência fica ocupada
+    até o fim do streaming (ou até o gerador ser fechado)."""
+    with _in_flight:
+        def open_stream(client):
+            stream = client.chat(model=model, messages=messages, stream=True, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs)
+            return stream, next(stream, None)
+
+        stream, first_chunk = _retry('chat', open_stream)
+        if first_chunk is not None:
+            yield first_chunk
+        yield from stream
+
+async def _retry_async(operation, call):
+    attempt = 0
+    while True:
+        try:
+            return await call(get_async_client(operation))
+        except Exception as e:
+            delay = _retry_delay(operation, attempt, e)
+            if delay is None:
+                raise
+            attempt += 1
+            await asyncio.sleep(delay)
+
+async def _call_with_retry_async(operation, call):
+    async def guarded_call(client):
+        async with _in_flight:
+            return await call(client)
+    return await _retry_async(operation, guarded_call)
+
+async def chat_async(model, messages, **kwargs):
+    return await _call_with_retry_async('chat', lambda client: client.chat(
+        model=model, messages=messages, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs
+    ))
+
+async def embed_async(model, text):
+    response = await _call_with_retry_async('embed', lambda client: client.embeddings(
+        model=model, prompt=text, keep_alive=OLLAMA_KEEP_ALIVE
+    ))
+    return response['embedding']
+
+async def chat_stream_async(model, messages, **kwargs):
+    """Versão assíncrona de chat_stream. Se a tarefa for cancelada (cliente
+    desconectado), a conexão com o Ollama é fechada e a geração interrompida."""
+    async with _in_flight:
+        async def open_stream(client):
+            stream = await client.chat(model=model, messages=messages, stream=True, keep_alive=OLLAMA_KEEP_ALIVE, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+
+        stream, first_chunk = await _retry_async('chat', open_stream)
+        try:
+            if first_chunk is not None:
+                yield first_chunk
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
@@ -1,23 +1,106 @@
-from datetime import datetime
 import os
-from config import get_logger
-from document_processor import load_and_split_document
+import asyncio
+from config import (
+    get_logger, DOCUMENT_CACHE_ENABLED, FAQ_PRECOMPUTE, INGEST_INCREMENTAL,
+    INCREMENTAL_ANALYSIS_PAGES, INCREMENTAL_UNLOCK_PAGES, INCREMENTAL_BATCH_PAGES, DEFAULT_EXTRACTION_METHOD
+)
+from document_processor import (
+    load_and_split_document, extract_text_from_pdf, analyze_document,
+    split_documents, rejection_message
+)
+from ocr_engine import iter_pages, get_page_count
 from embedding_manager import create_embeddings
-from chroma_manager import create_collection
-from rag_engine import rag_chain
+from document_store import new_document_collection, open_document_collection, persist_document
+from document_cache import compute_cache_key, get_cached_document, put_cached_document
+from rag_engine import rag_chain, rag_chain_stream, rag_chain_stream_async
+from llm_interface import LLMStreamError
+from lexical_index import build_lexical_index
+from answer_cache import get_cached_answer, put_cached_answer
 from faq import FAQ
+from faq_jobs import start_faq_job, get_faq_job, get_stored_faq
+from metrics import span, trace, iter_traced, aiter_traced, current_trace_id
 import uuid
 
 logger = get_logger(__name__)
 
-def load_context(source, extraction_method='ocrmypdf'):
+def find_cached_document(pdf_path, extraction_method):
+    """Consulta o cache de documentos; retorna (cache_key, collection, text, classification)."""
+    if not DOCUMENT_CACHE_ENABLED:
+        return None, None, None, None
+
+    cache_key = compute_cache_key(pdf_path, extraction_method)
+    cached = get_cached_document(cache_key)
+    if not cached:
+        return cache_key, None, None, None
+
+    collection = open_document_collection(cached["collection_name"])
+    if collection is not None and collection.count() > 0:
+        logger.info(f"Documento encontrado no cache: {cached['collection_name']}")
+        return cache_key, collection, cached["text"], None
+    # A coleção foi perdida, mas o texto e a classificação evitam refazer o OCR e o LLM
+    classification = (cached["tipo_processo"], cached["situacao"]) if cached.get("tipo_processo") and cached.get("situacao") else None
+    return cache_key, None, cached["text"], classification
+
+def _add_splits(collection, splits):
+    ids = [str(uuid.uuid4()) for _ in splits]
+    documents = [split.page_content for split in splits]
+    # Os embeddings são calculados aqui para separar o tempo do Ollama do tempo de escrita na coleção
+    with span("embeddings"):
+        embeddings = create_embeddings()(documents)
+    with span("gravacao_vetores"):
+        collection.add(
+            documents=documents,
+            metadatas=[split.metadata for split in splits],
+            embeddings=embeddings,
+            ids=ids
+        )
+    return ids, documents
+
+def index_document(splits, text, cache_key=None):
+    """Cria a coleção com os embeddings dos splits, o índice léxico e a entrada no cache."""
+    collection = new_document_collection()
+    collection_name = collection.name
+
+    ids, documents = _add_splits(collection, splits)
+    with span("gravacao_vetores"):
+        persist_document(collection)
+    with span("indice_lexico"):
+        build_lexical_index(collection_name, ids, documents)
+
+    if cache_key:
+        metadata = splits[0].metadata
+        put_cached_document(cache_key, collection_name, text, metadata.get("tipo_processo"), metadata.get("situacao"))
+
+    return collection
+
+def load_context(source, extraction_method=DEFAULT_EXTRACTION_METHOD, faq_model=None, faq_llm_stream=None):
+    """Processa o documento e cria a coleção. Se faq_model e faq_llm_stream forem
+    informados (e FAQ_PRECOMPUTE estiver ativo), o FAQ começa a ser gerado em
+    segundo plano assim que a coleção fica pronta."""
+    yield from iter_traced("ingestao", _load_context(source, extraction_method, faq_model, faq_llm_stream))
+
+def _load_context(source, extraction_method, faq_model, faq_llm_stream):
     if not source:
         yield {"status": "Por favor, faça upload de um PDF.", "success": False, "collection": None}
         return
 
     try:
+        pdf_path = source if isinstance(source, str) else source.name
+        logger.info(f"[{current_trace_id()}] Ingestão de {os.path.basename(pdf_path)} com o método {extraction_method}")
+        cache_key, collection, text, classification = find_cached_document(pdf_path, extraction_method)
+        if collection is not None:
+            _start_faq_precompute(collection, faq_model, faq_llm_stream)
+            yield {"status": "Documento já processado anteriormente. Pronto para perguntas!", "success": True, "collection": collection}
+            return
+
+        if text is None and INGEST_INCREMENTAL:
+            yield from index_document_incremental(pdf_path, extraction_method, cache_key, faq_model, faq_llm_stream)
+            return
+
         yield {"status": "Iniciando carregamento e validação do documento...", "success": False, "collection": None}
-        splits, error_message = load_and_split_document(source, extraction_method=extraction_method)
+        if text is None:
+            text = extract_text_from_pdf(pdf_path, method=extraction_method)
+        splits, error_message = load_and_split_document(source, extraction_method=extraction_method, text=text, classification=classification)
         if error_message:
             yield {"status": error_message, "success": False, "collection": None}
             return
@@ -26,18 +109,10 @@ def load_context(source, extraction_method='ocrmypdf'):
             yield {"status": "O documento está fora do contexto esperado!", "success": False, "collection": None}
             return
 
-        yield {"status": "Documento validado. Criando embeddings...", "success": False, "collection": None}
-        embeddings = create_embeddings()
-        collection_name = f"collection_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-        collection = create_collection(collection_name, embeddings)
+        yield {"status": "Documento validado. Criando embeddings e adicionando documentos à coleção...", "success": False, "collection": None}
+        collection = index_document(splits, text, cache_key)
 
-        yield {"status": "Embeddings criados. Adicionando documentos à coleção...", "success": False, "collection": None}
-        ids = [str(uuid.uuid4()) for _ in splits]
-        collection.add(
-            documents=[split.page_content for split in splits],
-            metadatas=[split.metadata for split in splits],
-            ids=ids
-        )
+        _start_faq_precompute(collection, faq_model, faq_llm_stream)
 
         final_status = f"Contexto criado com sucesso. Pronto para perguntas!"
         yield {"status": final_status, "success": True, "collection": collection}
@@ -45,25 +120,238 @@ def load_context(source, extraction_method='ocrmypdf'):
         logger.error(f"Erro ao processar documento: {str(e)}", exc_info=True)
         yield {"status": f"Ocorreu um erro ao processar o documento: {str(e)}", "success": False, "collection": None}
 
+def index_document_incremental(pdf_path, extraction_method, cache_key=None, faq_model=None, faq_llm_stream=None):
+    """Indexa as páginas conforme saem do OCR; o chat é liberado (success=True)
+    quando INCREMENTAL_UNLOCK_PAGES páginas estão na coleção."""
+    page_count = get_page_count(pdf_path)
+    yield {"status": f"Iniciando extração incremental de {page_count} páginas...", "success": False, "collection": None}
+
+    pages = iter_pages(pdf_path, method=extraction_method)
+    try:
+        texts = []
+        pending = []
+        for page in pages:
+            texts.append(page["text"])
+            pending.append(page)
+            # Páginas em branco no início não contam para a amostra da análise
+            if len(texts) >= INCREMENTAL_ANALYSIS_PAGES and "".join(texts).strip():
+                break
+
+        sample = "".join(texts)
+        if not sample.strip():
+            yield {"status": "Não foi possível extrair texto do PDF.", "success": False, "collection": None}
+            return
+
+        logger.info(f"Validando o documento pelas primeiras {len(texts)} páginas...")
+        with span("analise"):
+            is_valid, validation_response, tipo_processo, situacao = analyze_document(sample)
+        if not is_valid:
+            logger.warning(f"Documento rejeitado: {validation_response}")
+            yield {"status": rejection_message(validation_response), "success": False, "collection": None}
+            return
+        logger.info(f"Documento validado. Tipo: {tipo_processo}, situação: {situacao}")
+
+        from langchain.schema import Document
+
+        collection = new_document_collection()
+        all_ids, all_documents = [], []
+        indexed = 0
+
+        def index_pending():
+            docs = [
+                Document(page_content=page["text"], metadata={"source": pdf_path, "tipo_processo": tipo_processo, "situacao": situacao, "page": page["page"]})
+                for page in pending if page["text"].strip()
+            ]
+            ids, documents = _add_splits(collection, split_documents(docs)) if docs else ([], [])
+            all_ids.extend(ids)
+            all_documents.extend(documents)
+            pending.clear()
+
+        def progress():
+            unlocked = indexed >= min(INCREMENTAL_UNLOCK_PAGES, page_count)
+            status = f"Páginas indexadas {indexed}/{page_count}"
+            if unlocked:
+                status += " (perguntas liberadas; o restante do documento continua sendo indexado)"
+            return {"status": status, "success": unlocked, "collection": collection if unlocked else None}
+
+        for page in pages:
+            texts.append(page["text"])
+            pending.append(page)
+            if len(pending) >= INCREMENTAL_BATCH_PAGES:
+                indexed += len(pending)
+                index_pending()
+                yield progress()
+        if pending:
+            indexed += len(pending)
+            index_pending()
+
+        if not all_ids:
+            yield {"status": "O documento está fora do contexto esperado!", "success": False, "collection": None}
+            return
+
+        with span("gravacao_vetores"):
+            persist_document(collection)
+        with span("indice_lexico"):
+            build_lexical_index(collection.name, all_ids, all_documents)
+        if cache_key:
+            put_cached_document(cache_key, collection.name, "".join(texts), tipo_processo, situacao)
+        _start_faq_precompute(collection, faq_model, faq_llm_stream)
+
+        logger.info(f"Ingestão incremental concluída: {indexed} páginas, {len(all_ids)} chunks")
+        yield {"status": f"Páginas indexadas {indexed}/{page_count}. Contexto criado com sucesso. Pronto para perguntas!", "success": True, "collection": collection}
+    finally:
+        # Fechar o gerador encerra os processos de OCR se a ingestão for interrompida
+        pages.close()
+
+def _start_faq_precompute(collection, model, llm_stream):
+    if FAQ_PRECOMPUTE and model and llm_stream:
+        start_faq_job(collection, model, llm_stream)
+
 def answer_question(question, collection, model, llm_interface):
     if not collection:
         return "Por favor, processe um documento jurídico válido antes de fazer perguntas."
 
     try:
-        answer = rag_chain(question, model, collection, llm_interface)
+        with trace("pergunta"), span("resposta"):
+            answer = get_cached_answer(collection, model, question)
+            if answer is None:
+                answer = rag_chain(question, model, collection, llm_interface)
+                put_cached_answer(collection, model, question, answer)
         return answer
     except Exception as e:
         logger.error(f"Erro ao processar pergunta: {str(e)}", exc_info=True)
         return f"Ocorreu um erro ao processar a pergunta: {str(e)}"
 
+def answer_question_stream(question, collection, model, llm_stream):
+    """Gera a resposta acumulada a cada novo fragmento recebido do modelo."""
+    if not collection:
+        yield "Por favor, processe um documento jurídico válido antes de fazer perguntas."
+        return
+
+    yield from iter_traced("pergunta", _answer_question_stream(question, collection, model, llm_stream))
+
+def _answer_question_stream(question, collection, model, llm_stream):
+    try:
+        with span("resposta"):
+            cached_answer = get_cached_answer(collection, model, question)
+            if cached_answer is not None:
+                yield cached_answer
+                return
+
+            answer = ""
+            try:
+                for fragment in rag_chain_stream(question, model, collection, llm_stream):
+                    answer += fragment
+                    yield answer
+            except LLMStreamError as e:
+                # Mostra a resposta parcial com o erro, sem guardá-la no cache
+                yield answer + str(e)
+                return
+            put_cached_answer(collection, model, question, answer)
+    except Exception as e:
+        logger.error(f"Erro ao processar pergunta: {str(e)}", exc_info=True)
+        yield f"Ocorreu um erro ao processar a pergunta: {str(e)}"
+
+async def answer_question_stream_async(question, collection, model, llm_stream):
+    """Versão assíncrona de answer_question_stream, com llm_stream assíncrono.
+    Nenhuma thread fica presa enquanto a pergunta espera o Ollama."""
+    if not collection:
+        yield "Por favor, processe um documento jurídico válido antes de fazer perguntas."
+        return
+
+    async for answer in aiter_traced("pergunta", _answer_question_stream_async(question, collection, model, llm_stream)):
+        yield answer
+
+async def _answer_question_stream_async(question, collection, model, llm_stream):
+    try:
+        with span("resposta"):
+            # O embedding da pergunta fica no cache do serviço e é reaproveitado pelo cache de respostas
+            await create_embeddings().embed_query_async(question)
+            cached_answer = await asyncio.to_thread(get_cached_answer, collection, model, question)
+            if cached_answer is not None:
+                yield cached_answer
+                return
+
+            answer = ""
+            try:
+                async for fragment in rag_chain_stream_async(question, model, collection, llm_stream):
+                    answer += fragment
+                    yield answer
+            except LLMStreamError as e:
+                yield answer + str(e)
+                return
+            await asyncio.to_thread(put_cached_answer, collection, model, question, answer)
+    except Exception as e:
+        logger.error(f"Erro ao processar pergunta: {str(e)}", exc_info=True)
+        yield f"Ocorreu um erro ao processar a pergunta: {str(e)}"
+
 def process_faq(collection, model, llm_interface):
     if not collection:
         return "Por favor, processe um documento jurídico válido antes de executar o FAQ."
 
     try:
+        stored_faq = get_stored_faq(collection.name)
+        if stored_faq is not None:
+            return stored_faq
+
         faq = FAQ()
-        faq_results = faq.get_faq_answers(collection, model, llm_interface)
+        with trace("faq"):
+            faq_results = faq.get_faq_answers(collection, model, llm_interface)
         return faq_results['questions_and_answers']
     except Exception as e:
         logger.error(f"Erro ao processar FAQ: {str(e)}", exc_info=True)
-        return f"Ocorreu um erro ao processar o FAQ: {str(e)}"
\ No newline at end of file
+        return f"Ocorreu um erro ao processar o FAQ: {str(e)}"
+
+def process_faq_stream(collection, model, llm_stream):
+    """Gera o resultado parcial do FAQ conforme as respostas chegam."""
+    if not collection:
+        yield "Por favor, processe um documento jurídico válido antes de executar o FAQ."
+        return
+
+    try:
+        # Reaproveita o FAQ gerado em segundo plano, pronto ou em andamento
+        job = get_faq_job(collection.name)
+        if job is not None:
+            logger.info("Acompanhando o FAQ gerado em segundo plano")
+            yield from job.iter_updates()
+            if not job.cancelled:
+                return
+
+        stored_faq = get_stored_faq(collection.name)
+        if stored_faq is not None:
+            yield stored_faq
+            return
+
+        faq = FAQ()
+        for faq_results in iter_traced("faq", faq.stream_faq_answers(collection, model, llm_stream)):
+            yield faq_results['questions_and_answers']
+    except Exception as e:
+        logger.error(f"Erro ao processar FAQ: {str(e)}", exc_info=True)
+        yield f"Ocorreu um erro ao processar o FAQ: {str(e)}"
+
+async def process_faq_stream_async(collection, model, llm_stream):
+    """Versão assíncrona de process_faq_stream, com llm_stream assíncrono."""
+    if not collection:
+        yield "Por favor, processe um documento jurídico válido antes de executar o FAQ."
+        return
+
+    try:
+        job = get_faq_job(collection.name)
+        if job is not None:
+            logger.info("Acompanhando o FAQ gerado em segundo plano")
+            async for update in job.aiter_updates():
+                yield update
+            if not job.cancelled:
+                return
+
+        stored_faq = await asyncio.to_thread(get_stored_faq, collection.name)
+        if stored_faq is not None:
+            yield stored_faq
+            return
+
+        faq = FAQ()
+        async for faq_results in aiter_traced("faq", faq.stream_faq_answers_async(collection, model, llm_stream)):
+            yield faq_results['questions_and_answers']
+    except Exception as e:
+        logger.error(f"Erro ao processar FAQ: {str(e)}", exc_info=True)
+        yield f"Ocorreu um erro ao processar o FAQ: {str(e)}"
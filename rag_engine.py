@@ -1,70 +1,111 @@
+import asyncio
 import numpy as np
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 from config import get_logger
 from embedding_manager import create_embeddings
+from lexical_index import get_lexical_index
+from context_packer import pack_context
+from metrics import span
 
 logger = get_logger(__name__)
 
-def semantic_search(query, documents, top_k=10):
+def semantic_search(query, documents):
+    """Similaridade TF-IDF entre a consulta e cada documento, com um único ajuste do vetorizador."""
+    # Importado no primeiro uso: só as coleções sem índice léxico passam por aqui
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from sklearn.metrics.pairwise import cosine_similarity
+
     vectorizer = TfidfVectorizer().fit([query] + documents)
     doc_vectors = vectorizer.transform(documents)
     query_vector = vectorizer.transform([query])
 
-    similarities = cosine_similarity(query_vector, doc_vectors).flatten()
-    return similarities.argsort()[-top_k:][::-1]
+    return cosine_similarity(query_vector, doc_vectors).flatten()
 
 def dynamic_chunk_selection(question, chunks, initial_k=5, max_k=20, similarity_threshold=0.3):
-    selected_chunks = []
+    # Usado apenas para coleções sem índice léxico pré-calculado
+    if not chunks:
+        return []
+    similarities = semantic_search(question, chunks)
+    ranked = similarities.argsort()[::-1]
     k = initial_k
 
-    while k <= max_k:
-        top_chunk_indices = semantic_search(question, chunks, top_k=k)
-        selected_chunks = [chunks[i] for i in top_chunk_indices]
-        
-        if np.mean([cosine_similarity(TfidfVectorizer().fit_transform([question, chunk])) for chunk in selected_chunks]) >= similarity_threshold:
+    while k < max_k and k < len(chunks):
+        if np.mean(similarities[ranked[:k]]) >= similarity_threshold:
             break
-        
         k += 5
 
-    return selected_chunks
+    return [chunks[i] for i in ranked[:k]]
 
-def rag_chain(question, model, collection, llm_interface):
-    logger.info(f"Processando pergunta: {question} com o modelo: {model}")
-    
-    embedding_function = create_embeddings()
-    query_embedding = embedding_function(question)
-    
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=10
-    )
-    
-    relevant_chunks = dynamic_chunk_selection(question, results['documents'][0])
+def retrieve_context(question, collection, model=None):
+    return context_from_results(question, collection, model, search_chunks(question, collection))
+
+async def retrieve_context_async(question, collection, model=None):
+    """Versão assíncrona de retrieve_context: o embedding da consulta é
+    aguardado no event loop e o acesso à coleção roda em uma thread."""
+    results = await search_chunks_async(question, collection)
+    return await asyncio.to_thread(context_from_results, question, collection, model, results)
+
+def search_chunks(question, collection):
+    """Embedding da pergunta e busca vetorial; devolve o resultado de collection.query."""
+    with span("embedding_consulta"):
+        query_embedding = create_embeddings()(question)
+    return _query(collection, query_embedding)
+
+async def search_chunks_async(question, collection):
+    with span("embedding_consulta"):
+        query_embedding = await create_embeddings().embed_query_async(question)
+    return await asyncio.to_thread(_query, collection, query_embedding)
+
+def _query(collection, query_embedding):
+    with span("busca_vetorial"):
+        return collection.query(
+            query_embeddings=[query_embedding],
+            n_results=10
+        )
+
+def context_from_results(question, collection, model, results):
+    """Seleciona e empacota os chunks de uma busca feita por search_chunks."""
+    with span("selecao_chunks"):
+        lexical_index = get_lexical_index(collection.name)
+        if lexical_index is not None:
+            relevant_chunks = lexical_index.hybrid_search(question, results['ids'][0])
+        else:
+            relevant_chunks = dynamic_chunk_selection(question, results['documents'][0])
     
     logger.info(f"Selecionados {len(relevant_chunks)} chunks relevantes")
     
-    # Limitar o número de chunks para controlar o tamanho do contexto
-    max_chunks = 3  # Ajuste este valor conforme necessário
-    context = "\n\n".join(relevant_chunks[:max_chunks])
-    
-    prompt = f"""Instruções: Responda à pergunta com base APENAS nas informações fornecidas no contexto abaixo. 
-    Se a informação necessária não estiver no contexto, diga que não pode responder com base nas informações disponíveis.
+    # O tamanho do contexto é limitado pelo orçamento de tokens (CONTEXT_TOKEN_BUDGET)
+    with span("montagem_contexto"):
+        return pack_context(relevant_chunks, model)
 
-    Contexto:
-    {context}
+def rag_chain(question, model, collection, llm_interface, context=None):
+    logger.info(f"Processando pergunta ({len(question)} caracteres) com o modelo: {model}")
+    if context is None:
+        with span("recuperacao"):
+            context = retrieve_context(question, collection, model)
 
-    Pergunta: {question}
+    # O template do prompt é aplicado uma única vez, pelo llm_interface
+    with span("geracao", model=model):
+        response = llm_interface(question, context, model)
+    
+    return response
 
-    Instruções adicionais:
-    1. Use APENAS as informações do contexto acima para responder.
-    2. Não use conhecimentos externos ou suposições além do que está no contexto.
-    3. Se o contexto não fornecer informações suficientes, diga isso claramente.
-    4. Estruture sua resposta de forma clara e concisa.
-    5. Se apropriado, cite partes específicas do contexto para apoiar sua resposta.
+def rag_chain_stream(question, model, collection, llm_stream, context=None):
+    """Versão em streaming de rag_chain: gera os fragmentos da resposta conforme chegam."""
+    logger.info(f"Processando pergunta em streaming ({len(question)} caracteres) com o modelo: {model}")
+    if context is None:
+        with span("recuperacao"):
+            context = retrieve_context(question, collection, model)
 
-    Resposta:"""
+    with span("geracao", model=model):
+        yield from llm_stream(question, context, model)
 
-    response = llm_interface(question, prompt, model)
-    
-    return response
\ No newline at end of file
+async def rag_chain_stream_async(question, model, collection, llm_stream, context=None):
+    """Versão assíncrona de rag_chain_stream; llm_stream é um gerador assíncrono."""
+    logger.info(f"Processando pergunta em streaming assíncrono ({len(question)} caracteres) com o modelo: {model}")
+    if context is None:
+        with span("recuperacao"):
+            context = await retrieve_context_async(question, collection, model)
+
+    with span("geracao", model=model):
+        async for fragment in llm_stream(question, context, model):
+            yield fragment
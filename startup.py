@@ -0,0 +1,81 @@
+import time
+import json
+import threading
+from config import VECTOR_BACKEND, get_logger
+
+# Primeiro módulo importado por main.py: os tempos da subida contam a partir daqui
+_start = time.perf_counter()
+
+logger = get_logger(__name__)
+
+_lock = threading.Lock()
+_phases = {}
+_warm_ups = {}
+_first_requests = {}
+
+def elapsed():
+    return time.perf_counter() - _start
+
+def mark(phase):
+    """Registra o tempo desde o início do processo até esta fase."""
+    seconds = elapsed()
+    with _lock:
+        _phases[phase] = round(seconds, 3)
+    from metrics import set_gauge
+    set_gauge("exautos_startup_seconds", round(seconds, 3), help_text="Segundos desde o início do processo até cada fase da subida", fase=phase)
+    logger.info(f"Inicialização: {phase} em {seconds:.2f}s")
+
+def record_first(event, seconds):
+    """Registra a latência da primeira requisição de cada tipo (as seguintes são ignoradas)."""
+    with _lock:
+        if event in _first_requests:
+            return
+        _first_requests[event] = round(seconds, 3)
+    from metrics import set_gauge
+    set_gauge("exautos_first_request_seconds", round(seconds, 3), help_text="Latência da primeira requisição de cada tipo", evento=event)
+    logger.info(f"Primeira requisição '{event}': {seconds:.2f}s ({elapsed():.1f}s após o início do processo)")
+
+def report():
+    with _lock:
+        return {
+            "fases_s": dict(_phases),
+            "aquecimento_s": dict(_warm_ups),
+            "primeiras_requisicoes_s": dict(_first_requests),
+        }
+
+def log_report():
+    logger.info(f"Relatório de inicialização: {json.dumps(report(), ensure_ascii=False)}")
+
+def _warm_up(name, function):
+    start = time.perf_counter()
+    try:
+        function()
+    except Exception as e:
+        logger.warning(f"Não foi possível aquecer {name}: {e}")
+        return
+    with _lock:
+        _warm_ups[name] = round(time.perf_counter() - start, 3)
+    mark(f"{name}_pronto")
+
+def warm_up_in_background(chat_models, embedding_models):
+    """Carrega os modelos no Ollama e abre o cliente Chroma em segundo plano,
+    em paralelo com o restante da subida. Ao terminar, o relatório vai para o log."""
+    import ollama_client
+
+    tasks = [(f"modelo_{model}", lambda model=model: ollama_client.warm_up(model, 'chat')) for model in chat_models]
+    tasks += [(f"modelo_{model}", lambda model=model: ollama_client.warm_up(model, 'embed')) for model in embedding_models]
+    if VECTOR_BACKEND == 'chroma':
+        from chroma_manager import get_chroma_client
+        tasks.append(("chroma", get_chroma_client))
+
+    def run():
+        threads = [threading.Thread(target=_warm_up, args=task, daemon=True) for task in tasks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        log_report()
+
+    thread = threading.Thread(target=run, name="aquecimento", daemon=True)
+    thread.start()
+    return thread